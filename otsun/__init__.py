@@ -5,7 +5,11 @@ from .materials import *
 from .ray import *
 from .source import *
 from .scene import *
+from .accelerators import *
+from .intersectors import *
+from .scene_cache import *
 from .experiments import *
+from .sweeps import *
 from .logging_unit import *
 from .movements import *
 
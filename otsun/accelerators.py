@@ -0,0 +1,695 @@
+"""Module otsun.accelerators for speeding up the search of intersections
+
+The module defines the class `BVH`, a bounding volume hierarchy built over the
+bounding boxes of the faces of a scene, and the class `UniformGrid`, a regular
+grid of voxels traversed with a 3D-DDA. Both are used to find the faces that
+a ray may hit without testing all of them.
+"""
+
+import heapq
+import numpy as np
+
+LEAF_SIZE = 4
+# Maximum number of faces stored in a leaf of the hierarchy
+
+GRID_DENSITY = 2.0
+# Number of cells of a uniform grid per face
+
+MAX_GRID_RESOLUTION = 128
+# Maximum number of cells of a uniform grid along each axis
+
+
+def boundboxes_to_array(boundboxes):
+    """
+    Converts a list of bounding boxes to an array
+
+    Parameters
+    ----------
+    boundboxes : list of Base.BoundBox
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n, 6) where each row is (XMin, YMin, ZMin, XMax, YMax, ZMax)
+    """
+    return np.array([[bb.XMin, bb.YMin, bb.ZMin, bb.XMax, bb.YMax, bb.ZMax]
+                     for bb in boundboxes], dtype=float).reshape(-1, 6)
+
+
+def ray_box_entry(bounds, origin, direction, max_distance):
+    """
+    Computes the distance at which a ray enters a box
+
+    Parameters
+    ----------
+    bounds : tuple of float
+        Box given as (XMin, YMin, ZMin, XMax, YMax, ZMax)
+    origin : tuple of float
+        Origin of the ray
+    direction : tuple of float
+        Direction of the ray
+    max_distance : float
+        Length of the ray
+
+    Returns
+    -------
+    float or None
+        Distance from the origin to the point where the ray enters the box
+        (0 if the origin is inside the box), or None if the ray misses it
+    """
+    t_enter = 0.0
+    t_exit = max_distance
+    for axis in range(3):
+        o = origin[axis]
+        d = direction[axis]
+        low = bounds[axis]
+        high = bounds[axis + 3]
+        if d == 0.0:
+            if o < low or o > high:
+                return None
+            continue
+        t1 = (low - o) / d
+        t2 = (high - o) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > t_enter:
+            t_enter = t1
+        if t2 < t_exit:
+            t_exit = t2
+        if t_enter > t_exit:
+            return None
+    return t_enter
+
+
+def ray_box_entries(bounds, origins, directions, max_distance):
+    """
+    Vectorized version of `ray_box_entry`
+
+    Parameters
+    ----------
+    bounds : np.ndarray
+        Array of shape (n, 6) with one box for each ray
+    origins : np.ndarray
+        Array of shape (n, 3) with the origins of the rays
+    directions : np.ndarray
+        Array of shape (n, 3) with the directions of the rays
+    max_distance : float
+        Length of the rays
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n,) with the distances at which each ray enters its box
+        (np.nan if it misses it)
+    """
+    lows = bounds[:, :3]
+    highs = bounds[:, 3:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (lows - origins) / directions
+        t2 = (highs - origins) / directions
+    parallel = directions == 0.0
+    inside = (origins >= lows) & (origins <= highs)
+    t_low = np.where(parallel, np.where(inside, -np.inf, np.inf), np.fmin(t1, t2))
+    t_high = np.where(parallel, np.where(inside, np.inf, -np.inf), np.fmax(t1, t2))
+    t_enter = np.maximum(t_low.max(axis=1), 0.0)
+    t_exit = np.minimum(t_high.min(axis=1), max_distance)
+    return np.where(t_enter <= t_exit, t_enter, np.nan)
+
+
+class BVH(object):
+    """
+    Bounding volume hierarchy over a collection of axis aligned boxes
+
+    The boxes are recursively split in two halves along the longest axis of
+    their centers, until at most `LEAF_SIZE` boxes remain in each leaf.
+
+    Parameters
+    ----------
+    bounds : np.ndarray
+        Array of shape (n, 6) with the boxes, as given by `boundboxes_to_array`
+    tolerance : float
+        Amount by which each box is enlarged, so that flat faces have non-empty boxes
+    indices : list of int or None
+        Identifiers reported for each box. Defaults to the position of the box
+
+    Attributes
+    ----------
+    node_bounds : list of tuple of float
+        Bounds of each node of the hierarchy (node 0 is the root)
+    node_children : list of tuple of int or None
+        Pair of children of each internal node, or None for leaves
+    node_items : list of tuple of int
+        Positions of the boxes stored in each leaf (empty for internal nodes)
+    """
+
+    def __init__(self, bounds, tolerance=0.0, indices=None):
+        bounds = np.asarray(bounds, dtype=float).reshape(-1, 6)
+        self.bounds = bounds.copy()
+        self.bounds[:, :3] -= tolerance
+        self.bounds[:, 3:] += tolerance
+        if indices is None:
+            indices = range(len(bounds))
+        self.indices = [int(index) for index in indices]
+        self.item_bounds = [tuple(row) for row in self.bounds.tolist()]
+        self.node_bounds = []
+        self.node_children = []
+        self.node_items = []
+        if len(self.bounds):
+            self._build(np.arange(len(self.bounds)))
+        self._build_arrays()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _build(self, positions):
+        """
+        Recursively builds the node holding the boxes at the given positions
+        """
+        node = len(self.node_bounds)
+        boxes = self.bounds[positions]
+        self.node_bounds.append(tuple(np.concatenate([boxes[:, :3].min(axis=0),
+                                                      boxes[:, 3:].max(axis=0)]).tolist()))
+        self.node_children.append(None)
+        self.node_items.append(())
+        if len(positions) <= LEAF_SIZE:
+            self.node_items[node] = tuple(positions.tolist())
+            return node
+        centers = (boxes[:, :3] + boxes[:, 3:]) / 2.0
+        axis = int(np.argmax(centers.max(axis=0) - centers.min(axis=0)))
+        order = np.argsort(centers[:, axis], kind='mergesort')
+        half = len(positions) // 2
+        left = self._build(positions[order[:half]])
+        right = self._build(positions[order[half:]])
+        self.node_children[node] = (left, right)
+        return node
+
+    def _build_arrays(self):
+        """
+        Stores the hierarchy in arrays, for its traversal with many rays at once
+        """
+        self.node_bounds_array = np.array(self.node_bounds, dtype=float).reshape(-1, 6)
+        self.node_children_array = np.array([children or (-1, -1) for children in self.node_children],
+                                            dtype=int).reshape(-1, 2)
+        self.leaf_counts = np.array([len(items) for items in self.node_items], dtype=int)
+        self.leaf_starts = np.concatenate([[0], np.cumsum(self.leaf_counts)[:-1]]).astype(int)
+        self.leaf_positions = np.array([position for items in self.node_items for position in items],
+                                       dtype=int)
+        self.indices_array = np.array(self.indices, dtype=int)
+
+    def candidate_pairs(self, origins, directions, max_distance):
+        """
+        Finds the boxes that each of a collection of rays may hit
+
+        All the rays descend the hierarchy at the same time, one level per step.
+
+        Parameters
+        ----------
+        origins : np.ndarray
+            Array of shape (n, 3) with the origins of the rays
+        directions : np.ndarray
+            Array of shape (n, 3) with the directions of the rays
+        max_distance : float
+            Length of the rays
+
+        Returns
+        -------
+        rays : np.ndarray
+            Index of the ray of each pair
+        items : np.ndarray
+            Identifier of the box of each pair
+        """
+        found_rays = []
+        found_positions = []
+        rays = np.arange(len(origins)) if self.node_bounds else np.zeros(0, dtype=int)
+        nodes = np.zeros(len(rays), dtype=int)
+        while len(rays):
+            entries = ray_box_entries(self.node_bounds_array[nodes], origins[rays],
+                                      directions[rays], max_distance)
+            hit = ~np.isnan(entries)
+            rays = rays[hit]
+            nodes = nodes[hit]
+            leaf = self.node_children_array[nodes, 0] < 0
+            counts = self.leaf_counts[nodes[leaf]]
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            found_rays.append(np.repeat(rays[leaf], counts))
+            found_positions.append(self.leaf_positions[np.repeat(self.leaf_starts[nodes[leaf]], counts) +
+                                                       offsets])
+            internal = ~leaf
+            rays = np.concatenate([rays[internal], rays[internal]])
+            nodes = np.concatenate([self.node_children_array[nodes[internal], 0],
+                                    self.node_children_array[nodes[internal], 1]])
+        rays = np.concatenate(found_rays) if found_rays else np.zeros(0, dtype=int)
+        positions = np.concatenate(found_positions) if found_positions else np.zeros(0, dtype=int)
+        entries = ray_box_entries(self.bounds[positions], origins[rays], directions[rays], max_distance)
+        hit = ~np.isnan(entries)
+        return rays[hit], self.indices_array[positions[hit]]
+
+    def candidates(self, origin, direction, max_distance):
+        """
+        Finds the boxes that a ray may hit, from front to back
+
+        The nodes of the hierarchy are visited ordered by the distance at which
+        the ray enters them, so that nearer boxes are reported first.
+
+        Parameters
+        ----------
+        origin : tuple of float
+            Origin of the ray
+        direction : tuple of float
+            Direction of the ray
+        max_distance : float
+            Length of the ray
+
+        Yields
+        ------
+        int
+            Identifier of a box hit by the ray
+        """
+        if not self.node_bounds:
+            return
+        entry = ray_box_entry(self.node_bounds[0], origin, direction, max_distance)
+        if entry is None:
+            return
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            children = self.node_children[node]
+            if children is None:
+                for position in self.node_items[node]:
+                    if ray_box_entry(self.item_bounds[position], origin,
+                                     direction, max_distance) is not None:
+                        yield self.indices[position]
+                continue
+            hits = []
+            for child in children:
+                entry = ray_box_entry(self.node_bounds[child], origin, direction, max_distance)
+                if entry is not None:
+                    hits.append((entry, child))
+            # the nearest child is pushed last, so that it is visited first
+            hits.sort(reverse=True)
+            stack.extend(child for (_, child) in hits)
+
+    def closest(self, origin, direction, max_distance, hit):
+        """
+        Finds the nearest box hit by a ray, according to a given distance function
+
+        The nodes and boxes are visited ordered by the distance at which the ray enters
+        them, and the traversal stops when this distance is beyond the nearest hit found.
+        This is correct as long as the distance of a hit in a box is never smaller than
+        the distance at which the ray enters the box.
+
+        Parameters
+        ----------
+        origin : tuple of float
+            Origin of the ray
+        direction : tuple of float
+            Direction of the ray
+        max_distance : float
+            Length of the ray
+        hit : callable
+            Function hit(identifier, max_distance) that returns the distance to the hit of
+            the ray in the box with the given identifier, or np.inf if there is none nearer
+            than max_distance
+
+        Returns
+        -------
+        distance : float
+            Distance to the nearest hit (np.inf if there is none)
+        identifier : int or None
+            Identifier of the box with the nearest hit (None if there is none)
+        """
+        best_distance = np.inf
+        best_item = None
+        if not self.node_bounds:
+            return best_distance, best_item
+        entry = ray_box_entry(self.node_bounds[0], origin, direction, max_distance)
+        if entry is None:
+            return best_distance, best_item
+        # heap of (entry distance, is box, node or box position)
+        heap = [(entry, False, 0)]
+        while heap:
+            entry, is_item, element = heapq.heappop(heap)
+            if entry > best_distance:
+                break
+            limit = min(max_distance, best_distance)
+            if is_item:
+                distance = hit(self.indices[element], limit)
+                if distance < best_distance:
+                    best_distance = distance
+                    best_item = self.indices[element]
+                continue
+            children = self.node_children[element]
+            if children is None:
+                for position in self.node_items[element]:
+                    entry = ray_box_entry(self.item_bounds[position], origin, direction, limit)
+                    if entry is not None:
+                        heapq.heappush(heap, (entry, True, position))
+                continue
+            for child in children:
+                entry = ray_box_entry(self.node_bounds[child], origin, direction, limit)
+                if entry is not None:
+                    heapq.heappush(heap, (entry, False, child))
+        return best_distance, best_item
+
+
+class UniformGrid(object):
+    """
+    Uniform grid of cells over a collection of axis aligned boxes
+
+    The bounding box of all the boxes is divided in cells of equal size (about
+    `GRID_DENSITY` cells per box), and each box is stored in all the cells it meets.
+    The number of cells along each axis is the extent of the grid along it divided by
+    the side of a cube of the desired volume, rounded and clamped between 1 and
+    `MAX_GRID_RESOLUTION`, so the cells are only roughly cubes, and there are fewer of
+    them than wanted if the clamp applies. Axes along which the grid is flat have one cell.
+    Rays walk the cells they cross in order (3D-DDA), so that nearer boxes are
+    reported first. It has the same interface as `BVH`.
+
+    Parameters
+    ----------
+    bounds : np.ndarray
+        Array of shape (n, 6) with the boxes, as given by `boundboxes_to_array`
+    tolerance : float
+        Amount by which each box is enlarged, so that flat faces have non-empty boxes
+    indices : list of int or None
+        Identifiers reported for each box. Defaults to the position of the box
+
+    Attributes
+    ----------
+    grid_bounds : tuple of float
+        Bounds of the region covered by the grid
+    resolution : np.ndarray
+        Number of cells along each axis, between 1 and `MAX_GRID_RESOLUTION`
+    cell_size : np.ndarray
+        Size of the cells along each axis (the extent of the grid divided by the resolution)
+    cell_starts : np.ndarray
+        Position in `cell_positions` of the first box of each cell
+    cell_positions : np.ndarray
+        Positions of the boxes stored in the cells, cell after cell
+    """
+
+    def __init__(self, bounds, tolerance=0.0, indices=None):
+        bounds = np.asarray(bounds, dtype=float).reshape(-1, 6)
+        self.bounds = bounds.copy()
+        self.bounds[:, :3] -= tolerance
+        self.bounds[:, 3:] += tolerance
+        if indices is None:
+            indices = range(len(bounds))
+        self.indices = [int(index) for index in indices]
+        self.indices_array = np.array(self.indices, dtype=int)
+        self.item_bounds = [tuple(row) for row in self.bounds.tolist()]
+        if len(self.bounds):
+            low = self.bounds[:, :3].min(axis=0)
+            high = self.bounds[:, 3:].max(axis=0)
+        else:
+            low = np.zeros(3)
+            high = np.zeros(3)
+        extent = np.maximum(high - low, 1E-12)
+        high = low + extent
+        self.grid_bounds = tuple(np.concatenate([low, high]).tolist())
+        # cells as close to cubes as possible, given the number of cells
+        relevant = extent > extent.max() * 1E-6
+        volume = np.prod(extent[relevant])
+        side = (volume / max(GRID_DENSITY * len(self.bounds), 1.0)) ** (1.0 / relevant.sum())
+        # rounding (instead of taking ceilings) keeps the number of cells close to the desired one
+        cells_along = np.clip(np.round(extent / side), 1, MAX_GRID_RESOLUTION)
+        self.resolution = np.where(relevant, cells_along, 1).astype(int)
+        self.cell_size = extent / self.resolution
+        self._build_cells()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def cell_of_points(self, points):
+        """
+        Computes the (integer) coordinates of the cells that contain some points
+
+        Points outside the grid are assigned to the nearest cell.
+        """
+        low = np.array(self.grid_bounds[:3])
+        cells = np.floor((points - low) / self.cell_size).astype(int)
+        return np.clip(cells, 0, self.resolution - 1)
+
+    def cell_number(self, cells):
+        """
+        Computes the position in the grid of cells given by their coordinates
+        """
+        return (cells[..., 0] * self.resolution[1] + cells[..., 1]) * self.resolution[2] + cells[..., 2]
+
+    def _build_cells(self):
+        """
+        Stores each box in the cells it meets
+        """
+        first = self.cell_of_points(self.bounds[:, :3])
+        last = self.cell_of_points(self.bounds[:, 3:])
+        cells = []
+        positions = []
+        for position in range(len(self.bounds)):
+            ranges = [np.arange(first[position, axis], last[position, axis] + 1) for axis in range(3)]
+            grid = np.stack(np.meshgrid(*ranges, indexing='ij'), axis=-1).reshape(-1, 3)
+            cells.append(self.cell_number(grid))
+            positions.append(np.full(len(grid), position, dtype=int))
+        cells = np.concatenate(cells) if cells else np.zeros(0, dtype=int)
+        positions = np.concatenate(positions) if positions else np.zeros(0, dtype=int)
+        order = np.argsort(cells, kind='mergesort')
+        self.cell_positions = positions[order]
+        counts = np.bincount(cells, minlength=int(np.prod(self.resolution)))
+        self.cell_starts = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+
+    def _start_walk(self, origins, directions, max_distance):
+        """
+        Computes the initial state of the 3D-DDA of some rays
+
+        Returns
+        -------
+        rays : np.ndarray
+            Indices of the rays that meet the grid
+        cells : np.ndarray
+            Coordinates of the first cell crossed by each of these rays
+        steps : np.ndarray
+            Increment of the cell coordinates when crossing a boundary along each axis
+        t_max : np.ndarray
+            Distance at which each ray crosses the next boundary along each axis
+        t_delta : np.ndarray
+            Distance between consecutive boundaries along each axis
+        t_exit : np.ndarray
+            Distance at which each ray leaves the grid
+        """
+        grid = np.tile(np.array(self.grid_bounds), (len(origins), 1))
+        entries = ray_box_entries(grid, origins, directions, max_distance)
+        rays = np.flatnonzero(~np.isnan(entries))
+        origins = origins[rays]
+        directions = directions[rays]
+        entries = entries[rays]
+        cells = self.cell_of_points(origins + directions * entries[:, None])
+        low = np.array(self.grid_bounds[:3])
+        steps = np.where(directions > 0, 1, -1)
+        boundaries = low + (cells + (steps > 0)) * self.cell_size
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_max = np.where(directions != 0.0, (boundaries - origins) / directions, np.inf)
+            t_delta = np.where(directions != 0.0, self.cell_size / np.abs(directions), np.inf)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_high = np.where(directions > 0, (grid[rays, 3:] - origins) / directions,
+                              np.where(directions < 0, (grid[rays, :3] - origins) / directions, np.inf))
+        t_exit = np.minimum(t_high.min(axis=1), max_distance)
+        return rays, cells, steps, t_max, t_delta, t_exit
+
+    def candidate_pairs(self, origins, directions, max_distance):
+        """
+        Finds the boxes that each of a collection of rays may hit
+
+        All the rays walk the grid at the same time, one cell per step.
+
+        Parameters
+        ----------
+        origins : np.ndarray
+            Array of shape (n, 3) with the origins of the rays
+        directions : np.ndarray
+            Array of shape (n, 3) with the directions of the rays
+        max_distance : float
+            Length of the rays
+
+        Returns
+        -------
+        rays : np.ndarray
+            Index of the ray of each pair
+        items : np.ndarray
+            Identifier of the box of each pair
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        if not len(self.bounds):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        rays, cells, steps, t_max, t_delta, t_exit = self._start_walk(origins, directions, max_distance)
+        found_rays = []
+        found_positions = []
+        while len(rays):
+            numbers = self.cell_number(cells)
+            starts = self.cell_starts[numbers]
+            counts = self.cell_starts[numbers + 1] - starts
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            found_rays.append(np.repeat(rays, counts))
+            found_positions.append(self.cell_positions[np.repeat(starts, counts) + offsets])
+            axes = np.argmin(t_max, axis=1)
+            selection = np.arange(len(rays))
+            crossed = t_max[selection, axes]
+            cells[selection, axes] += steps[selection, axes]
+            t_max[selection, axes] += t_delta[selection, axes]
+            inside = ((crossed <= t_exit) & (cells[selection, axes] >= 0) &
+                      (cells[selection, axes] < self.resolution[axes]))
+            rays = rays[inside]
+            cells = cells[inside]
+            steps = steps[inside]
+            t_max = t_max[inside]
+            t_delta = t_delta[inside]
+            t_exit = t_exit[inside]
+        rays = np.concatenate(found_rays) if found_rays else np.zeros(0, dtype=int)
+        positions = np.concatenate(found_positions) if found_positions else np.zeros(0, dtype=int)
+        pairs = np.unique(rays * len(self.bounds) + positions)
+        rays = pairs // len(self.bounds)
+        positions = pairs % len(self.bounds)
+        entries = ray_box_entries(self.bounds[positions], origins[rays], directions[rays], max_distance)
+        hit = ~np.isnan(entries)
+        return rays[hit], self.indices_array[positions[hit]]
+
+    def candidates(self, origin, direction, max_distance):
+        """
+        Finds the boxes that a ray may hit, from front to back
+
+        Parameters
+        ----------
+        origin : tuple of float
+            Origin of the ray
+        direction : tuple of float
+            Direction of the ray
+        max_distance : float
+            Length of the ray
+
+        Yields
+        ------
+        int
+            Identifier of a box hit by the ray
+        """
+        if not len(self.bounds):
+            return
+        rays, cells, steps, t_max, t_delta, t_exit = self._start_walk(
+            np.array([origin], dtype=float), np.array([direction], dtype=float), max_distance)
+        if not len(rays):
+            return
+        cell = cells[0].tolist()
+        step = steps[0].tolist()
+        t_max = t_max[0].tolist()
+        t_delta = t_delta[0].tolist()
+        t_exit = t_exit[0]
+        resolution = self.resolution.tolist()
+        seen = set()
+        while True:
+            number = (cell[0] * resolution[1] + cell[1]) * resolution[2] + cell[2]
+            for position in self.cell_positions[self.cell_starts[number]:self.cell_starts[number + 1]]:
+                if position in seen:
+                    continue
+                seen.add(position)
+                if ray_box_entry(self.item_bounds[position], origin, direction, max_distance) is not None:
+                    yield self.indices[position]
+            axis = t_max.index(min(t_max))
+            if t_max[axis] > t_exit:
+                return
+            cell[axis] += step[axis]
+            if not 0 <= cell[axis] < resolution[axis]:
+                return
+            t_max[axis] += t_delta[axis]
+
+    def closest(self, origin, direction, max_distance, hit):
+        """
+        Finds the nearest box hit by a ray, according to a given distance function
+
+        The cells are walked in order, and the boxes of each cell are visited ordered by
+        the distance at which the ray enters them. The walk stops when the ray enters
+        a cell beyond the nearest hit found. See `BVH.closest`.
+
+        Parameters
+        ----------
+        origin : tuple of float
+            Origin of the ray
+        direction : tuple of float
+            Direction of the ray
+        max_distance : float
+            Length of the ray
+        hit : callable
+            Function hit(identifier, max_distance) that returns the distance to the hit of
+            the ray in the box with the given identifier, or np.inf if there is none nearer
+            than max_distance
+
+        Returns
+        -------
+        distance : float
+            Distance to the nearest hit (np.inf if there is none)
+        identifier : int or None
+            Identifier of the box with the nearest hit (None if there is none)
+        """
+        best_distance = np.inf
+        best_item = None
+        if not len(self.bounds):
+            return best_distance, best_item
+        rays, cells, steps, t_max, t_delta, t_exit = self._start_walk(
+            np.array([origin], dtype=float), np.array([direction], dtype=float), max_distance)
+        if not len(rays):
+            return best_distance, best_item
+        cell = cells[0].tolist()
+        step = steps[0].tolist()
+        t_max = t_max[0].tolist()
+        t_delta = t_delta[0].tolist()
+        t_exit = t_exit[0]
+        resolution = self.resolution.tolist()
+        seen = set()
+        while True:
+            number = (cell[0] * resolution[1] + cell[1]) * resolution[2] + cell[2]
+            entries = []
+            for position in self.cell_positions[self.cell_starts[number]:self.cell_starts[number + 1]]:
+                if position in seen:
+                    continue
+                seen.add(position)
+                entry = ray_box_entry(self.item_bounds[position], origin, direction,
+                                      min(max_distance, best_distance))
+                if entry is not None:
+                    entries.append((entry, position))
+            for entry, position in sorted(entries):
+                if entry > best_distance:
+                    break
+                distance = hit(self.indices[position], min(max_distance, best_distance))
+                if distance < best_distance:
+                    best_distance = distance
+                    best_item = self.indices[position]
+            axis = t_max.index(min(t_max))
+            if t_max[axis] > min(t_exit, best_distance):
+                return best_distance, best_item
+            cell[axis] += step[axis]
+            if not 0 <= cell[axis] < resolution[axis]:
+                return best_distance, best_item
+            t_max[axis] += t_delta[axis]
+
+
+def make_accelerator(kind, bounds, tolerance=0.0, indices=None):
+    """
+    Builds an accelerator of the given kind
+
+    Parameters
+    ----------
+    kind : str
+        'bvh' for a `BVH` or 'grid' for a `UniformGrid`
+    bounds : np.ndarray
+        Array of shape (n, 6) with the boxes, as given by `boundboxes_to_array`
+    tolerance : float
+        Amount by which each box is enlarged
+    indices : list of int or None
+        Identifiers reported for each box
+
+    Returns
+    -------
+    BVH or UniformGrid
+    """
+    if kind == 'bvh':
+        return BVH(bounds, tolerance, indices)
+    if kind == 'grid':
+        return UniformGrid(bounds, tolerance, indices)
+    raise ValueError(f"Unknown accelerator {kind}")
@@ -4,7 +4,156 @@ The module defines a class `Experiment` that deals with the setup and
 run of experiments.
 """
 
+import multiprocessing
+import os
+import random
+import time
 import numpy as np
+from scipy.stats import norm
+from .ray import Wavefront, TRACE_FULL
+from .materials import PVMaterial
+from .math import random_stream
+from .logging_unit import logger
+
+RAY_RESULT_DTYPE = np.dtype([('wavelength', float), ('Th_energy', float), ('PV_energy', float),
+                             ('Th_absorbed', bool), ('PV_absorbed', bool)])
+# Fields stored for each emitted ray
+
+POINT_ABSORBER_TH_DTYPE = np.dtype([('energy', float),
+                                    ('x', float), ('y', float), ('z', float),
+                                    ('previous_x', float), ('previous_y', float), ('previous_z', float),
+                                    ('normal_x', float), ('normal_y', float), ('normal_z', float)])
+# Fields stored for each ray absorbed in a thermal absorber
+
+PV_VALUE_DTYPE = np.dtype([('previous_x', float), ('previous_y', float), ('previous_z', float),
+                           ('x', float), ('y', float), ('z', float),
+                           ('energy_before', float), ('energy_after', float), ('wavelength', float),
+                           ('alpha', float), ('angle_incident', float), ('material', np.int32)])
+# Fields stored for each absorption in a PV, as given by `PVMaterial.get_PV_data`,
+# with the material given by its index in `Experiment.PV_materials`
+
+
+class ResultBuffer:
+    """
+    Structured array where rows are appended, which grows by chunks when it is full
+
+    Parameters
+    ----------
+    dtype : np.dtype
+        Type of the rows
+    capacity : int
+        Number of rows allocated in advance
+
+    Attributes
+    ----------
+    size : int
+        Number of rows appended so far
+    """
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.zeros(max(capacity, 1), dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, row):
+        """
+        Appends a row, given as a tuple with a value for each field
+        """
+        if self.size == len(self.data):
+            self.data = np.concatenate([self.data, np.zeros(len(self.data), dtype=self.data.dtype)])
+        self.data[self.size] = row
+        self.size += 1
+
+    def extend(self, rows):
+        """
+        Appends the rows of a structured array with the same type
+        """
+        capacity = len(self.data)
+        while self.size + len(rows) > capacity:
+            capacity *= 2
+        if capacity > len(self.data):
+            self.data = np.concatenate([self.data, np.zeros(capacity - len(self.data), dtype=self.data.dtype)])
+        self.data[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+    def view(self):
+        """
+        Returns a view of the rows appended so far (without copying them)
+        """
+        return self.data[:self.size]
+
+
+class ExperimentStats:
+    """
+    Throughput counters of an experiment
+
+    The times spent in each part of the tracing are summed over all the rays, also when
+    they are traced in several processes, so that their sum can be greater than `elapsed`.
+
+    Attributes
+    ----------
+    rays : int
+        Number of rays traced
+    hops : int
+        Total number of hops of the rays
+    hop_histogram : np.ndarray
+        Number of rays that made each number of hops
+    max_hops_reached : int
+        Number of rays that were stopped after the maximum number of hops
+    elapsed : float
+        Time (in seconds) spent running the experiment
+    time_intersection : float
+        Time (in seconds) spent finding intersections of rays with the scene
+    time_state_change : float
+        Time (in seconds) spent computing optical states of rays after hitting faces
+    time_energy_update : float
+        Time (in seconds) spent computing the attenuation of energies of rays
+    """
+
+    def __init__(self):
+        self.rays = 0
+        self.hops = 0
+        self.hop_histogram = np.zeros(0, dtype=int)
+        self.max_hops_reached = 0
+        self.elapsed = 0.0
+        self.time_intersection = 0.0
+        self.time_state_change = 0.0
+        self.time_energy_update = 0.0
+
+    def __str__(self):
+        return ("%s rays, %s hops in %.3f s (%.1f rays/s, %.1f hops/s), %s rays reached max_hops. "
+                "Time in intersection: %.3f s, state change: %.3f s, energy update: %.3f s" % (
+                    self.rays, self.hops, self.elapsed, self.rays_per_second, self.hops_per_second,
+                    self.max_hops_reached, self.time_intersection, self.time_state_change,
+                    self.time_energy_update))
+
+    @property
+    def rays_per_second(self):
+        """Number of rays traced per second of run"""
+        return self.rays / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def hops_per_second(self):
+        """Number of hops made per second of run"""
+        return self.hops / self.elapsed if self.elapsed else 0.0
+
+    def add_ray(self, hops, max_hops_reached, time_intersection, time_state_change, time_energy_update):
+        """
+        Adds the counters of a traced ray, as given in its summary by `ray_record`
+        """
+        self.rays += 1
+        self.hops += hops
+        if hops >= len(self.hop_histogram):
+            self.hop_histogram = np.concatenate([self.hop_histogram,
+                                                 np.zeros(hops + 1 - len(self.hop_histogram), dtype=int)])
+        self.hop_histogram[hops] += 1
+        self.max_hops_reached += int(max_hops_reached)
+        self.time_intersection += time_intersection
+        self.time_state_change += time_state_change
+        self.time_energy_update += time_energy_update
+
 
 class Experiment:
     """
@@ -21,79 +170,719 @@ class Experiment:
     light_source : otsun.LightSource
         Source of the rays to emit
     number_of_rays : int
-        Number of rays to emit in the experiment
+        Number of rays to emit in the experiment (the maximum number, if target_error is given)
     show_in_doc : App.Document
         FreeCAD document where to plot the rays, or None if plotting is not desired
+    seed : int or None
+        If given, each ray draws its random numbers from its own stream, determined by the seed
+        and the index of the ray (see `otsun.math.random_stream`), so that the results do not
+        depend on how the rays are traced. Otherwise the global random generators are used
+    trace : str
+        Level of the history kept by each ray while it is traced (see `otsun.Ray`). With
+        `TRACE_LAST_HOP` or `TRACE_NONE` the results are the same, but only the last hop
+        of the rays can be plotted
+    target_error : float or None
+        If given, the rays are emitted in blocks until the relative standard errors of the
+        captured energies of target_kinds are at most this value, or number_of_rays
+        rays have been emitted. Then number_of_rays is set to the number of rays emitted
+    target_kinds : tuple of str or None
+        Kinds of captured energy ('Th', 'PV') whose errors must meet target_error. If None,
+        the kinds that the materials of the scene can capture are taken (see `capturable_kinds`),
+        so that a Th-only or PV-only scene is not kept running until number_of_rays by the
+        other kind. If no kind is taken, all the rays are emitted
+    min_hits : int
+        Minimum number of rays that must have captured energy of each of the target_kinds
+        before their errors are trusted, so that runs where hits are rare do not stop early
+    block_size : int
+        Number of rays of each block, if target_error or checkpoint_file are given
+    checkpoint_file : str or None
+        If given, the rays are emitted in blocks, and the results and the state of the random
+        generators are saved to this `.npz` file after them (see `save_checkpoint`), so that
+        the run can be continued with `resume` if it is interrupted
+    checkpoint_rays : int or None
+        If given, the checkpoint is only saved after a block if this number of rays have
+        been emitted since it was last saved, or checkpoint_seconds have passed
+    checkpoint_seconds : float or None
+        If given, the checkpoint is only saved after a block if this number of seconds have
+        passed since it was last saved, or checkpoint_rays have been emitted
 
     Attributes
     ----------
-    wavelengths: List of float
-        List of wavelengths of emitted rays
     captured_energy_Th : float
         Total energy of rays that got absorbed
     captured_energy_PV : float
         Total energy of rays that fell in a PV
-    Th_energy :
-    Th_wavelength : List of float
-        List of wavelengths of rays that got absorbed
-    PV_energy : List of floats
-        List of energies of rays that fell in a PV
-    PV_wavelength : List of float
-        List of wavelengths of rays that fell in a PV
-    PV_values : List of tuples of floats
-        List of PV_values of all emitted rays that fell in a PV
-    points_absorber_Th : List of tuple of floats
-        List with data (energy, location,...) for each ray that got absorbed
-    """
-
-    def __init__(self, scene, light_source, number_of_rays, show_in_doc=None):
+    sum_squares_Th : float
+        Sum of the squares of the energies of rays that got absorbed
+    sum_squares_PV : float
+        Sum of the squares of the energies of rays that fell in a PV
+    max_rays : int
+        Maximum number of rays to emit
+    ray_results : np.ndarray
+        Structured array (see `RAY_RESULT_DTYPE`) with a row for each emitted ray
+    points_absorber_Th_array : np.ndarray
+        Structured array (see `POINT_ABSORBER_TH_DTYPE`) with a row for each ray that got absorbed
+    PV_values_array : np.ndarray
+        Structured array (see `PV_VALUE_DTYPE`) with a row for each absorption in a PV
+    PV_materials : list of str
+        Names of the PV materials referred to by `PV_values_array`
+    stats : ExperimentStats
+        Throughput counters of the rays traced
+
+    The lists `wavelengths`, `Th_energy`, `Th_wavelength`, `PV_energy`, `PV_wavelength`,
+    `PV_values` and `points_absorber_Th` of previous versions are still available,
+    built from the arrays when they are accessed.
+    """
+
+    def __init__(self, scene, light_source, number_of_rays, show_in_doc=None, seed=None, trace=TRACE_FULL,
+                 target_error=None, target_kinds=None, min_hits=30, block_size=1000,
+                 checkpoint_file=None, checkpoint_rays=None, checkpoint_seconds=None):
         self.scene = scene
+        self.seed = seed
+        self.trace = trace
+        self.target_error = target_error
+        if target_kinds is None:
+            target_kinds = capturable_kinds(scene)
+        self.target_kinds = tuple(target_kinds)
+        if target_error is not None and not self.target_kinds:
+            logger.warning("No kind of captured energy to meet the target error: all the rays will be emitted")
+        self.min_hits = min_hits
+        self.block_size = block_size
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_rays = checkpoint_rays
+        self.checkpoint_seconds = checkpoint_seconds
+        self._last_checkpoint = (0, time.time())
         self.light_source = light_source
         if show_in_doc:
             self.light_source.emitting_region.add_to_document(show_in_doc)
         self.number_of_rays = number_of_rays
-        self.wavelengths = []
+        self.max_rays = number_of_rays
         self.captured_energy_Th = 0
         self.captured_energy_PV = 0
-        self.Th_energy = []
-        self.Th_wavelength = []
-        self.PV_energy = []
-        self.PV_wavelength = []
-        self.PV_values = []
-        self.points_absorber_Th = []
-
-    def run(self, show_in_doc=None):
-        """Runs the experiment and plots the rays in the document specified (if any)"""
-        for _ in np.arange(0, self.number_of_rays, 1):
-            ray = self.light_source.emit_ray()
-            ray.run()
-            self.wavelengths.append(ray.wavelength)
-            if show_in_doc:
-                ray.add_to_document(show_in_doc)
-            if ray.Th_absorbed:
-                self.captured_energy_Th += ray.energy
-                self.Th_energy.append(ray.energy)
-                self.Th_wavelength.append(ray.wavelength)
-                self.points_absorber_Th.append((ray.energy,
-                                                ray.points[-1].x, ray.points[-1].y, ray.points[-1].z,
-                                                ray.points[-2].x, ray.points[-2].y, ray.points[-2].z,
-                                                ray.last_normal.x, ray.last_normal.y, ray.last_normal.z))
-            else:
-                self.Th_energy.append(0.0)
-                # TODO: Review... ray.wavelength always added to Th_wavelength
-                # Hence always Th_wavelength == wavelenghts
-                self.Th_wavelength.append(ray.wavelength)
-            if ray.PV_absorbed:
-                PV_energy_absorbed = np.sum(ray.PV_absorbed)
-                self.captured_energy_PV += PV_energy_absorbed
-                self.PV_energy.append(PV_energy_absorbed)
-                self.PV_wavelength.append(ray.wavelength)
-                length = len(ray.PV_values)
-                if length > 0:
-                    for z in np.arange(0, length, 1):
-                        # TODO: Review... no ho entenc (pq no afegir directament tot?) Ramon please check
-                        self.PV_values.append(ray.PV_values[z])
-            else:
-                self.PV_energy.append(0.0)
-                # TODO: Review... ray.wavelength always added to PV_wavelength
-                self.PV_wavelength.append(ray.wavelength)
+        self.sum_squares_Th = 0
+        self.sum_squares_PV = 0
+        self._ray_results = ResultBuffer(RAY_RESULT_DTYPE, number_of_rays)
+        self._points_absorber_Th = ResultBuffer(POINT_ABSORBER_TH_DTYPE)
+        self._PV_values = ResultBuffer(PV_VALUE_DTYPE)
+        self.PV_materials = []
+        self.stats = ExperimentStats()
+
+    @property
+    def rays_emitted(self):
+        """Number of rays whose results are stored"""
+        return len(self._ray_results)
+
+    @property
+    def ray_results(self):
+        """Structured array with a row for each emitted ray"""
+        return self._ray_results.view()
+
+    @property
+    def points_absorber_Th_array(self):
+        """Structured array with a row for each ray that got absorbed"""
+        return self._points_absorber_Th.view()
+
+    @property
+    def PV_values_array(self):
+        """Structured array with a row for each absorption in a PV"""
+        return self._PV_values.view()
+
+    @property
+    def wavelengths(self):
+        """List of wavelengths of emitted rays"""
+        return self.ray_results['wavelength'].tolist()
+
+    @property
+    def Th_energy(self):
+        """List of energies absorbed in a thermal absorber by each emitted ray (0 if not absorbed)"""
+        return self.ray_results['Th_energy'].tolist()
+
+    @property
+    def Th_wavelength(self):
+        """List of wavelengths of emitted rays (the same as `wavelengths`)"""
+        return self.wavelengths
+
+    @property
+    def PV_energy(self):
+        """List of energies absorbed in a PV by each emitted ray (0 if not absorbed)"""
+        return self.ray_results['PV_energy'].tolist()
+
+    @property
+    def PV_wavelength(self):
+        """List of wavelengths of emitted rays (the same as `wavelengths`)"""
+        return self.wavelengths
+
+    @property
+    def PV_values(self):
+        """List of PV_values of all emitted rays that fell in a PV"""
+        return [row[:-1] + (self.PV_materials[row[-1]],) for row in self.PV_values_array.tolist()]
+
+    @property
+    def points_absorber_Th(self):
+        """List with data (energy, location,...) for each ray that got absorbed"""
+        return self.points_absorber_Th_array.tolist()
+
+    def run(self, show_in_doc=None, wavefront_size=None, workers=None):
+        """
+        Runs the experiment and plots the rays in the document specified (if any)
+
+        Parameters
+        ----------
+        show_in_doc : App.Document
+            FreeCAD document where to plot the rays, or None if plotting is not desired
+        wavefront_size : int or None
+            If given, the rays are emitted in groups of this size, and each group is
+            traced as a `Wavefront`. Otherwise the rays are traced one by one
+        workers : int or None
+            If greater than 1, the rays are split among this number of processes (see `run_in_workers`).
+            Where processes cannot be forked (as on Windows), the rays are traced in the current process
+        """
+        workers = usable_workers(workers)
+        if workers is not None and show_in_doc:
+            raise ValueError("Rays cannot be plotted when the experiment runs in several processes")
+        if self.target_error is None and self.checkpoint_file is None:
+            self.run_block(self.number_of_rays, 0, show_in_doc, wavefront_size, workers)
+            logger.info(f"Experiment done: {self.stats}")
+            return
+        self._last_checkpoint = (self.rays_emitted, time.time())
+        while self.rays_emitted < self.max_rays and not self.converged():
+            size = min(self.block_size, self.max_rays - self.rays_emitted)
+            self.run_block(size, self.rays_emitted, show_in_doc, wavefront_size, workers)
+            if self.target_error is not None:
+                errors = {kind: (self.hits(kind), self.relative_standard_error(kind)) for kind in self.target_kinds}
+                logger.info(f"{self.rays_emitted} rays emitted, hits and relative standard errors: {errors}")
+            if self.checkpoint_file and self.checkpoint_due():
+                self.save_checkpoint()
+        if self.target_error is not None:
+            self.number_of_rays = self.rays_emitted
+        if self.checkpoint_file:
+            self.save_checkpoint()
+        logger.info(f"Experiment done: {self.stats}")
+
+    def resume(self, path, show_in_doc=None, wavefront_size=None, workers=None):
+        """
+        Continues a run that was interrupted, from the checkpoint saved in a file
+
+        The experiment must be set up as the one that saved the checkpoint (with the same
+        scene, light source, number of rays and seed). If the experiment has no seed, the
+        global random generators are restored too, so that the rays emitted are the same
+        as if the run had not been interrupted.
+
+        Parameters
+        ----------
+        path : str
+            Name of the checkpoint file, that will keep being updated
+        show_in_doc, wavefront_size, workers
+            As in `run`
+        """
+        self.load_checkpoint(path)
+        self.checkpoint_file = path
+        logger.info(f"Resuming experiment from {path} after {self.rays_emitted} rays")
+        self.run(show_in_doc, wavefront_size, workers)
+
+    def converged(self):
+        """
+        Tells whether the captured energies are estimated with the target error
+
+        It is False if there is no target error, or no target kind of captured energy.
+        """
+        if self.target_error is None or not self.target_kinds:
+            return False
+        return all(self.hits(kind) >= self.min_hits and self.relative_standard_error(kind) <= self.target_error
+                   for kind in self.target_kinds)
+
+    def checkpoint_due(self):
+        """
+        Tells whether the checkpoint has to be saved, according to checkpoint_rays and checkpoint_seconds
+        """
+        if self.checkpoint_rays is None and self.checkpoint_seconds is None:
+            return True
+        rays, seconds = self._last_checkpoint
+        if self.checkpoint_rays is not None and self.rays_emitted - rays >= self.checkpoint_rays:
+            return True
+        if self.checkpoint_seconds is not None and time.time() - seconds >= self.checkpoint_seconds:
+            return True
+        return False
+
+    def save_checkpoint(self, path=None):
+        """
+        Saves the results and stats of the rays emitted so far and the state of the random generators
+
+        The file is written to a temporary file that then replaces the previous one,
+        so that an interruption while saving does not spoil the previous checkpoint.
+
+        Parameters
+        ----------
+        path : str or None
+            Name of the `.npz` file (checkpoint_file if None)
+        """
+        if path is None:
+            path = self.checkpoint_file
+        _, numpy_keys, numpy_position, numpy_has_gauss, numpy_gauss = np.random.get_state()
+        python_version, python_state, python_gauss = random.getstate()
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(
+                f,
+                seed=np.array(-1 if self.seed is None else self.seed),
+                max_rays=np.array(self.max_rays),
+                ray_results=self.ray_results,
+                points_absorber_Th=self.points_absorber_Th_array,
+                PV_values=self.PV_values_array,
+                PV_materials=np.array(self.PV_materials, dtype=str),
+                energy_sums=np.array([self.captured_energy_Th, self.captured_energy_PV,
+                                      self.sum_squares_Th, self.sum_squares_PV]),
+                numpy_keys=numpy_keys,
+                numpy_state=np.array([numpy_position, numpy_has_gauss]),
+                numpy_gauss=np.array(numpy_gauss),
+                python_version=np.array(python_version),
+                python_state=np.array(python_state, dtype=np.uint64),
+                python_gauss=np.array(np.nan if python_gauss is None else python_gauss),
+                stats_counts=np.array([self.stats.rays, self.stats.hops, self.stats.max_hops_reached]),
+                stats_times=np.array([self.stats.elapsed, self.stats.time_intersection,
+                                      self.stats.time_state_change, self.stats.time_energy_update]),
+                hop_histogram=self.stats.hop_histogram)
+        os.replace(temporary, path)
+        self._last_checkpoint = (self.rays_emitted, time.time())
+        logger.debug(f"Checkpoint saved to {path} after {self.rays_emitted} rays")
+
+    def load_checkpoint(self, path):
+        """
+        Restores the results, the stats and the state of the random generators saved by `save_checkpoint`
+
+        Parameters
+        ----------
+        path : str
+            Name of the `.npz` file
+        """
+        with np.load(path, allow_pickle=False) as stored:
+            data = {name: stored[name] for name in stored.files}
+        seed = int(data['seed'])
+        if (seed != (-1 if self.seed is None else self.seed)) or int(data['max_rays']) != self.max_rays:
+            raise ValueError(f"Checkpoint in {path} was saved by a different experiment")
+        self._ray_results = ResultBuffer(RAY_RESULT_DTYPE, self.max_rays)
+        self._ray_results.extend(data['ray_results'])
+        self._points_absorber_Th = ResultBuffer(POINT_ABSORBER_TH_DTYPE)
+        self._points_absorber_Th.extend(data['points_absorber_Th'])
+        self._PV_values = ResultBuffer(PV_VALUE_DTYPE)
+        self._PV_values.extend(data['PV_values'])
+        self.PV_materials = data['PV_materials'].tolist()
+        (self.captured_energy_Th, self.captured_energy_PV,
+         self.sum_squares_Th, self.sum_squares_PV) = data['energy_sums'].tolist()
+        numpy_position, numpy_has_gauss = data['numpy_state'].tolist()
+        np.random.set_state(('MT19937', data['numpy_keys'], numpy_position, numpy_has_gauss,
+                             float(data['numpy_gauss'])))
+        python_gauss = float(data['python_gauss'])
+        random.setstate((int(data['python_version']), tuple(int(x) for x in data['python_state']),
+                         None if np.isnan(python_gauss) else python_gauss))
+        self.stats = ExperimentStats()
+        self.stats.rays, self.stats.hops, self.stats.max_hops_reached = data['stats_counts'].tolist()
+        (self.stats.elapsed, self.stats.time_intersection,
+         self.stats.time_state_change, self.stats.time_energy_update) = data['stats_times'].tolist()
+        self.stats.hop_histogram = data['hop_histogram'].astype(int)
+
+    def run_block(self, number_of_rays, first_ray=0, show_in_doc=None, wavefront_size=None, workers=None):
+        """
+        Emits and traces a block of rays, and stores their results
+
+        Parameters
+        ----------
+        number_of_rays : int
+            Number of rays to emit
+        first_ray : int
+            Index in the experiment of the first ray to emit
+        show_in_doc : App.Document
+            FreeCAD document where to plot the rays, or None if plotting is not desired
+        wavefront_size : int or None
+            If given, the rays are traced in groups of this size as a `Wavefront`
+        workers : int or None
+            If greater than 1, the rays are split among this number of processes (see `run_in_workers`)
+        """
+        if workers is not None and workers > 1:
+            start = time.perf_counter()
+            self.run_in_workers(workers, wavefront_size, number_of_rays, first_ray)
+            self.stats.elapsed += time.perf_counter() - start
+            return
+        start = time.perf_counter()
+        for ray in self.trace_rays(number_of_rays, wavefront_size, first_ray):
+            self.register_ray(ray, show_in_doc)
+        self.stats.elapsed += time.perf_counter() - start
+
+    def energy_sums(self, kind):
+        """
+        Returns the sum and the sum of squares of the energies captured by the rays, for kind 'Th' or 'PV'
+        """
+        if kind == 'Th':
+            return self.captured_energy_Th, self.sum_squares_Th
+        if kind == 'PV':
+            return self.captured_energy_PV, self.sum_squares_PV
+        raise ValueError(f"Unknown kind of captured energy: {kind}")
+
+    def standard_error(self, kind):
+        """
+        Estimates the standard error of the captured energy of kind 'Th' or 'PV'
+
+        The energy captured by each ray is taken as an independent sample, so that the
+        standard error of the total is the square root of the number of rays times
+        the standard deviation of the samples.
+
+        Returns
+        -------
+        float
+            Standard error (np.inf if less than two rays have been emitted)
+        """
+        n = self.rays_emitted
+        if n < 2:
+            return np.inf
+        total, sum_squares = self.energy_sums(kind)
+        variance = max((sum_squares - total * total / n) / (n - 1), 0.0)
+        return np.sqrt(n * variance)
+
+    def relative_standard_error(self, kind):
+        """
+        Estimates the standard error of the captured energy of kind 'Th' or 'PV', relative to its value
+
+        Returns
+        -------
+        float
+            Relative standard error (np.inf if no energy of this kind has been captured
+            or less than two rays have been emitted, since it cannot be estimated)
+        """
+        total = self.energy_sums(kind)[0]
+        if total == 0:
+            return np.inf
+        return self.standard_error(kind) / total
+
+    def hits(self, kind):
+        """
+        Returns the number of rays that captured energy of kind 'Th' or 'PV'
+        """
+        if kind not in ('Th', 'PV'):
+            raise ValueError(f"Unknown kind of captured energy: {kind}")
+        return int(np.count_nonzero(self.ray_results[kind + '_absorbed']))
+
+    def confidence_interval(self, kind, confidence=0.95):
+        """
+        Computes a confidence interval for the captured energy of kind 'Th' or 'PV'
+
+        It uses the normal approximation of the distribution of the captured energy.
+
+        Parameters
+        ----------
+        kind : str
+            'Th' or 'PV'
+        confidence : float
+            Confidence level of the interval
+
+        Returns
+        -------
+        tuple of float
+            Lower and upper bounds of the interval
+        """
+        total = self.energy_sums(kind)[0]
+        margin = norm.ppf(0.5 + confidence / 2) * self.standard_error(kind)
+        return total - margin, total + margin
+
+    def trace_rays(self, number_of_rays, wavefront_size=None, first_ray=0):
+        """
+        Emits rays from the light source and traces them
+
+        Parameters
+        ----------
+        number_of_rays : int
+            Number of rays to emit
+        wavefront_size : int or None
+            If given, the rays are traced in groups of this size as a `Wavefront`
+        first_ray : int
+            Index in the experiment of the first ray to emit, that determines the random
+            streams of the rays if the experiment has a seed
+
+        Yields
+        ------
+        otsun.Ray
+            Each ray, after it has been traced
+        """
+        if wavefront_size is None:
+            for index in np.arange(first_ray, first_ray + number_of_rays, 1):
+                ray = self.emit_ray(index)
+                ray.run()
+                yield ray
+            return
+        for start in range(first_ray, first_ray + number_of_rays, wavefront_size):
+            size = min(wavefront_size, first_ray + number_of_rays - start)
+            rays = [self.emit_ray(index) for index in range(start, start + size)]
+            Wavefront(self.scene, rays).run()
+            for ray in rays:
+                yield ray
+
+    def emit_ray(self, index):
+        """
+        Emits the ray with the given index from the light source
+        """
+        return self.light_source.emit_ray(self.ray_random_stream(index), self.trace)
+
+    def ray_random_stream(self, index):
+        """
+        Returns the random stream of the ray with the given index, or None if the experiment has no seed
+        """
+        if self.seed is None:
+            return None
+        return random_stream(self.seed, int(index))
+
+    def run_in_workers(self, workers, wavefront_size=None, number_of_rays=None, first_ray=0):
+        """
+        Runs the experiment splitting the rays among several processes
+
+        The processes are forked from the current one, so that they share its scene, light
+        source and materials, which cannot be sent to processes started anew (hence this is not
+        available on Windows, see `usable_workers`). If the experiment has a seed, each ray uses
+        its own random stream, and the results are the same as those of a serial run. Otherwise
+        each process draws its random numbers from a different seed, taken from the random
+        generators of the current process. The processes send back a summary of each ray
+        (see `ray_record`), that are stored in the order of the rays.
+
+        Parameters
+        ----------
+        workers : int
+            Number of processes
+        wavefront_size : int or None
+            If given, the rays are traced in groups of this size as a `Wavefront`
+        number_of_rays : int or None
+            Number of rays to emit (all the rays of the experiment if None)
+        first_ray : int
+            Index in the experiment of the first ray to emit
+        """
+        global _running_experiment
+        if not fork_available():
+            raise ValueError("Experiments can only run in several processes where they can be forked")
+        if number_of_rays is None:
+            number_of_rays = self.number_of_rays
+        parts = np.array_split(np.arange(first_ray, first_ray + number_of_rays), workers)
+        seeds = np.random.randint(0, 2 ** 31 - 1, size=workers)
+        tasks = [(len(part), int(part[0]), int(seed), wavefront_size) for (part, seed) in zip(parts, seeds)
+                 if len(part) > 0]
+        _running_experiment = self
+        try:
+            with multiprocessing.get_context('fork').Pool(len(tasks)) as pool:
+                results = pool.map(_trace_in_worker, tasks)
+        finally:
+            _running_experiment = None
+        for records in results:
+            for record in records:
+                self.register_record(record)
+
+    def register_ray(self, ray, show_in_doc=None):
+        """
+        Stores the results of a ray that has been traced
+
+        Parameters
+        ----------
+        ray : otsun.Ray
+            Ray that has finished its propagation
+        show_in_doc : App.Document
+            FreeCAD document where to plot the ray, or None if plotting is not desired
+        """
+        if show_in_doc:
+            ray.add_to_document(show_in_doc)
+        self.register_record(ray_record(ray))
+
+    def register_record(self, record):
+        """
+        Stores the results of a ray that has been traced, given by its summary
+
+        Parameters
+        ----------
+        record : tuple
+            Summary of the ray, as given by `ray_record`
+        """
+        wavelength, Th_energy, point_absorber_Th, PV_energy_absorbed, PV_values, counters = record
+        self.stats.add_ray(*counters)
+        Th_absorbed = point_absorber_Th is not None
+        PV_absorbed = PV_energy_absorbed is not None
+        if Th_absorbed:
+            self.captured_energy_Th += Th_energy
+            self.sum_squares_Th += Th_energy * Th_energy
+            self._points_absorber_Th.append(point_absorber_Th)
+        if PV_absorbed:
+            self.captured_energy_PV += PV_energy_absorbed
+            self.sum_squares_PV += PV_energy_absorbed * PV_energy_absorbed
+            for PV_value in PV_values:
+                material = PV_value[-1]
+                if material not in self.PV_materials:
+                    self.PV_materials.append(material)
+                self._PV_values.append(tuple(PV_value[:-1]) + (self.PV_materials.index(material),))
+        self._ray_results.append((wavelength,
+                                  Th_energy if Th_absorbed else 0.0,
+                                  PV_energy_absorbed if PV_absorbed else 0.0,
+                                  Th_absorbed, PV_absorbed))
+
+
+class SpectralExperiment(Experiment):
+    """
+    Experiment whose rays are emitted at the wavelengths of a grid, in equal numbers
+
+    The rays are stratified by wavelength: the ray with index i is emitted at the
+    wavelength with index i modulo the number of wavelengths, whatever the light spectrum
+    of the light source is. In this way, a single experiment over the scene gives the
+    spectral response for all the wavelengths.
+
+    Parameters
+    ----------
+    scene : otsun.Scene
+        Scene of the experiment
+    light_source : otsun.LightSource
+        Source of the rays to emit
+    wavelengths : list of float
+        Grid of wavelengths
+    rays_per_wavelength : int
+        Number of rays to emit at each wavelength
+    show_in_doc : App.Document
+        FreeCAD document where to plot the rays, or None if plotting is not desired
+    seed : int or None
+        Seed of the random streams of the rays (see `Experiment`)
+    trace : str
+        Level of the history kept by each ray (see `Experiment`)
+    options
+        Other keyword arguments of `Experiment` (block_size, checkpoint_file...)
+    """
+
+    def __init__(self, scene, light_source, wavelengths, rays_per_wavelength, show_in_doc=None, seed=None,
+                 trace=TRACE_FULL, **options):
+        self.grid_wavelengths = np.asarray(wavelengths, dtype=float)
+        self.rays_per_wavelength = rays_per_wavelength
+        super().__init__(scene, light_source, len(self.grid_wavelengths) * rays_per_wavelength,
+                         show_in_doc, seed, trace, **options)
+
+    def emit_ray(self, index):
+        """
+        Emits the ray with the given index from the light source, at the wavelength of its stratum
+        """
+        wavelength = float(self.grid_wavelengths[int(index) % len(self.grid_wavelengths)])
+        return self.light_source.emit_ray(self.ray_random_stream(index), self.trace, wavelength)
+
+    def spectral_table(self, kind, aperture_collector):
+        """
+        Computes the efficiency of the scene at each wavelength of the grid
+
+        The efficiency is computed as in `make_histogram_from_experiment_results`: the mean
+        energy captured by the rays of each wavelength, divided by the aperture of the
+        collector and multiplied by the aperture of the emitting region.
+
+        Parameters
+        ----------
+        kind : str
+            'Th' for the energy captured by thermal absorbers, 'PV' for the energy captured by PV
+        aperture_collector : float
+            Aperture of the collector
+
+        Returns
+        -------
+        np.ndarray
+            Table with a row (wavelength, efficiency) for each wavelength of the grid
+        """
+        energies = self.ray_results[kind + '_energy']
+        strata = np.arange(len(energies)) % len(self.grid_wavelengths)
+        sums = np.bincount(strata, weights=energies, minlength=len(self.grid_wavelengths))
+        counts = np.bincount(strata, minlength=len(self.grid_wavelengths))
+        aperture_source = self.light_source.emitting_region.aperture
+        with np.errstate(invalid='ignore', divide='ignore'):
+            efficiencies = (sums / counts / aperture_collector) * aperture_source
+        return np.column_stack((self.grid_wavelengths, efficiencies))
+
+
+def capturable_kinds(scene):
+    """
+    Finds the kinds of energy that the materials of a scene can capture
+
+    Parameters
+    ----------
+    scene : otsun.Scene
+
+    Returns
+    -------
+    tuple of str
+        'Th' if some material absorbs thermal energy (see `Material.absorbs_thermal_energy`)
+        and 'PV' if some solid is made of a `PVMaterial`
+    """
+    materials = set(scene.materials.values())
+    kinds = []
+    if any(material.absorbs_thermal_energy() for material in materials):
+        kinds.append('Th')
+    if any(isinstance(material, PVMaterial) for material in materials):
+        kinds.append('PV')
+    return tuple(kinds)
+
+
+def fork_available():
+    """
+    Tells whether worker processes can be forked from the current one (it is not possible on Windows)
+    """
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def usable_workers(workers):
+    """
+    Returns the number of worker processes to use, or None if the work must be done in the current process
+
+    Worker processes are forked from the current one, so that they inherit its scene, light source
+    and materials. Where processes cannot be forked, a warning is logged and None is returned.
+
+    Parameters
+    ----------
+    workers : int or None
+        Number of processes requested
+    """
+    if workers is None or workers <= 1:
+        return None
+    if not fork_available():
+        logger.warning(f"Processes cannot be forked in this platform; "
+                       f"running in the current process instead of {workers} processes")
+        return None
+    return workers
+
+
+_running_experiment = None
+# Experiment being run in several processes, inherited by the forked ones
+
+
+def _trace_in_worker(task):
+    """
+    Traces rays of the running experiment in a worker process, and returns their summaries
+    """
+    number_of_rays, first_ray, seed, wavefront_size = task
+    np.random.seed(seed)
+    random.seed(seed)
+    return [ray_record(ray) for ray in _running_experiment.trace_rays(number_of_rays, wavefront_size, first_ray)]
+
+
+def ray_record(ray):
+    """
+    Summarizes the results of a traced ray
+
+    Parameters
+    ----------
+    ray : otsun.Ray
+        Ray that has finished its propagation
+
+    Returns
+    -------
+    tuple
+        Tuple (wavelength, Th_energy, point_absorber_Th, PV_energy, PV_values, counters) where
+        point_absorber_Th is None if the ray was not absorbed in a thermal absorber, PV_energy is None
+        if it was not absorbed in a PV, and counters are the arguments of `ExperimentStats.add_ray`.
+        It only has plain values, so that it can be sent between processes
+    """
+    point_absorber_Th = None
+    if ray.Th_absorbed:
+        point_absorber_Th = (ray.energy,
+                             ray.points[-1].x, ray.points[-1].y, ray.points[-1].z,
+                             ray.points[-2].x, ray.points[-2].y, ray.points[-2].z,
+                             ray.last_normal.x, ray.last_normal.y, ray.last_normal.z)
+    PV_energy_absorbed = None
+    PV_values = []
+    if ray.PV_absorbed:
+        PV_energy_absorbed = np.sum(ray.PV_absorbed)
+        PV_values = list(ray.PV_values)
+    counters = (ray.hops, not ray.finished, ray.time_intersection, ray.time_state_change,
+                ray.time_energy_update)
+    return ray.wavelength, ray.energy, point_absorber_Th, PV_energy_absorbed, PV_values, counters
@@ -0,0 +1,767 @@
+"""Module otsun.intersectors for the computation of intersections of rays with faces
+
+The module defines the class `FaceIntersector` and its subclasses, that compute
+where rays hit a given face. Each face of a `Scene` gets its own intersector,
+and faces that are copies of the same prototype share it (`InstancedIntersector`).
+"""
+
+import numpy as np
+import Part
+from FreeCAD import Base
+from .logging_unit import logger
+
+try:
+    part_line = Part.LineSegment
+except AttributeError:
+    part_line = Part.Line
+
+MAX_CHUNK = 2 ** 20
+# Maximum number of ray-triangle pairs tested at once
+EPSILON = 1E-6
+# Tolerance for considering that a point lies on a surface
+BOUNDARY_DEFLECTION = 1E-4
+# Relative deflection used to discretize curved boundaries of planar faces
+PARAMETER_TOLERANCE = 1E-9
+# Tolerance for comparing parameters of surfaces
+
+
+def moller_trumbore(origins, directions, v0, e1, e2, min_distance, max_distance):
+    """
+    Vectorized Moller-Trumbore intersection of rays with triangles
+
+    Parameters
+    ----------
+    origins : np.ndarray
+        Array of shape (n, 3) with the origins of the rays
+    directions : np.ndarray
+        Array of shape (n, 3) with the (unit) directions of the rays
+    v0 : np.ndarray
+        Array of shape (m, 3) with the first vertex of each triangle
+    e1, e2 : np.ndarray
+        Arrays of shape (m, 3) with the edges from the first vertex to the other two
+    min_distance : float
+        Only hits at distance strictly greater than min_distance are considered
+    max_distance : float
+        Only hits at distance less or equal than max_distance are considered
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n,) with the distance to the nearest hit of each ray (np.inf if none)
+    """
+    n = len(origins)
+    distances = np.full(n, np.inf)
+    if n == 0 or len(v0) == 0:
+        return distances
+    chunk = max(1, MAX_CHUNK // len(v0))
+    for start in range(0, n, chunk):
+        o = origins[start:start + chunk, np.newaxis, :]
+        d = directions[start:start + chunk, np.newaxis, :]
+        p = np.cross(d, e2)
+        det = np.sum(p * e1, axis=-1)
+        s = o - v0
+        q = np.cross(s, e1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_det = 1.0 / det
+            u = np.sum(s * p, axis=-1) * inv_det
+            v = np.sum(d * q, axis=-1) * inv_det
+            t = np.sum(q * e2, axis=-1) * inv_det
+            hit = ((det != 0.0) & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) &
+                   (t > min_distance) & (t <= max_distance))
+        t = np.where(hit, t, np.inf)
+        distances[start:start + chunk] = t.min(axis=1)
+    return distances
+
+
+class FaceIntersector(object):
+    """
+    Base class for the computation of the intersections of rays with a face
+
+    Parameters
+    ----------
+    face : Part.Face
+        Face to intersect
+    """
+
+    planar = False
+    # Whether the face is planar, so that a ray leaving it cannot hit it again
+
+    def __init__(self, face):
+        self.face = face
+
+    def intersect(self, origins, directions, max_distance, min_distance=0.0):
+        """
+        Computes the nearest intersection of each ray with the face
+
+        Parameters
+        ----------
+        origins : np.ndarray
+            Array of shape (n, 3) with the origins of the rays
+        directions : np.ndarray
+            Array of shape (n, 3) with the (unit) directions of the rays
+        max_distance : float
+            Maximum distance at which a hit is considered
+        min_distance : float
+            Hits at distance less or equal than min_distance are discarded
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (n,) with the distance to the nearest hit of each ray (np.inf if none)
+        """
+        raise NotImplementedError
+
+    def refine(self, origin, direction, distance, max_distance):
+        """
+        Refines the distance to a hit found by `intersect`
+
+        Intersectors that compute approximate hits can override this method to
+        recompute the exact hit with the BRep of the face.
+
+        Parameters
+        ----------
+        origin : np.ndarray
+            Origin of the ray
+        direction : np.ndarray
+            Direction of the ray
+        distance : float
+            Distance to the hit found by `intersect`
+        max_distance : float
+            Maximum distance at which a hit is considered
+
+        Returns
+        -------
+        float
+        """
+        return distance
+
+    def normal_at(self, point):
+        """
+        Computes the normal vector of the face at a point of it
+
+        Parameters
+        ----------
+        point : Base.Vector
+
+        Returns
+        -------
+        Base.Vector
+            Unit normal vector, oriented as the face
+        """
+        uv = self.face.Surface.parameter(point)
+        normal = self.face.normalAt(uv[0], uv[1])
+        normal.normalize()
+        return normal
+
+    def normals_at(self, points):
+        """
+        Vectorized version of `normal_at`
+
+        Parameters
+        ----------
+        points : np.ndarray
+            Array of shape (n, 3) with points of the face
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (n, 3) with the unit normal vectors, oriented as the face
+        """
+        return np.array([tuple(self.normal_at(Base.Vector(*point))) for point in points],
+                        dtype=float).reshape(-1, 3)
+
+    def moved(self, movement):
+        """
+        Returns an intersector for the face after a rigid movement, without recomputing it
+
+        It must be called before the face is moved. The intersector keeps a copy of the
+        face in its current position, and the returned one transforms the rays to it.
+
+        Parameters
+        ----------
+        movement : Base.Placement
+            Movement that will be applied to the face
+
+        Returns
+        -------
+        InstancedIntersector
+        """
+        self.face = self.face.copy()
+        return InstancedIntersector(self, movement)
+
+
+class SectionIntersector(FaceIntersector):
+    """
+    Exact intersector that sections the BRep of the face with a segment
+    """
+
+    def intersect(self, origins, directions, max_distance, min_distance=0.0):
+        distances = np.full(len(origins), np.inf)
+        for i, (origin, direction) in enumerate(zip(origins, directions)):
+            distances[i] = self.section_distance(origin, direction, max_distance, min_distance)
+        return distances
+
+    def section_distance(self, origin, direction, max_distance, min_distance=0.0, near=None):
+        """
+        Computes the distance to a hit by sectioning the face with the ray
+
+        Parameters
+        ----------
+        origin : np.ndarray
+            Origin of the ray
+        direction : np.ndarray
+            Direction of the ray
+        max_distance : float
+            Length of the segment used to section the face
+        min_distance : float
+            Hits at distance less or equal than min_distance are discarded
+        near : float or None
+            If given, the hit whose distance is closest to `near` is returned
+            instead of the nearest one
+
+        Returns
+        -------
+        float
+            Distance to the hit, or np.inf if there is none
+        """
+        p0 = Base.Vector(*origin)
+        p1 = p0 + Base.Vector(*direction) * max_distance
+        shape_segment = part_line(p0, p1).toShape()
+        distances = [p0.distanceToPoint(vertex.Point)
+                     for vertex in self.face.section(shape_segment).Vertexes]
+        distances = [distance for distance in distances if distance > min_distance]
+        if not distances:
+            return np.inf
+        if near is None:
+            return min(distances)
+        return min(distances, key=lambda distance: abs(distance - near))
+
+
+class MeshIntersector(SectionIntersector):
+    """
+    Approximate intersector that works on a tessellation of the face
+
+    Parameters
+    ----------
+    face : Part.Face
+        Face to intersect
+    tolerance : float
+        Maximum deviation of the tessellation from the face
+    exact : bool
+        If True, the hits are refined by sectioning the BRep of the face
+    triangles : tuple of np.ndarray or None
+        Arrays (v0, e1, e2) of a tessellation already computed, or None to tessellate the face
+
+    Attributes
+    ----------
+    v0, e1, e2 : np.ndarray
+        First vertex of each triangle and edges from it to the other two vertices
+
+    Only the hits nearer than the min_distance given by the caller are discarded. Rays
+    leaving the face are not hit again by it since they are intersected from a point
+    moved off the face (see `Scene.leaving_origins`).
+    """
+
+    def __init__(self, face, tolerance, exact=False, triangles=None):
+        super(MeshIntersector, self).__init__(face)
+        self.tolerance = tolerance
+        self.exact = exact
+        if triangles is None:
+            points, triangles = face.tessellate(tolerance)
+            vertices = np.array([(p.x, p.y, p.z) for p in points], dtype=float).reshape(-1, 3)
+            triangles = np.array(triangles, dtype=int).reshape(-1, 3)
+            self.v0 = vertices[triangles[:, 0]]
+            self.e1 = vertices[triangles[:, 1]] - self.v0
+            self.e2 = vertices[triangles[:, 2]] - self.v0
+            logger.debug(f"Face tessellated in {len(triangles)} triangles")
+        else:
+            self.v0, self.e1, self.e2 = triangles
+
+    def intersect(self, origins, directions, max_distance, min_distance=0.0):
+        return moller_trumbore(origins, directions, self.v0, self.e1, self.e2, min_distance, max_distance)
+
+    def refine(self, origin, direction, distance, max_distance):
+        if not self.exact:
+            return distance
+        exact_distance = self.section_distance(origin, direction, max_distance, near=distance)
+        if exact_distance == np.inf:
+            # the hit on the tessellation falls slightly outside the face
+            return distance
+        return exact_distance
+
+
+def points_in_polygon(points, edges):
+    """
+    Even-odd test of points against a polygon with holes
+
+    Parameters
+    ----------
+    points : np.ndarray
+        Array of shape (n, 2)
+    edges : np.ndarray
+        Array of shape (m, 4) where each row (x1, y1, x2, y2) is an edge of the boundary
+
+    Returns
+    -------
+    np.ndarray
+        Boolean array of shape (n,)
+    """
+    px = points[:, 0:1]
+    py = points[:, 1:2]
+    x1, y1, x2, y2 = edges.T
+    crosses = (y1 > py) != (y2 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    crossings = np.sum(crosses & (px < x_cross), axis=1)
+    return crossings % 2 == 1
+
+
+def distances_to_polygon(points, edges):
+    """
+    Distance from points to the boundary of a polygon
+
+    Parameters
+    ----------
+    points : np.ndarray
+        Array of shape (n, 2)
+    edges : np.ndarray
+        Array of shape (m, 4) where each row (x1, y1, x2, y2) is an edge of the boundary
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n,)
+    """
+    starts = edges[:, 0:2]
+    vectors = edges[:, 2:4] - starts
+    lengths_sq = np.sum(vectors * vectors, axis=1)
+    relative = points[:, np.newaxis, :] - starts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.sum(relative * vectors, axis=2) / lengths_sq
+    s = np.clip(np.nan_to_num(s), 0.0, 1.0)
+    closest = starts + s[:, :, np.newaxis] * vectors
+    return np.sqrt(np.sum((points[:, np.newaxis, :] - closest) ** 2, axis=2)).min(axis=1)
+
+
+class PlanarIntersector(FaceIntersector):
+    """
+    Analytic intersector for planar faces
+
+    The plane of the face and its boundary, as a polygon in coordinates of the
+    plane, are computed once. Rays are intersected with the plane and the hits
+    are kept if they fall inside the polygon. Curved boundaries are discretized,
+    and hits close to them are checked against the BRep of the face.
+
+    Parameters
+    ----------
+    face : Part.Face
+        Planar face to intersect
+
+    Attributes
+    ----------
+    normal : np.ndarray
+        Unit normal vector of the face
+    offset : float
+        Value of normal . p for the points p of the plane
+    u_axis, v_axis : np.ndarray
+        Orthonormal basis of the plane
+    edges : np.ndarray
+        Edges (x1, y1, x2, y2) of the boundary, in coordinates of the plane
+    deflection : float or None
+        Maximum error of the discretized boundary (None if all edges are straight)
+    """
+
+    planar = True
+
+    def __init__(self, face):
+        super(PlanarIntersector, self).__init__(face)
+        u0, u1, v0, v1 = face.ParameterRange
+        normal = face.normalAt((u0 + u1) / 2.0, (v0 + v1) / 2.0)
+        normal.normalize()
+        self.normal = np.array([normal.x, normal.y, normal.z])
+        point = face.Vertexes[0].Point
+        self.origin = np.array([point.x, point.y, point.z])
+        self.offset = float(self.normal.dot(self.origin))
+        helper = np.zeros(3)
+        helper[np.argmin(np.abs(self.normal))] = 1.0
+        self.u_axis = np.cross(self.normal, helper)
+        self.u_axis /= np.linalg.norm(self.u_axis)
+        self.v_axis = np.cross(self.normal, self.u_axis)
+        straight = all(isinstance(edge.Curve, Part.Line) for edge in face.Edges)
+        if straight:
+            self.deflection = None
+            deflection = face.BoundBox.DiagonalLength
+        else:
+            self.deflection = face.BoundBox.DiagonalLength * BOUNDARY_DEFLECTION
+            deflection = self.deflection
+        edges = []
+        for wire in face.Wires:
+            loop = self.to_plane_coordinates(np.array(
+                [(p.x, p.y, p.z) for p in wire.discretize(Deflection=deflection)]))
+            edges.append(np.hstack([loop, np.roll(loop, -1, axis=0)]))
+        self.edges = np.vstack(edges)
+
+    def to_plane_coordinates(self, points):
+        """
+        Computes the coordinates of points with respect to the basis of the plane
+        """
+        relative = points - self.origin
+        return np.column_stack([relative.dot(self.u_axis), relative.dot(self.v_axis)])
+
+    def intersect(self, origins, directions, max_distance, min_distance=0.0):
+        heights = origins.dot(self.normal) - self.offset
+        speeds = directions.dot(self.normal)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distances = - heights / speeds
+        # rays starting on the plane cannot hit it again
+        valid = ((np.abs(heights) > EPSILON) & (speeds != 0.0) &
+                 (distances > min_distance) & (distances <= max_distance))
+        distances = np.where(valid, distances, np.inf)
+        indices = np.flatnonzero(valid)
+        if len(indices) == 0:
+            return distances
+        points = origins[indices] + directions[indices] * distances[indices, np.newaxis]
+        coordinates = self.to_plane_coordinates(points)
+        inside = points_in_polygon(coordinates, self.edges)
+        if self.deflection is not None:
+            doubtful = np.flatnonzero(distances_to_polygon(coordinates, self.edges) <= self.deflection)
+            for i in doubtful:
+                inside[i] = self.face.isInside(Base.Vector(*points[i]), EPSILON, True)
+        distances[indices[~inside]] = np.inf
+        return distances
+
+    def normal_at(self, point):
+        return Base.Vector(*self.normal)
+
+    def normals_at(self, points):
+        return np.tile(self.normal, (len(points), 1))
+
+
+def vector_to_array(vector):
+    """Converts a Base.Vector to an array"""
+    return np.array([vector.x, vector.y, vector.z])
+
+
+def quadratic_roots(a, b, c):
+    """
+    Computes the real roots of the equations a t^2 + b t + c = 0
+
+    Parameters
+    ----------
+    a, b, c : np.ndarray
+        Coefficients of the equations
+
+    Returns
+    -------
+    np.ndarray, np.ndarray
+        Smallest and largest root of each equation (np.nan where there is none).
+        If a == 0 the only root of the linear equation is given as smallest root.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discriminant = b * b - 4 * a * c
+        sqrt_discriminant = np.sqrt(np.where(discriminant >= 0, discriminant, np.nan))
+        q = -0.5 * (b + np.where(b >= 0, sqrt_discriminant, -sqrt_discriminant))
+        root_1 = q / a
+        root_2 = c / q
+        linear = a == 0
+        root_1 = np.where(linear, -c / b, root_1)
+        root_2 = np.where(linear, np.nan, root_2)
+    root_1 = np.where(np.isfinite(root_1), root_1, np.nan)
+    root_2 = np.where(np.isfinite(root_2), root_2, np.nan)
+    return np.fmin(root_1, root_2), np.where(np.isnan(root_1) | np.isnan(root_2), np.nan,
+                                             np.fmax(root_1, root_2))
+
+
+class QuadricIntersector(FaceIntersector):
+    """
+    Base class for analytic intersectors of faces lying on quadric surfaces
+
+    Subclasses describe the surface as the zero set of a quadratic function,
+    giving the coefficients of its restriction to rays and its gradient. Hits
+    are computed in closed form and then trimmed with the (u, v) domain of the face.
+
+    Parameters
+    ----------
+    face : Part.Face
+        Face to intersect
+
+    Attributes
+    ----------
+    parameter_range : tuple of float
+        Bounds (umin, umax, vmin, vmax) of the parameters of the face
+    u_period : float or None
+        Period of the u parameter, if the surface is periodic in u
+    orientation : float
+        +1 or -1, so that orientation * gradient points as the normal of the face
+    """
+
+    def __init__(self, face):
+        super(QuadricIntersector, self).__init__(face)
+        self.surface = face.Surface
+        self.read_surface(self.surface)
+        self.parameter_range = face.ParameterRange
+        if self.surface.isUPeriodic():
+            self.u_period = self.surface.UPeriod()
+        else:
+            self.u_period = None
+        u0, u1, v0, v1 = self.parameter_range
+        point = vector_to_array(face.valueAt((u0 + u1) / 2.0, (v0 + v1) / 2.0))
+        normal = vector_to_array(face.normalAt((u0 + u1) / 2.0, (v0 + v1) / 2.0))
+        gradient = self.gradient(point[np.newaxis, :])[0]
+        self.orientation = 1.0 if gradient.dot(normal) >= 0 else -1.0
+
+    def read_surface(self, surface):
+        """
+        Reads the parameters of the surface
+        """
+        raise NotImplementedError
+
+    def coefficients(self, origins, directions):
+        """
+        Computes the equations of the intersections of the rays with the surface
+
+        Returns
+        -------
+        a, b, c : np.ndarray
+            Coefficients of the equations a t^2 + b t + c = 0 satisfied by the distances to the hits
+        heights : np.ndarray
+            Approximate distances from the origins to the surface
+        """
+        raise NotImplementedError
+
+    def gradient(self, points):
+        """
+        Computes the gradient of the function that defines the surface
+        """
+        raise NotImplementedError
+
+    def contains(self, point):
+        """
+        Decides if a point of the surface lies in the face
+        """
+        u, v = self.surface.parameter(Base.Vector(*point))
+        u0, u1, v0, v1 = self.parameter_range
+        if self.u_period is not None:
+            u = u0 + (u - u0) % self.u_period
+            if u > u1 + PARAMETER_TOLERANCE and u - self.u_period >= u0 - PARAMETER_TOLERANCE:
+                u -= self.u_period
+        if not (u0 - PARAMETER_TOLERANCE <= u <= u1 + PARAMETER_TOLERANCE and
+                v0 - PARAMETER_TOLERANCE <= v <= v1 + PARAMETER_TOLERANCE):
+            return False
+        return self.face.isPartOfDomain(u, v)
+
+    def intersect(self, origins, directions, max_distance, min_distance=0.0):
+        a, b, c, heights = self.coefficients(origins, directions)
+        roots = np.column_stack(quadratic_roots(a, b, c))
+        # rays starting on the surface do not hit it again at the starting point
+        on_surface = np.flatnonzero(heights <= EPSILON)
+        self_hits = np.argmin(np.abs(np.nan_to_num(roots[on_surface], nan=np.inf)), axis=1)
+        roots[on_surface, self_hits] = np.nan
+        with np.errstate(invalid='ignore'):
+            valid = (roots > min_distance) & (roots <= max_distance)
+        distances = np.full(len(origins), np.inf)
+        for i in np.flatnonzero(valid.any(axis=1)):
+            for root in sorted(roots[i, valid[i]]):
+                if self.contains(origins[i] + directions[i] * root):
+                    distances[i] = root
+                    break
+        return distances
+
+    def normal_at(self, point):
+        return Base.Vector(*self.normals_at(vector_to_array(point)[np.newaxis, :])[0])
+
+    def normals_at(self, points):
+        gradients = self.gradient(np.asarray(points, dtype=float).reshape(-1, 3))
+        return gradients * (self.orientation / np.linalg.norm(gradients, axis=1))[:, np.newaxis]
+
+
+class CylindricalIntersector(QuadricIntersector):
+    """
+    Analytic intersector for faces lying on a cylinder
+    """
+
+    def read_surface(self, surface):
+        self.center = vector_to_array(surface.Center)
+        self.axis = vector_to_array(surface.Axis)
+        self.axis /= np.linalg.norm(self.axis)
+        self.radius = surface.Radius
+
+    def perpendicular(self, vectors):
+        """Component of vectors orthogonal to the axis"""
+        return vectors - np.outer(vectors.dot(self.axis), self.axis)
+
+    def coefficients(self, origins, directions):
+        op = self.perpendicular(origins - self.center)
+        dp = self.perpendicular(directions)
+        a = np.sum(dp * dp, axis=1)
+        b = 2.0 * np.sum(op * dp, axis=1)
+        c = np.sum(op * op, axis=1) - self.radius ** 2
+        heights = np.abs(np.sqrt(np.sum(op * op, axis=1)) - self.radius)
+        return a, b, c, heights
+
+    def gradient(self, points):
+        return self.perpendicular(points - self.center)
+
+
+class SphericalIntersector(QuadricIntersector):
+    """
+    Analytic intersector for faces lying on a sphere
+    """
+
+    def read_surface(self, surface):
+        self.center = vector_to_array(surface.Center)
+        self.radius = surface.Radius
+
+    def coefficients(self, origins, directions):
+        relative = origins - self.center
+        a = np.sum(directions * directions, axis=1)
+        b = 2.0 * np.sum(relative * directions, axis=1)
+        c = np.sum(relative * relative, axis=1) - self.radius ** 2
+        heights = np.abs(np.sqrt(np.sum(relative * relative, axis=1)) - self.radius)
+        return a, b, c, heights
+
+    def gradient(self, points):
+        return points - self.center
+
+
+class ParabolicIntersector(QuadricIntersector):
+    """
+    Analytic intersector for faces lying on a parabolic cylinder
+
+    The surface is the extrusion of a parabola y^2 = 4 F x (in the coordinates
+    of the plane of the parabola) along a given direction.
+    """
+
+    def read_surface(self, surface):
+        parabola = surface.BasisCurve
+        self.vertex = vector_to_array(parabola.Location)
+        self.focal = parabola.Focal
+        x_axis = vector_to_array(parabola.XAxis)
+        y_axis = vector_to_array(parabola.YAxis)
+        normal = vector_to_array(parabola.Axis)
+        direction = vector_to_array(surface.Dir)
+        # linear forms giving the coordinates (x, y) of the projection of a point
+        # onto the plane of the parabola along the direction of extrusion
+        self.x_form = x_axis - normal * direction.dot(x_axis) / direction.dot(normal)
+        self.y_form = y_axis - normal * direction.dot(y_axis) / direction.dot(normal)
+
+    def coefficients(self, origins, directions):
+        relative = origins - self.vertex
+        x0 = relative.dot(self.x_form)
+        y0 = relative.dot(self.y_form)
+        x1 = directions.dot(self.x_form)
+        y1 = directions.dot(self.y_form)
+        a = y1 * y1
+        b = 2.0 * y0 * y1 - 4.0 * self.focal * x1
+        c = y0 * y0 - 4.0 * self.focal * x0
+        heights = np.abs(c) / np.sqrt(16.0 * self.focal ** 2 + 4.0 * y0 * y0)
+        return a, b, c, heights
+
+    def gradient(self, points):
+        relative = points - self.vertex
+        y = relative.dot(self.y_form)
+        return 2.0 * np.outer(y, self.y_form) - 4.0 * self.focal * self.x_form
+
+
+class InstancedIntersector(FaceIntersector):
+    """
+    Intersector of a face that is a rigid copy of a prototype face
+
+    The rays are transformed to the frame of the prototype and intersected with
+    the intersector of the prototype, which is shared by all its copies. The
+    intersector keeps no face of its own, only the placement of the copy.
+
+    Parameters
+    ----------
+    prototype : FaceIntersector
+        Intersector of the prototype face
+    placement : Base.Placement
+        Rigid movement that takes the prototype face to the face
+    """
+
+    def __init__(self, prototype, placement):
+        super(InstancedIntersector, self).__init__(None)
+        self.prototype = prototype
+        self.planar = prototype.planar
+        self.placement = placement
+        self.inverse = placement.inverse()
+        matrix = placement.toMatrix()
+        self.rotation = np.array([[matrix.A11, matrix.A12, matrix.A13],
+                                  [matrix.A21, matrix.A22, matrix.A23],
+                                  [matrix.A31, matrix.A32, matrix.A33]])
+        self.translation = np.array([matrix.A14, matrix.A24, matrix.A34])
+
+    def to_prototype(self, origins, directions):
+        """
+        Transforms rays to the frame of the prototype
+        """
+        return (origins - self.translation).dot(self.rotation), directions.dot(self.rotation)
+
+    def intersect(self, origins, directions, max_distance, min_distance=0.0):
+        origins, directions = self.to_prototype(origins, directions)
+        return self.prototype.intersect(origins, directions, max_distance, min_distance)
+
+    def refine(self, origin, direction, distance, max_distance):
+        origins, directions = self.to_prototype(np.reshape(origin, (1, 3)), np.reshape(direction, (1, 3)))
+        return self.prototype.refine(origins[0], directions[0], distance, max_distance)
+
+    def normal_at(self, point):
+        normal = self.prototype.normal_at(self.inverse.multVec(point))
+        return self.placement.Rotation.multVec(normal)
+
+    def normals_at(self, points):
+        points = (np.asarray(points, dtype=float).reshape(-1, 3) - self.translation).dot(self.rotation)
+        return self.prototype.normals_at(points).dot(self.rotation.T)
+
+    def moved(self, movement):
+        return InstancedIntersector(self.prototype, movement.multiply(self.placement))
+
+
+def quadric_intersector_class(surface):
+    """
+    Returns the class of analytic intersector for a surface, or None if there is none
+    """
+    if isinstance(surface, Part.Cylinder):
+        return CylindricalIntersector
+    if isinstance(surface, Part.Sphere):
+        return SphericalIntersector
+    if (isinstance(surface, Part.SurfaceOfExtrusion) and
+            isinstance(surface.BasisCurve, Part.Parabola)):
+        return ParabolicIntersector
+    return None
+
+
+def make_face_intersector(face, engine='brep', mesh_tolerance=None, exact_hits=False, triangles=None):
+    """
+    Builds the intersector used for a face
+
+    Parameters
+    ----------
+    face : Part.Face
+    engine : str
+        'brep' for exact sections of the faces or 'mesh' for intersections with tessellations
+    mesh_tolerance : float
+        Tolerance of the tessellations (only for the 'mesh' engine)
+    exact_hits : bool
+        Whether hits found in the tessellations are refined with the BRep
+    triangles : tuple of np.ndarray or None
+        Tessellation of the face already computed (only for the 'mesh' engine)
+
+    Returns
+    -------
+    FaceIntersector
+    """
+    if engine not in ('brep', 'mesh'):
+        raise ValueError(f"Unknown intersection engine {engine}")
+    surface = face.Surface
+    if isinstance(surface, Part.Plane):
+        return PlanarIntersector(face)
+    quadric_class = quadric_intersector_class(surface)
+    if quadric_class is not None:
+        return quadric_class(face)
+    if engine == 'mesh':
+        intersector = MeshIntersector(face, mesh_tolerance, exact_hits, triangles)
+        if len(intersector.v0):
+            return intersector
+        logger.warning("Tessellation of face failed; using exact sections")
+    return SectionIntersector(face)
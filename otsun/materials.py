@@ -11,7 +11,7 @@ from FreeCAD import Base
 from .optics import Phenomenon, OpticalState, reflection, refraction, matrix_reflectance, \
     calculate_reflectance, simple_polarization_reflection, simple_polarization_refraction, \
     simple_reflection, shure_refraction, lambertian_reflection
-from .math import arccos, parallel_orthogonal_components, rad_to_deg, myrandom, normalize, \
+from .math import arccos, parallel_orthogonal_components, rad_to_deg, myrandom, random_choice, normalize, \
     constant_function, correct_normal, tabulated_function
 from numpy import sqrt
 import numpy as np
@@ -247,6 +247,17 @@ class Material(object):
         else:
             return n
 
+    def absorbs_thermal_energy(self):
+        """
+        Decides if rays hitting the material can get their energy absorbed as thermal energy
+
+        Returns
+        -------
+        bool
+            True if the material can give the phenomenon `Phenomenon.ENERGY_ABSORBED`
+        """
+        return False
+
     def change_of_optical_state(self, *args):
         """
         Computes how a ray behaves when interacting with the material.
@@ -656,8 +667,7 @@ class PolarizedThinFilm(VolumeMaterial):
                 ray.current_direction(), normal_vector, n1, n2,
                 ray.current_polarization(),
                 properties, ray.wavelength))
-        optical_state.extra_data['factor_energy_absorbed'] = \
-            factor_energy_absorbed
+        optical_state.factor_energy_absorbed = factor_energy_absorbed
         if optical_state.phenomenon == Phenomenon.REFRACTION:
             optical_state.material = self  # TODO: Set solid
         else:
@@ -667,6 +677,10 @@ class PolarizedThinFilm(VolumeMaterial):
 
 vacuum_medium = SimpleVolumeMaterial("Vacuum", 1.0, 0.0)
 
+SURFACE_PHENOMENA = [Phenomenon.REFLEXION, Phenomenon.ABSORPTION, Phenomenon.TRANSMITTANCE]
+# Phenomena that can take place when a ray hits a surface, in the order of `SurfaceMaterial.compute_probabilities`
+
+
 @traced(logger)
 class SurfaceMaterial(Material):
     """
@@ -694,17 +708,23 @@ class SurfaceMaterial(Material):
         """
         Computes the tuple of probabilities that a ray hitting the surface gets reflected, absorbed or transmitted
         """
+        return self.probabilities_at(ray.wavelength)
+
+    def probabilities_at(self, wavelength):
+        """
+        Computes the probabilities that a ray of a given wavelength gets reflected, absorbed or transmitted
+        """
         properties = self.properties
         try:
-            por = properties['probability_of_reflection'](ray.wavelength)
+            por = properties['probability_of_reflection'](wavelength)
         except KeyError:
             por = 1.0
         try:
-            poa = properties['probability_of_absorption'](ray.wavelength)
+            poa = properties['probability_of_absorption'](wavelength)
         except KeyError:
             poa = 1 - por
         try:
-            pot = properties['probability_of_transmittance'](ray.wavelength)
+            pot = properties['probability_of_transmittance'](wavelength)
         except KeyError:
             pot = 0.0
 
@@ -714,15 +734,25 @@ class SurfaceMaterial(Material):
         """
         Decides which phenomenon will take place when a ray hits the surface.
         """
-        phenomena = [
-            Phenomenon.REFLEXION,
-            Phenomenon.ABSORPTION,
-            Phenomenon.TRANSMITTANCE]
-
         probabilities = self.compute_probabilities(ray)
-        phenomenon = np.random.choice(phenomena, 1, p=probabilities)[0]
+        phenomenon = random_choice(SURFACE_PHENOMENA, probabilities)
         return phenomenon
 
+    def absorbs_thermal_energy(self):
+        return bool(self.properties.get('thermal_material', False))
+
+    def is_vectorizable(self):
+        """
+        Decides if the rays hitting the surface can be processed many at once
+
+        This holds if the material uses `change_of_optical_state` of `SurfaceMaterial`,
+        and its reflections are specular and without dispersion, so that the phenomena
+        and reflections of many rays can be computed with arrays (see `Wavefront`).
+        """
+        return (type(self).change_of_optical_state is SurfaceMaterial.change_of_optical_state and
+                not self.properties.get('lambertian_material', False) and
+                not self.properties.get('sigma_1', None))
+
     def change_of_optical_state(self, ray, normal_vector, nearby_material):
         phenomenon = self.decide_phenomenon(ray)
         properties = self.properties
@@ -737,31 +767,43 @@ class SurfaceMaterial(Material):
             state.apply_dispersion(properties, normal_vector)
             return state
         if phenomenon == Phenomenon.ABSORPTION:
-            if self.properties.get('thermal_material', False):
-                return (OpticalState(Base.Vector(0.0, 0.0, 0.0),
-                                     Base.Vector(0.0, 0.0, 0.0),
-                                     Phenomenon.ENERGY_ABSORBED,
-                                     self))  # TODO: Set solid
-            else:
-                return (OpticalState(Base.Vector(0.0, 0.0, 0.0),
-                                     Base.Vector(0.0, 0.0, 0.0),
-                                     Phenomenon.ABSORPTION,
-                                     self))  # TODO: Set solid
+            return self.absorbed_state()
         if phenomenon == Phenomenon.TRANSMITTANCE:
-            # refraction in transparent layer
-            n1 = ray.current_medium().get_n(ray.wavelength)
-            n2 = nearby_material.get_n(ray.wavelength)
-            if n1 == n2:  # transparent_simple_layer
-                state = OpticalState(ray.current_polarization(),
-                                     ray.current_direction(),
-                                     Phenomenon.REFRACTION,
-                                     nearby_material)  # TODO: Set solid
-            else:
-                state = shure_refraction(ray.current_direction(), normal_vector,
-                                         n1, n2, ray.current_polarization(),
-                                         self.properties.get('lambertian_material', False))
-                state.material = nearby_material  # TODO: Set solid
-            return state
+            return self.transmitted_state(ray, normal_vector, nearby_material)
+
+    def absorbed_state(self):
+        """
+        Computes the optical state of a ray absorbed by the surface
+        """
+        if self.properties.get('thermal_material', False):
+            return (OpticalState(Base.Vector(0.0, 0.0, 0.0),
+                                 Base.Vector(0.0, 0.0, 0.0),
+                                 Phenomenon.ENERGY_ABSORBED,
+                                 self))  # TODO: Set solid
+        else:
+            return (OpticalState(Base.Vector(0.0, 0.0, 0.0),
+                                 Base.Vector(0.0, 0.0, 0.0),
+                                 Phenomenon.ABSORPTION,
+                                 self))  # TODO: Set solid
+
+    def transmitted_state(self, ray, normal_vector, nearby_material):
+        """
+        Computes the optical state of a ray that passes through the surface
+        """
+        # refraction in transparent layer
+        n1 = ray.current_medium().get_n(ray.wavelength)
+        n2 = nearby_material.get_n(ray.wavelength)
+        if n1 == n2:  # transparent_simple_layer
+            state = OpticalState(ray.current_polarization(),
+                                 ray.current_direction(),
+                                 Phenomenon.REFRACTION,
+                                 nearby_material)  # TODO: Set solid
+        else:
+            state = shure_refraction(ray.current_direction(), normal_vector,
+                                     n1, n2, ray.current_polarization(),
+                                     self.properties.get('lambertian_material', False))
+            state.material = nearby_material  # TODO: Set solid
+        return state
 
     @classmethod
     def from_plain_properties(cls, name, plain_properties):
@@ -1323,6 +1365,9 @@ class PolarizedCoatingAbsorberLayer(PolarizedCoatingLayer):
         properties = Material.plain_properties_to_properties(plain_properties)
         super(PolarizedCoatingAbsorberLayer, self).__init__(name, properties)
 
+    def absorbs_thermal_energy(self):
+        return True
+
     def change_of_optical_state(self, ray, normal_vector, nearby_material):
         new_state = self.precompute_change_of_optical_state(ray, normal_vector)
         if isinstance(new_state, OpticalState):
@@ -1410,9 +1455,8 @@ class PolarizedCoatingTransparentLayer(PolarizedCoatingLayer):
                     simple_polarization_refraction(
                         incident, normal, normal_parallel_plane, c2, polarization_vector)
             optical_state = OpticalState(polarization_vector, refracted_direction,
-                                         Phenomenon.REFRACTION, nearby_material)  # TODO: Set solid
-            optical_state.extra_data['factor_energy_absorbed'] = \
-                factor_energy_absorbed
+                                         Phenomenon.REFRACTION, nearby_material,
+                                         factor_energy_absorbed)  # TODO: Set solid
             return optical_state
 
 
@@ -1439,6 +1483,9 @@ class TwoLayerMaterial(Material):
             }, cls=NumpyEncoder, indent=4
         )
 
+    def absorbs_thermal_energy(self):
+        return self.front_material.absorbs_thermal_energy() or self.back_material.absorbs_thermal_energy()
+
     def change_of_optical_state(self, ray, normal_vector, nearby_material):
         if ray.current_direction().dot(normal_vector) < 0:
             # Ray intercepted on the frontside of the surface
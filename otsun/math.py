@@ -7,6 +7,7 @@ from FreeCAD import Base
 import random
 import time
 from functools import wraps
+from contextlib import contextmanager
 
 EPSILON = 1E-6
 # Tolerance for considering equal to zero
@@ -126,7 +127,113 @@ def tabulated_function(xvalues, yvalues):
 # Define the random algorithm
 # ---
 # myrandom = random_congruential
-myrandom = random.random
+
+_random_stream = None
+# Generator used for random numbers, or None to use the global generators of random and numpy
+
+
+def myrandom():
+    """
+    Returns a random float in [0, 1)
+
+    It is drawn from the active random stream (see `using_random_stream`), or from the
+    global generator of the module random if there is none.
+    """
+    if _random_stream is None:
+        return random.random()
+    return _random_stream.random()
+
+
+def random_choice(options, weights):
+    """
+    Picks a random element of a list, with given weights
+
+    It is drawn from the active random stream (see `using_random_stream`), or from the
+    global generator of numpy if there is none.
+
+    Parameters
+    ----------
+    options : list
+    weights : list of float
+        Weights (not necessarily normalized) of the elements of the list
+
+    Returns
+    -------
+    Element of the list
+    """
+    probabilities = np.asarray(weights, dtype=float)
+    probabilities = probabilities / probabilities.sum()
+    if _random_stream is None:
+        return options[np.random.choice(len(options), p=probabilities)]
+    return options[_random_stream.choice(len(options), p=probabilities)]
+
+
+def random_choices(weights, streams):
+    """
+    Vectorized version of `random_choice`, for many choices with their own weights and random streams
+
+    Each choice draws a single number from its stream (or from the global generator of numpy
+    if its stream is None), as `random_choice` does, so that the choices are the same as if
+    they were made one by one, in the given order.
+
+    Parameters
+    ----------
+    weights : np.ndarray
+        Array of shape (n, k) with the weights (not necessarily normalized) of the k options of each choice
+    streams : list of np.random.Generator or None
+        Stream used by each choice
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n,) with the position of the option chosen in each choice
+    """
+    weights = np.asarray(weights, dtype=float)
+    cumulative = np.cumsum(weights / weights.sum(axis=1, keepdims=True), axis=1)
+    cumulative /= cumulative[:, -1:]
+    uniforms = np.array([np.random.random_sample() if stream is None else stream.random()
+                         for stream in streams], dtype=float)
+    return np.sum(cumulative <= uniforms[:, np.newaxis], axis=1)
+
+
+def random_stream(seed, index):
+    """
+    Builds an independent random stream for each index
+
+    The stream only depends on the seed and the index, so that each ray of an experiment
+    draws the same numbers however the rays are split among processes.
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the experiment
+    index : int
+        Index of the ray (or group of rays) that uses the stream
+
+    Returns
+    -------
+    np.random.Generator
+    """
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(index,))))
+
+
+@contextmanager
+def using_random_stream(stream):
+    """
+    Makes a random stream active while the context lasts
+
+    Parameters
+    ----------
+    stream : np.random.Generator or None
+        Stream to use, or None to use the global generators of random and numpy
+    """
+    global _random_stream
+    previous = _random_stream
+    _random_stream = stream
+    try:
+        yield
+    finally:
+        _random_stream = previous
 
 # ---
 # Helper function for Cumulative Function Distribution and Randomly generatting distribution
@@ -183,7 +290,7 @@ def pick_random_from_cdf(cdf):
     -------
     float
     """
-    return np.interp(random.random(), cdf[1], cdf[0])
+    return np.interp(myrandom(), cdf[1], cdf[0])
 
 
 def parallel_orthogonal_components(vector, incident, normal):
@@ -328,7 +435,7 @@ def random_point_of_triangle(vertices):
     pq = q-p
     pr = r-p
     while True:
-        x = random.random()
-        y = random.random()
+        x = myrandom()
+        y = myrandom()
         if x + y <= 1:
             return p + pq*x + pr*y
\ No newline at end of file
@@ -219,24 +219,30 @@ class MultiTracking:
         """
         Makes the computed movements
         """
+        moved = []
         for obj in self.object_movements_map:
             movement = self.object_movements_map[obj]
             obj.Placement = movement.multiply(obj.Placement)
             for element, el_obj in self.scene.element_object_dict.items():
                 if obj == el_obj:
-                    element.Placement = movement.multiply(element.Placement)
+                    self.scene.move_element(element, movement)
+                    moved.append(element)
         self.scene.recompute_boundbox()
+        self.scene.update_layout(moved)
 
     def undo_movements(self):
         """
         Undo the movements so that they are in their original position
         """
+        moved = []
         for obj in self.object_movements_map:
             movement = self.object_movements_map[obj]
             movement = movement.inverse()
             obj.Placement = movement.multiply(obj.Placement)
             for element, el_obj in self.scene.element_object_dict.items():
                 if obj == el_obj:
-                    element.Placement = movement.multiply(element.Placement)
+                    self.scene.move_element(element, movement)
+                    moved.append(element)
         self.scene.recompute_boundbox()
+        self.scene.update_layout(moved)
 
@@ -52,18 +52,19 @@ class OpticalState(object):
         solid where the ray is located
     material : Material
         Material where the ray is located
-    extra_data : dict
-        Dictionary where materials can put extra data
+    factor_energy_absorbed : float
+        Fraction of the energy of the ray absorbed when it got to this state
+        (in thin films and coatings)
     """
 
-    def __init__(self, polarization, direction, phenomenon, material=None, extra_data=None):
+    __slots__ = ('polarization', 'direction', 'phenomenon', 'material', 'factor_energy_absorbed')
+
+    def __init__(self, polarization, direction, phenomenon, material=None, factor_energy_absorbed=0.0):
         self.polarization = polarization
         self.direction = direction
         self.phenomenon = phenomenon
         self.material = material  # TODO: Set solid
-        if extra_data is None:
-            extra_data = {}
-        self.extra_data = extra_data
+        self.factor_energy_absorbed = factor_energy_absorbed
 
     def __str__(self):
         return "Dir.: %s, Pol.: %s, Phen.: %s" % (
@@ -213,6 +214,64 @@ def reflection(incident, normal_vector, polarization_vector,
     return OpticalState(polarization_vector, reflected, Phenomenon.REFLEXION)  # TODO: Set solid
 
 
+def reflections(incidents, normal_vectors, polarization_vectors):
+    """
+    Vectorized version of `reflection`, for many rays at once
+
+    The polarization vectors are always computed, as `reflection` does when
+    `polarization_vector_calculated_before` is False.
+
+    Parameters
+    ----------
+    incidents : np.ndarray
+        Array of shape (n, 3) with the (unit) incident vectors
+    normal_vectors : np.ndarray
+        Array of shape (n, 3) with the (unit) vectors normal to the surface
+    polarization_vectors : np.ndarray
+        Array of shape (n, 3) with the polarization vectors of the rays
+
+    Returns
+    -------
+    directions : np.ndarray
+        Array of shape (n, 3) with the directions of the reflected rays
+    polarizations : np.ndarray
+        Array of shape (n, 3) with the polarization vectors of the reflected rays
+    """
+    normals = np.where((np.sum(normal_vectors * incidents, axis=1) > 0)[:, np.newaxis],
+                       -normal_vectors, normal_vectors)
+    c1 = - np.sum(normals * incidents, axis=1)
+    reflected = incidents + normals * (2.0 * c1)[:, np.newaxis]
+    reflected /= np.linalg.norm(reflected, axis=1)[:, np.newaxis]
+    # rotation of the polarization around the normal of the plane of incidence
+    axes = np.cross(incidents, normals)
+    degenerate = np.linalg.norm(axes, axis=1) < EPSILON
+    if degenerate.any():
+        axes[degenerate] = one_orthogonal_vectors(normals[degenerate])
+    axes /= np.linalg.norm(axes, axis=1)[:, np.newaxis]
+    incidence = np.where(np.abs(c1) < 1 - EPSILON, np.arccos(np.clip(c1, -1.0, 1.0)),
+                         np.where(c1 > 0, 0.0, np.pi))
+    angles = np.pi - 2.0 * incidence
+    cosines = np.cos(angles)[:, np.newaxis]
+    sines = np.sin(angles)[:, np.newaxis]
+    projections = np.sum(axes * polarization_vectors, axis=1)[:, np.newaxis]
+    polarizations = (polarization_vectors * cosines + np.cross(axes, polarization_vectors) * sines +
+                     axes * projections * (1.0 - cosines))
+    return reflected, polarizations
+
+
+def one_orthogonal_vectors(vectors):
+    """
+    Vectorized version of `one_orthogonal_vector`
+    """
+    smallest = np.argmin(np.abs(vectors), axis=1)
+    x, y, z = vectors.T
+    zeros = np.zeros(len(vectors))
+    orthogonal = np.where((smallest == 0)[:, np.newaxis], np.column_stack([zeros, z, -y]),
+                          np.where((smallest == 1)[:, np.newaxis], np.column_stack([z, zeros, -x]),
+                                   np.column_stack([y, -x, zeros])))
+    return orthogonal / np.linalg.norm(orthogonal, axis=1)[:, np.newaxis]
+
+
 @traced(logger)
 def lambertian_reflection(incident, normal_vector):
     """
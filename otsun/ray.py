@@ -1,62 +1,62 @@
 """Module otsun.ray for the modelization of light rays
 
-The module defines the class `Ray`
+The module defines the class `Ray`, and the class `Wavefront` for tracing
+many rays at once
 """
 
 from autologging import traced
 from .logging_unit import logger
-from .materials import vacuum_medium, PVMaterial, SurfaceMaterial, TwoLayerMaterial, PolarizedThinFilm
-from .optics import Phenomenon, OpticalState
+from .materials import vacuum_medium, PVMaterial, SurfaceMaterial, TwoLayerMaterial, PolarizedThinFilm, \
+    SURFACE_PHENOMENA
+from .optics import Phenomenon, OpticalState, reflections
+from .math import using_random_stream, random_choices
+from collections import deque
+import time
 import numpy as np
 import Part
 from FreeCAD import Base
 
-try:
-    part_line = Part.LineSegment
-except AttributeError:
-    part_line = Part.Line
-
 # Zero energy level
 LOW_ENERGY = 1E-6
 
+TRACE_FULL = 'full'
+TRACE_LAST_HOP = 'last_hop'
+TRACE_NONE = 'none'
+# Levels of the history kept by a ray: the whole path, the last hop, or only what is
+# needed to compute its energy (the last two points and the current optical state)
 
-def _center(bb):
-    return Base.Vector((bb.XMin+bb.XMax)/2, (bb.YMin+bb.YMax)/2, (bb.ZMin+bb.ZMax)/2)
-
-
-def _interval_intersects(x1, x2, y1, y2):
-    return x1 <= y2 and y1 <= x2
-
-
-def _bb_intersects(bb1, bb2):
-    return (_interval_intersects(bb1.XMin, bb1.XMax, bb2.XMin, bb2.XMax) and
-            _interval_intersects(bb1.YMin, bb1.YMax, bb2.YMin, bb2.YMax) and
-            _interval_intersects(bb1.ZMin, bb1.ZMax, bb2.ZMin, bb2.ZMax))
-
-
-def _distance_point_to_line(point, line_point, line_vector):
-    v = point-line_point
-    cross = v.cross(line_vector)
-    return cross.Length
-
+TRACE_HISTORY_LENGTHS = {TRACE_FULL: (None, None), TRACE_LAST_HOP: (2, 2), TRACE_NONE: (2, 1)}
+# Number of points and of optical states kept for each trace level (None for all of them)
 
-def _distance_point_to_ray(point, ray_origin, ray_vector):
-    v = point - ray_origin
-    if v.dot(ray_vector) >= 0:
-        return _distance_point_to_line(point, ray_origin, ray_vector)
-    return v.Length
 
+def absorption_coefficients(material, wavelength):
+    """
+    Computes the coefficients of the exponential decay of the energy of a ray in a material
 
-def _line_may_intersect_bb(bb, line_point, line_vector):
-    center = _center(bb)
-    d = _distance_point_to_line(center, line_point, line_vector)
-    return d <= bb.DiagonalLength/2
-
+    Parameters
+    ----------
+    material : VolumeMaterial
+        Material where the ray travels
+    wavelength : float
+        Wavelength of the ray
 
-def _ray_may_intersect_bb(bb, ray_origin, ray_vector):
-    center = _center(bb)
-    d = _distance_point_to_ray(center, ray_origin, ray_vector)
-    return d <= bb.DiagonalLength/2
+    Returns
+    -------
+    list of float
+        Non-null coefficients (in mm-1) due to the extinction coefficient and to
+        the attenuation coefficient of the material
+    """
+    coefficients = []
+    if material.properties.get('extinction_coefficient', None):
+        alpha = material.properties['extinction_coefficient'](wavelength) * \
+                4 * np.pi / (wavelength / 1E6)  # mm-1
+        if alpha:
+            coefficients.append(alpha)
+    if material.properties.get('attenuation_coefficient', None):
+        alpha = material.properties['attenuation_coefficient'](wavelength)  # mm-1
+        if alpha:
+            coefficients.append(alpha)
+    return coefficients
 
 
 @traced(logger)
@@ -81,15 +81,24 @@ class Ray(object):
         Initial energy of the ray
     polarization_vector : Base.Vector
         Initial polarization vector of the ray
+    trace : str
+        Level of the history kept by the ray: `TRACE_FULL` keeps the whole path,
+        `TRACE_LAST_HOP` only the last hop, and `TRACE_NONE` only the last two points
+        and the current optical state, which is enough to compute its energy
 
     Attributes
     ----------
-    points : list of Base.Vector
-        Points where the ray passes at each iteration
-    optical_states : list of OpticalState
-        OpticalStates of the rays at each iteration
+    points : list or deque of Base.Vector
+        Points where the ray passes at each iteration (only the last ones if the trace is not full)
+    optical_states : list or deque of OpticalState
+        OpticalStates of the rays at each iteration (only the last ones if the trace is not full)
     last_normal : Base.Vector
         Last vector normal to the surface where the ray hits (used for PV)
+    last_face_index : int
+        Position in `scene.faces` of the last face where the ray hits, that is, the face
+        it is leaving (-1 for none)
+    random_stream : np.random.Generator or None
+        Random stream used when the ray interacts with the scene (None for the global generators)
     wavelength : float
         Wavelength of ray
     energy : float
@@ -102,21 +111,40 @@ class Ray(object):
         List where each entry is a PV_value (a tuple of floats)
     PV_absorbed : list of float
         List of values of absorbed PV energy
+    hops : int
+        Number of hops made by the ray
+    time_intersection : float
+        Time (in seconds) spent finding the intersections of the ray with the scene
+    time_state_change : float
+        Time (in seconds) spent computing the optical states of the ray after hitting faces
+    time_energy_update : float
+        Time (in seconds) spent computing the attenuation of the energy of the ray
     """
 
+    __slots__ = ('scene', 'trace', 'points', 'optical_states', 'current_solid', 'last_normal', 'last_face_index',
+                 'random_stream', 'wavelength', 'energy', 'polarization_vectors', 'finished', 'Th_absorbed',
+                 'PV_values', 'PV_absorbed', 'hops', 'time_intersection', 'time_state_change',
+                 'time_energy_update')
+
     def __init__(self, scene, origin, direction,
-                 wavelength, energy, polarization_vector):
+                 wavelength, energy, polarization_vector, trace=TRACE_FULL):
+        if trace not in TRACE_HISTORY_LENGTHS:
+            raise ValueError(f"Unknown trace level: {trace}")
         self.scene = scene
-        self.points = [origin]
+        self.trace = trace
+        points_kept, states_kept = TRACE_HISTORY_LENGTHS[trace]
+        self.points = _history([origin], points_kept)
         state = OpticalState(
             polarization_vector,
             direction,
             Phenomenon.JUST_STARTED,
             vacuum_medium
         )
-        self.optical_states = [state]
+        self.optical_states = _history([state], states_kept)
         self.current_solid = None
         self.last_normal = None
+        self.last_face_index = -1
+        self.random_stream = None
         self.wavelength = wavelength
         self.energy = energy
         self.polarization_vectors = [polarization_vector]
@@ -124,6 +152,10 @@ class Ray(object):
         self.Th_absorbed = False
         self.PV_values = []
         self.PV_absorbed = []
+        self.hops = 0
+        self.time_intersection = 0.0
+        self.time_state_change = 0.0
+        self.time_energy_update = 0.0
 
     def __str__(self):
         return "Pos.: %s, OS: %s, Energy: %s" % (
@@ -140,6 +172,14 @@ class Ray(object):
         """
         return self.optical_states[-1].material
 
+    def current_solid_name(self):
+        """
+        Get the label of the object of the solid where the ray is currently traveling ("Void" if none)
+        """
+        if self.current_solid is None:
+            return "Void"
+        return self.scene.solid_names[self.scene.solid_id(self.current_solid)]
+
     def current_direction(self):
         """
         Get current direction
@@ -160,73 +200,84 @@ class Ray(object):
         """
         return self.optical_states[-1].polarization
 
-    def weighted_distance(self, p0, pair):
-        if pair[1] in self.scene.materials:
-            return p0.distanceToPoint(pair[0])
-        else:
-            return p0.distanceToPoint(pair[0]) + self.scene.epsilon
-
     def next_intersection(self):
         """
         Finds next intersection of the ray with the scene
 
-        Returns a pair (point,face), where point is the point of intersection
-        and face is the face that intersects.
-        If no intersection is found, it returns a "point at infinity" and None.
+        Returns a pair (point,face_index), where point is the point of intersection
+        and face_index is the position in `scene.faces` of the face that intersects.
+        If no intersection is found, it returns a "point at infinity" and -1.
+
+        The candidate faces are intersected ordered by the distance at which the ray enters
+        their bounding boxes, and the search stops as soon as this distance is beyond the
+        nearest hit found (see `BVH.closest`).
 
         Returns
         -------
         point : Base.Vector
             Point of intersection
-        face : Part.Face or None
-            Face where it intersects
+        face_index : int
+            Position in `scene.faces` of the face where it intersects (-1 if there is none)
         """
         max_distance = 5 * self.scene.diameter
         p0 = self.points[-1]
         direction = self.current_direction()
-        # p0 = p0 + direction * self.scene.epsilon
-        intersections = []
-        p1 = p0 + direction * max_distance
-        segment = part_line(p0, p1)
-        shape_segment = segment.toShape()
-        bb1 = shape_segment.BoundBox
-        candidates = self.scene.faces
-        feasible_faces = 0
-        filtered_faces_1 = 0
-        filtered_faces_2 = 0
-        feasible_but_empty = 0
-        for face in candidates:
-            bb2 = face.BoundBox
-            if not _ray_may_intersect_bb(bb2, p0, direction):
-                filtered_faces_1 += 1
-                continue
-            if not _bb_intersects(bb1, bb2):
-                filtered_faces_2 += 1
-                continue
-            feasible_faces += 1
-            punts = face.section(shape_segment).Vertexes
-            if not punts:
-                feasible_but_empty += 1
-                # logger.debug("feasible face but empty intersection")
-            for punt in punts:
-                intersections.append([punt.Point, face])
-        logger.debug(f"Found {len(intersections)} points in {feasible_faces} faces. Filtered {filtered_faces_1}+{filtered_faces_2}. Feasible but empty {feasible_but_empty}")
-        intersections = [punt_cara for punt_cara in intersections if
-                         p0.distanceToPoint(punt_cara[0]) > 0] # self.scene.epsilon]
-        if not intersections:
+        origins = np.array([[p0.x, p0.y, p0.z]])
+        directions = np.array([[direction.x, direction.y, direction.z]])
+        distances = {}
+
+        def weighted_hit(index, limit):
+            distance = self.distance_to_face(index, origins, directions, limit)
+            if distance == np.inf:
+                return distance
+            distances[index] = distance
+            if self.scene.face_has_material[index]:
+                return distance
+            return distance + self.scene.epsilon
+
+        accelerator = self.scene.accelerator_inside(self.current_solid)
+        _, index = accelerator.closest(tuple(origins[0]), tuple(directions[0]), max_distance, weighted_hit)
+        if index is None and accelerator is not self.scene.accelerator:
+            logger.debug("No intersection found with the faces of the current solid")
+            _, index = self.scene.accelerator.closest(tuple(origins[0]), tuple(directions[0]),
+                                                      max_distance, weighted_hit)
+        logger.debug(f"Intersected {len(distances)} faces with hits")
+        if index is None:
             logger.debug("No true intersection found with scene")
-            return p1, None
-        closest_pair = min(intersections,
-                           key=lambda pair: self.weighted_distance(p0, pair))
-        return tuple(closest_pair)
+            return p0 + direction * max_distance, -1
+        distance = self.scene.intersectors[index].refine(origins[0], directions[0], distances[index], max_distance)
+        return p0 + direction * distance, index
 
-    def next_state_solid_and_normal(self, face):
+    def distance_to_face(self, face_index, origins, directions, max_distance):
+        """
+        Computes the distance from the current point of the ray to a face, in its current direction
+
+        The face that the ray is leaving is skipped if it is planar, and otherwise it is
+        intersected from a point slightly moved off it (see `Scene.leaving_origins`).
+
+        Returns
+        -------
+        float
+            Distance to the hit (np.inf if there is none)
+        """
+        intersector = self.scene.intersectors[face_index]
+        if face_index != self.last_face_index:
+            return intersector.intersect(origins, directions, max_distance)[0]
+        if intersector.planar:
+            return np.inf
+        face_origins, shifts = self.scene.leaving_origins(intersector, origins, directions)
+        return intersector.intersect(face_origins, directions, max_distance)[0] + shifts[0]
+
+    def next_state_solid_and_normal(self, face_index, normal=None):
         """
         Computes the next optical state after the ray hits the face, and the normal vector
 
         Parameters
         ----------
-        face
+        face_index : int
+            Position in `scene.faces` of the face where the ray hits
+        normal : Base.Vector or None
+            Normal vector to the face at the point where the ray hits, if already known
 
         Returns
         -------
@@ -237,16 +288,12 @@ class Ray(object):
         normal : Base.Vector
             Normal vector to the face where the ray hits
         """
-        current_direction = self.current_direction()
-        current_point = self.points[-1]
-        uv = face.Surface.parameter(current_point)
-        normal = face.normalAt(uv[0], uv[1])
-        normal.normalize()
-        nearby_solid = self.scene.next_solid_at_point_in_direction(current_point, normal, current_direction)
-        nearby_material = self.scene.materials.get(nearby_solid, vacuum_medium)
-        if face in self.scene.materials:
+        if normal is None:
+            normal = self.scene.intersectors[face_index].normal_at(self.points[-1])
+        nearby_solid, nearby_material = self.nearby_solid_and_material(face_index, normal)
+        material = self.scene.face_materials[face_index]
+        if material is not None:
             # face is active
-            material = self.scene.materials[face]
             # point_plus_delta = current_point + current_direction * 2 * self.scene.epsilon
             state = material.change_of_optical_state(self, normal, nearby_material)
             # TODO polarization_vector
@@ -262,31 +309,61 @@ class Ray(object):
                 state = nearby_material.change_of_optical_state(self, normal)
             # TODO polarization_vector
         logger.debug(state)
-        next_solid = None
-        if state.phenomenon in [Phenomenon.ENERGY_ABSORBED, Phenomenon.ABSORPTION]:
-            pass
-        elif state.phenomenon == Phenomenon.REFLEXION:
-            next_solid = self.current_solid
-        elif state.phenomenon in [Phenomenon.REFRACTION, Phenomenon.TRANSMITTANCE]:
-            next_solid = nearby_solid
-        return state, next_solid, normal
+        return state, self.solid_after(state, nearby_solid), normal
+
+    def nearby_solid_and_material(self, face_index, normal):
+        """
+        Finds the solid (and its material) at the other side of the face where the ray hits
+
+        Parameters
+        ----------
+        face_index : int
+            Position in `scene.faces` of the face where the ray hits
+        normal : Base.Vector
+            Normal vector to the face at the point where the ray hits
+
+        Returns
+        -------
+        nearby_solid : Part.Solid or None
+            Solid in the direction of the ray after the face (None if there is none)
+        nearby_material : VolumeMaterial
+            Material of nearby_solid (vacuum_medium if there is none)
+        """
+        nearby_solid = self.scene.next_solid_at_point_in_direction(self.points[-1], normal,
+                                                                   self.current_direction(), face_index)
+        if nearby_solid is None:
+            return None, vacuum_medium
+        return nearby_solid, self.scene.solid_materials[self.scene.solid_id(nearby_solid)]
+
+    def solid_after(self, state, nearby_solid):
+        """
+        Decides the solid where the ray travels after it gets to a new optical state at a face
+
+        Parameters
+        ----------
+        state : OpticalState
+            Optical State of the ray after hitting the face
+        nearby_solid : Part.Solid or None
+            Solid at the other side of the face (see `nearby_solid_and_material`)
+
+        Returns
+        -------
+        Part.Solid or None
+        """
+        if state.phenomenon == Phenomenon.REFLEXION:
+            return self.current_solid
+        if state.phenomenon in [Phenomenon.REFRACTION, Phenomenon.TRANSMITTANCE]:
+            return nearby_solid
+        return None
 
     def update_energy(self):
         material = self.current_medium()
         # TODO: @Ramon
         point_1 = self.points[-1]
         point_2 = self.points[-2]
-        if material.properties.get('extinction_coefficient', None):
-            alpha = material.properties['extinction_coefficient'](self.wavelength) * \
-                    4 * np.pi / (self.wavelength / 1E6)  # mm-1
-            if alpha:
-                d = point_1.distanceToPoint(point_2)
-                self.energy = self.energy * np.exp(- alpha * d)
-        if material.properties.get('attenuation_coefficient', None):
-            alpha = material.properties['attenuation_coefficient'](self.wavelength)  # mm-1
-            if alpha:
-                d = point_1.distanceToPoint(point_2)
-                self.energy = self.energy * np.exp(- alpha * d)
+        for alpha in absorption_coefficients(material, self.wavelength):
+            d = point_1.distanceToPoint(point_2)
+            self.energy = self.energy * np.exp(- alpha * d)
 
     def run(self, max_hops=200):
         """
@@ -303,62 +380,355 @@ class Ray(object):
         count = 0
         while (not self.finished) and (count < max_hops):
             logger.debug("Ray running. Hop %s, %s, Solid %s", count, self,
-                        self.scene.name_of_solid.get(self.current_solid, "Void"))
+                        self.current_solid_name())
             count += 1
 
             # Find next intersection
-            # Update points
-            point, face = self.next_intersection()
-            self.points.append(point)
-            if not face:
-                self.finished = True
-                self.Th_absorbed = False
-                break
-
-            # Update energy
-            energy_before = self.energy
-            self.update_energy()
-
-            # Treat PV material
-            current_material = self.current_medium()
-            if isinstance(current_material, PVMaterial):
-                PV_absorbed_energy, PV_value = current_material.get_PV_data(self, energy_before)
-                self.PV_values.append(PV_value)
-                self.PV_absorbed.append(PV_absorbed_energy)
-
-            # Update optical state
-            state, next_solid, normal = self.next_state_solid_and_normal(face)
-
-            # TODO: The following line is not elegant.
-            #  Provisional solution for updating energy when passed a thin film
-            if 'factor_energy_absorbed' in state.extra_data:
-                factor = state.extra_data['factor_energy_absorbed']
-                self.energy = self.energy * (1 - factor)
-
-            # Update optical_states
-            self.optical_states.append(state)
-            self.last_normal = normal
-            self.current_solid = next_solid
-
-            # Test for finish
-            if state.phenomenon == Phenomenon.ABSORPTION:
-                self.finished = True
-            if state.phenomenon == Phenomenon.ENERGY_ABSORBED:
-                self.Th_absorbed = True
-                self.finished = True
-            if self.energy < LOW_ENERGY:
-                self.finished = True
+            start = time.perf_counter()
+            point, face_index = self.next_intersection()
+            self.time_intersection += time.perf_counter() - start
+            self.move_to(point, face_index)
+        self.hops = count
         logger.debug("Ray stopped. Hop %s, %s, Solid %s", count, self,
-                    self.scene.name_of_solid.get(self.current_solid, "Void"))
+                    self.current_solid_name())
+
+    def move_to(self, point, face_index):
+        """
+        Moves the ray to the point where it hits a face and updates its state
+
+        Parameters
+        ----------
+        point : Base.Vector
+            Point of intersection, as found by `next_intersection`
+        face_index : int
+            Position in `scene.faces` of the face where the ray hits, or -1 if it escapes from the scene
+        """
+        # Update points
+        self.points.append(point)
+        if face_index < 0:
+            self.finished = True
+            self.Th_absorbed = False
+            return
+
+        # Update energy
+        energy_before = self.energy
+        start = time.perf_counter()
+        self.update_energy()
+        self.time_energy_update += time.perf_counter() - start
+
+        self.interact_with_face(face_index, energy_before)
+
+    def interact_with_face(self, face_index, energy_before, normal=None):
+        """
+        Updates the state of the ray when it hits a face
+
+        The ray must have already been moved to the point of intersection and its
+        energy updated.
+
+        Parameters
+        ----------
+        face_index : int
+            Position in `scene.faces` of the face where the ray hits
+        energy_before : float
+            Energy of the ray before traveling to the face
+        normal : Base.Vector or None
+            Normal vector to the face at the point where the ray hits, if already known
+        """
+        # Treat PV material
+        current_material = self.current_medium()
+        if isinstance(current_material, PVMaterial):
+            PV_absorbed_energy, PV_value = current_material.get_PV_data(self, energy_before)
+            self.PV_values.append(PV_value)
+            self.PV_absorbed.append(PV_absorbed_energy)
+
+        # Update optical state
+        start = time.perf_counter()
+        with using_random_stream(self.random_stream):
+            state, next_solid, normal = self.next_state_solid_and_normal(face_index, normal)
+        self.time_state_change += time.perf_counter() - start
+        self.change_state(state, next_solid, normal, face_index)
+
+    def change_state(self, state, next_solid, normal, face_index):
+        """
+        Updates the ray with the optical state it gets to after hitting a face, and decides if it finishes
+
+        Parameters
+        ----------
+        state : OpticalState
+            Optical State of the ray after hitting the face
+        next_solid : Part.Solid or None
+            Solid where the ray travels after hitting the face
+        normal : Base.Vector
+            Normal vector to the face at the point where the ray hits
+        face_index : int
+            Position in `scene.faces` of the face where the ray hits
+        """
+        # Energy absorbed when passing a thin film or coating
+        if state.factor_energy_absorbed:
+            self.energy = self.energy * (1 - state.factor_energy_absorbed)
+
+        # Update optical_states
+        self.optical_states.append(state)
+        self.last_normal = normal
+        self.last_face_index = face_index
+        self.current_solid = next_solid
+
+        # Test for finish
+        if state.phenomenon == Phenomenon.ABSORPTION:
+            self.finished = True
+        if state.phenomenon == Phenomenon.ENERGY_ABSORBED:
+            self.Th_absorbed = True
+            self.finished = True
+        if self.energy < LOW_ENERGY:
+            self.finished = True
 
     def add_to_document(self, doc):
         """
         Draws the ray in a FreeCAD document
 
+        Only the points kept by the ray are drawn (see the trace level of `Ray`).
+
         Parameters
         ----------
         doc : App.Document
         """
-        lshape_wire = Part.makePolygon(self.points)
+        lshape_wire = Part.makePolygon(list(self.points))
         my_shape_ray = doc.addObject("Part::Feature", "Ray")
         my_shape_ray.Shape = lshape_wire
+
+
+def _history(items, maxlen):
+    """
+    Container for the history of a ray, a list if all items are kept, or a deque keeping the last maxlen
+    """
+    if maxlen is None:
+        return list(items)
+    return deque(items, maxlen)
+
+
+class Wavefront(object):
+    """
+    Group of rays that are traced together, one hop at a time
+
+    The positions, directions and energies of the active rays are kept in arrays,
+    so that at each hop the intersections of all of them with the scene are found
+    with a single call to `Scene.intersect`, and the attenuation of their energies
+    is computed for each medium and wavelength at once.
+
+    Rays that hit surface layers whose response can be computed with arrays (see
+    `SurfaceMaterial.is_vectorizable`) are grouped by layer, and the phenomena,
+    reflections and absorptions of each group are computed at once (see
+    `interact_in_group`). The rest of rays that hit faces are processed one by one first,
+    and then the groups. Rays are processed in their order, and the groups in the order in
+    which they are first hit, so that, with the global random generators, the results are
+    reproducible. The rays that finish are removed from the active ones.
+
+    Parameters
+    ----------
+    scene : Scene
+        Scene where the rays move
+    rays : list of Ray
+        Rays to trace
+
+    Attributes
+    ----------
+    origins : np.ndarray
+        Current position of each ray
+    directions : np.ndarray
+        Current direction of each ray
+    polarizations : np.ndarray
+        Current polarization vector of each ray
+    energies : np.ndarray
+        Current energy of each ray
+    wavelengths : np.ndarray
+        Wavelength of each ray
+    hops : np.ndarray
+        Number of hops made by each ray
+    last_faces : np.ndarray
+        Position in `scene.faces` of the last face hit by each ray (-1 for none)
+    active : np.ndarray
+        Indices of the rays that have not finished
+    """
+
+    def __init__(self, scene, rays):
+        self.scene = scene
+        self.rays = rays
+        self.origins = np.array([(ray.points[-1].x, ray.points[-1].y, ray.points[-1].z)
+                                 for ray in rays], dtype=float).reshape(-1, 3)
+        self.directions = np.array([tuple(ray.current_direction()) for ray in rays],
+                                   dtype=float).reshape(-1, 3)
+        self.polarizations = np.array([tuple(ray.current_polarization()) for ray in rays],
+                                      dtype=float).reshape(-1, 3)
+        self.energies = np.array([ray.energy for ray in rays], dtype=float)
+        self.wavelengths = np.array([ray.wavelength for ray in rays], dtype=float)
+        self.hops = np.zeros(len(rays), dtype=int)
+        self.last_faces = np.full(len(rays), -1, dtype=int)
+        self.active = np.flatnonzero([not ray.finished for ray in rays])
+
+    def attenuated_energies(self, indices, distances):
+        """
+        Computes the energies of rays after traveling the given distances in their current media
+        """
+        energies = self.energies[indices].copy()
+        groups = {}
+        for position, index in enumerate(indices):
+            key = (self.rays[index].current_medium(), self.wavelengths[index])
+            groups.setdefault(key, []).append(position)
+        for (material, wavelength), positions in groups.items():
+            for alpha in absorption_coefficients(material, wavelength):
+                energies[positions] = energies[positions] * np.exp(- alpha * distances[positions])
+        return energies
+
+    def step(self, max_hops=200):
+        """
+        Makes all the active rays advance one hop
+
+        Parameters
+        ----------
+        max_hops : int
+            Maximum number of hops of each ray
+        """
+        active = self.active
+        max_distance = 5 * self.scene.diameter
+        start = time.perf_counter()
+        distances, points, face_indices, normals = self.scene.intersect(
+            self.origins[active], self.directions[active], max_distance,
+            [self.rays[index].current_solid for index in active], self.last_faces[active])
+        # the time of the operations made for all the rays at once is shared among them
+        time_intersection = (time.perf_counter() - start) / len(active)
+        self.hops[active] += 1
+        for index in active:
+            self.rays[index].hops = int(self.hops[index])
+            self.rays[index].time_intersection += time_intersection
+        for position in np.flatnonzero(face_indices < 0):
+            index = active[position]
+            point = self.origins[index] + self.directions[index] * max_distance
+            self.rays[index].move_to(Base.Vector(*point), -1)
+        hits = np.flatnonzero(face_indices >= 0)
+        start = time.perf_counter()
+        energies = self.attenuated_energies(active[hits], distances[hits])
+        time_energy_update = (time.perf_counter() - start) / max(len(hits), 1)
+        groups = {}
+        for k in range(len(hits)):
+            position = hits[k]
+            index = active[position]
+            ray = self.rays[index]
+            ray.points.append(Base.Vector(*points[position]))
+            ray.energy = float(energies[k])
+            ray.time_energy_update += time_energy_update
+            layer = self.vectorizable_layer(index, int(face_indices[position]), normals[position])
+            if layer is not None:
+                groups.setdefault(layer, []).append(position)
+                continue
+            ray.interact_with_face(int(face_indices[position]), self.energies[index],
+                                   Base.Vector(*normals[position]))
+        for layer, positions in groups.items():
+            self.interact_in_group(layer, active[positions], face_indices[positions], normals[positions])
+        for position in hits:
+            index = active[position]
+            ray = self.rays[index]
+            self.origins[index] = points[position]
+            self.last_faces[index] = face_indices[position]
+            self.directions[index] = tuple(ray.current_direction())
+            self.polarizations[index] = tuple(ray.current_polarization())
+            self.energies[index] = ray.energy
+        self.active = np.array([index for index in active
+                                if not self.rays[index].finished and self.hops[index] < max_hops],
+                               dtype=int)
+
+    def vectorizable_layer(self, index, face_index, normal):
+        """
+        Finds the surface layer hit by a ray, if its response can be computed with arrays
+
+        Parameters
+        ----------
+        index : int
+            Index of the ray
+        face_index : int
+            Position in `scene.faces` of the face where the ray hits
+        normal : np.ndarray
+            Normal vector to the face at the point where the ray hits
+
+        Returns
+        -------
+        SurfaceMaterial or None
+            Layer of the material of the face that the ray hits (the front or back layer of
+            a `TwoLayerMaterial`), or None if the ray must be processed with `Ray.interact_with_face`
+        """
+        ray = self.rays[index]
+        if isinstance(ray.current_medium(), PVMaterial):
+            return None
+        material = self.scene.face_materials[face_index]
+        if isinstance(material, TwoLayerMaterial):
+            if self.directions[index].dot(normal) < 0:
+                material = material.front_material
+            else:
+                material = material.back_material
+        if isinstance(material, SurfaceMaterial) and material.is_vectorizable():
+            return material
+        return None
+
+    def interact_in_group(self, layer, indices, face_indices, normals):
+        """
+        Updates the states of rays that hit the same surface layer, computing their response at once
+
+        The phenomenon of each ray is decided as in `SurfaceMaterial.decide_phenomenon`, drawing
+        from the random stream of the ray, and the reflections of all the reflected rays are
+        computed with `reflections`. Rays transmitted through the layer are processed one by one.
+
+        Parameters
+        ----------
+        layer : SurfaceMaterial
+            Layer hit by the rays, as given by `vectorizable_layer`
+        indices : np.ndarray
+            Indices of the rays
+        face_indices : np.ndarray
+            Position in `scene.faces` of the face where each ray hits
+        normals : np.ndarray
+            Array of shape (n, 3) with the normal vectors to the faces at the points where the rays hit
+        """
+        start = time.perf_counter()
+        rays = [self.rays[index] for index in indices]
+        probabilities = {}
+        for wavelength in np.unique(self.wavelengths[indices]):
+            probabilities[wavelength] = layer.probabilities_at(wavelength)
+        weights = np.array([probabilities[wavelength] for wavelength in self.wavelengths[indices]],
+                           dtype=float).reshape(-1, 3)
+        choices = random_choices(weights, [ray.random_stream for ray in rays])
+        reflected = np.flatnonzero(choices == SURFACE_PHENOMENA.index(Phenomenon.REFLEXION))
+        directions, polarizations = reflections(self.directions[indices[reflected]], normals[reflected],
+                                                self.polarizations[indices[reflected]])
+        time_state_change = (time.perf_counter() - start) / len(rays)
+        reflections_of = dict(zip(reflected.tolist(), zip(directions, polarizations)))
+        for k, ray in enumerate(rays):
+            start = time.perf_counter()
+            normal = Base.Vector(*normals[k])
+            phenomenon = SURFACE_PHENOMENA[choices[k]]
+            if phenomenon == Phenomenon.REFLEXION:
+                direction, polarization = reflections_of[k]
+                state = OpticalState(Base.Vector(*polarization), Base.Vector(*direction),
+                                     Phenomenon.REFLEXION, ray.current_medium())
+                next_solid = ray.current_solid
+            elif phenomenon == Phenomenon.ABSORPTION:
+                state = layer.absorbed_state()
+                next_solid = None
+            else:
+                nearby_solid, nearby_material = ray.nearby_solid_and_material(int(face_indices[k]), normal)
+                with using_random_stream(ray.random_stream):
+                    state = layer.transmitted_state(ray, normal, nearby_material)
+                next_solid = ray.solid_after(state, nearby_solid)
+            ray.time_state_change += time_state_change + time.perf_counter() - start
+            ray.change_state(state, next_solid, normal, int(face_indices[k]))
+
+    def run(self, max_hops=200):
+        """
+        Makes all the rays propagate until they finish or make max_hops hops
+
+        Parameters
+        ----------
+        max_hops : int
+            Maximum number of hops of each ray
+        """
+        while len(self.active):
+            logger.debug("Wavefront running. %s active rays", len(self.active))
+            self.step(max_hops)
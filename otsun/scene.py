@@ -3,9 +3,15 @@
 The module defines the class `Scene` that models the elements in an optical system
 """
 
+import time
+import numpy as np
+from FreeCAD import Base
 from .materials import Material, VolumeMaterial, SurfaceMaterial, TwoLayerMaterial
 from .logging_unit import logger
 from .math import correct_normal
+from .accelerators import boundboxes_to_array, make_accelerator, ray_box_entries
+from .intersectors import InstancedIntersector, make_face_intersector
+from .scene_cache import scene_key, save_compiled_scene, load_compiled_scene
 
 EPSILON = 1E-6
 
@@ -14,10 +20,39 @@ class Scene:
     """
     Class used to define the Scene. It encodes all the objects
     that interfere with light rays.
+
+    Parameters
+    ----------
+    objects : list of App.DocumentObject
+        Objects that form the scene. Their labels determine their materials
+    engine : str
+        Method used to intersect rays with faces: 'brep' (exact sections of the
+        faces) or 'mesh' (intersections with tessellations of the faces).
+        Planar, cylindrical, spherical and parabolic faces are always intersected
+        analytically, whatever the engine.
+    mesh_tolerance : float
+        Maximum deviation of the tessellations from the faces (only for the 'mesh' engine)
+    exact_hits : bool
+        If True, the hits found with the 'mesh' engine are recomputed exactly on the
+        BRep of the face that is hit
+    accelerator : str
+        Structure used to find the faces that a ray may hit: 'bvh' (bounding volume
+        hierarchy) or 'grid' (uniform grid, usually faster for regular arrays of facets)
+    cache_file : str or None
+        Name of a `.npz` file where the compiled scene is stored. If it holds a scene compiled
+        from the same shapes and materials, its data is used instead of computing it again;
+        otherwise the scene is built and saved to it
     """
 
-    def __init__(self, objects):
+    def __init__(self, objects, engine='brep', mesh_tolerance=0.01, exact_hits=False, accelerator='bvh',
+                 cache_file=None):
+        if accelerator not in ('bvh', 'grid'):
+            raise ValueError(f"Unknown accelerator {accelerator}")
         self.objects = objects
+        self.engine = engine
+        self.mesh_tolerance = mesh_tolerance
+        self.exact_hits = exact_hits
+        self.accelerator_kind = accelerator
         self.faces = []  # All the faces in the Scene
         self.solids = []  # All the solids in the Scene
         self.name_of_solid = {}
@@ -27,7 +62,26 @@ class Scene:
         self.epsilon = EPSILON # Tolerance for solid containment # 2 nm.
         self.boundbox = None
         self.element_object_dict = {}
+        # Faces and solids are identified by their position in faces and solids (their id).
+        # Data of faces and solids is also kept in lists and arrays indexed by their id
+        self.face_ids = {}  # Assign to the id() of each face its id
+        self.solid_ids = {}  # Assign to the id() of each solid its id
+        self.face_materials = []  # Material of each face (None if it has no material)
+        self.face_has_material = np.zeros(0, dtype=bool)  # Whether each face has material
+        self.face_objects = []  # Object of each face (None if it has no material)
+        self.solid_materials = []  # Material of each solid
+        self.solid_names = []  # Label of the object of each solid
+        self.solid_objects = []  # Object of each solid
+        self.adjacent_solid_ids = np.zeros((0, 2), dtype=int)  # Ids of adjacent_solids (-1: none, -2: ambiguous)
+        self.load_times = {}  # Time (in seconds) spent in each phase of the construction of the scene
+        self.accelerator = None  # Structure used to find the faces hit by a ray
+        self.intersectors = []  # Object that intersects rays with each face
+        self.adjacent_solids = {}  # Assign to each face the solids in front of and behind it
+        self.parent_solid = {}  # Assign to each solid the smallest solid that contains it
+        self.solid_faces = {}  # Assign to each closed solid the faces that a ray inside it can hit
+        self.solid_accelerators = []  # Accelerator over the faces of each solid (None if it is not closed)
 
+        start = time.perf_counter()
         for obj in objects:
             # noinspection PyNoneFunctionAssignment
             logger.debug(f"loading object {obj.Label}")
@@ -82,9 +136,25 @@ class Scene:
             else:
                 self.boundbox.add(obj.Shape.BoundBox)
 
-        self.remove_duplicate_faces()
+        self.load_times['objects'] = time.perf_counter() - start
 
-        self.diameter = self.boundbox.DiagonalLength
+        compiled = None
+        if cache_file:
+            key = scene_key(objects, engine, mesh_tolerance)
+            compiled = load_compiled_scene(cache_file, key)
+        start = time.perf_counter()
+        if compiled is not None and self.restore_compiled(compiled):
+            self.load_times['cache'] = time.perf_counter() - start
+        else:
+            self.remove_duplicate_faces()
+            self.diameter = self.boundbox.DiagonalLength
+            start = time.perf_counter()
+            self.update_geometry()
+            self.load_times['geometry'] = time.perf_counter() - start
+            if cache_file:
+                save_compiled_scene(self, cache_file, key)
+        logger.info(f"Scene with {len(self.faces)} faces and {len(self.solids)} solids loaded: " +
+                    ", ".join(f"{phase} {seconds:.3f} s" for (phase, seconds) in self.load_times.items()))
 
     def recompute_boundbox(self):
         """
@@ -103,9 +173,506 @@ class Scene:
                 boundbox.add(elem.BoundBox)
         self.boundbox = boundbox
 
+    def update_geometry(self):
+        """
+        Recomputes all the data that depends on the position of the faces
+
+        It must be called again whenever the faces are changed. Faces moved with
+        `move_element` only need `update_layout`.
+        """
+        self.build_ids()
+        self.build_intersectors()
+        self.update_layout()
+
+    def restore_compiled(self, data):
+        """
+        Sets the faces and the data computed from them from a compiled scene
+
+        Parameters
+        ----------
+        data : dict
+            Compiled scene, as given by `load_compiled_scene`
+
+        Returns
+        -------
+        bool
+            False if the data does not match the objects of the scene (and was not used)
+        """
+        faces_with_material = [face for face in self.faces if face in self.materials]
+        if (len(faces_with_material) != int(data['number_with_material']) or
+                len(faces_with_material) + len(data['faces_no_material']) != int(data['number_of_faces']) or
+                len(data['parent_solid']) != len(self.solids)):
+            logger.warning("Compiled scene does not match the objects of the scene")
+            return False
+        self.faces = faces_with_material + list(data['faces_no_material'])
+        self.diameter = float(data['diameter'])
+        self.build_ids()
+        self.build_intersectors(data['triangles'])
+        self.build_accelerator(data['bounds'])
+        self.parent_solid = {solid: self.solids[parent] for (solid, parent) in
+                             zip(self.solids, data['parent_solid']) if parent >= 0}
+        self.adjacent_solid_ids = np.array(data['adjacent_solids'], dtype=int).reshape(-1, 2)
+        self.adjacent_solids = {}
+        for face, sides in zip(self.faces, self.adjacent_solid_ids):
+            if sides[0] > -2:
+                self.adjacent_solids[face] = tuple(self.solids[side] if side >= 0 else None for side in sides)
+        self.build_solid_accelerators()
+        return True
+
+    def build_ids(self):
+        """
+        Gives each face and solid an id, and stores their data in lists and arrays indexed by it
+
+        The id of a face or solid is its position in `faces` or `solids`.
+        """
+        self.face_ids = {id(face): i for (i, face) in enumerate(self.faces)}
+        self.solid_ids = {id(solid): i for (i, solid) in enumerate(self.solids)}
+        self.face_materials = [self.materials.get(face, None) for face in self.faces]
+        self.face_has_material = np.array([material is not None for material in self.face_materials], dtype=bool)
+        self.face_objects = [self.element_object_dict.get(face, None) for face in self.faces]
+        self.solid_materials = [self.materials[solid] for solid in self.solids]
+        self.solid_names = [self.name_of_solid[solid] for solid in self.solids]
+        self.solid_objects = [self.element_object_dict[solid] for solid in self.solids]
+
+    def face_id(self, face):
+        """
+        Returns the id of a face of the scene (-1 for None)
+        """
+        if face is None:
+            return -1
+        return self.face_ids[id(face)]
+
+    def solid_id(self, solid):
+        """
+        Returns the id of a solid of the scene (-1 for None)
+        """
+        if solid is None:
+            return -1
+        return self.solid_ids[id(solid)]
+
+    def update_layout(self, moved=None):
+        """
+        Recomputes the data that depends on the relative position of the elements, but not on their shape
+
+        Parameters
+        ----------
+        moved : list of Part.Solid or Part.Face or None
+            Elements moved with `move_element` since the layout was computed, or None if any
+            element may have changed. If no solid was moved, the moved faces are assumed to stay
+            between the same solids, so that the containment tree and the solids adjacent to
+            each face are kept, and only the accelerators are rebuilt
+        """
+        self.build_accelerator()
+        if moved is None or any(id(element) in self.solid_ids for element in moved):
+            self.build_containment()
+            self.build_adjacency()
+        self.build_solid_accelerators()
+
+    def build_accelerator(self, bounds=None):
+        """
+        Builds the accelerator over the bounding boxes of the faces
+
+        Parameters
+        ----------
+        bounds : np.ndarray or None
+            Bounding boxes of the faces, if already known
+        """
+        if bounds is None:
+            bounds = boundboxes_to_array([face.BoundBox for face in self.faces])
+        self.accelerator = make_accelerator(self.accelerator_kind, bounds, self.epsilon)
+
+    def build_intersectors(self, triangles=None):
+        """
+        Builds the intersector of each face, according to the engine of the scene
+
+        Faces that share their geometry and orientation with other faces, and only differ in their
+        placement (like the faces of FreeCAD links or clones of the same object), are instances of
+        the same prototype: the intersector is built once, for a copy of the first of them,
+        and the rest of faces get an `InstancedIntersector` that uses it. To find them, the
+        faces are first sorted in buckets by `instance_key`, and only faces in the same bucket
+        are compared with `isPartner`.
+
+        Parameters
+        ----------
+        triangles : dict or None
+            Tessellations already computed, given as arrays (v0, e1, e2) for the ids of some faces
+        """
+        if triangles is None:
+            triangles = {}
+        self.intersectors = [None] * len(self.faces)
+        instances = []
+        buckets = {}
+        for index, face in enumerate(self.faces):
+            bucket = buckets.setdefault(instance_key(face), [])
+            for group in bucket:
+                if face.isPartner(self.faces[group[0]]):
+                    group.append(index)
+                    break
+            else:
+                bucket.append([index])
+                instances.append(bucket[-1])
+        for group in instances:
+            first = self.faces[group[0]]
+            if len(group) == 1:
+                self.intersectors[group[0]] = make_face_intersector(
+                    first, self.engine, self.mesh_tolerance, self.exact_hits, triangles.get(group[0]))
+                continue
+            logger.debug(f"Face {first} has {len(group)} instances")
+            prototype_face = first.copy()
+            prototype = make_face_intersector(prototype_face, self.engine, self.mesh_tolerance, self.exact_hits)
+            inverse = prototype_face.Placement.inverse()
+            for index in group:
+                face = self.faces[index]
+                self.intersectors[index] = InstancedIntersector(prototype, face.Placement.multiply(inverse))
+
+    def move_element(self, element, movement):
+        """
+        Moves a solid or a face of the scene
+
+        The intersectors of the faces are not recomputed, but only the transforms from their
+        prototypes are updated. After moving elements, `recompute_boundbox` and `update_layout`
+        (with the list of moved elements) must be called.
+
+        Parameters
+        ----------
+        element : Part.Solid or Part.Face
+            Element of the scene
+        movement : Base.Placement
+            Rigid movement to apply to the element
+        """
+        face_id = self.face_ids.get(id(element))
+        if face_id is not None:
+            self.intersectors[face_id] = self.intersectors[face_id].moved(movement)
+        element.Placement = movement.multiply(element.Placement)
+
+    def build_containment(self):
+        """
+        Builds the containment tree of the solids
+
+        A solid is contained in another one if all its vertices are inside it and its volume
+        is smaller. The parent of each solid in the tree is the smallest solid that contains it.
+        """
+        self.parent_solid = {}
+        for solid in self.solids:
+            containers = [other for other in self.solids
+                          if other is not solid and other.Volume > solid.Volume and
+                          other.BoundBox.isInside(solid.BoundBox) and
+                          all(other.isInside(vertex.Point, self.epsilon, True) for vertex in solid.Vertexes)]
+            if containers:
+                self.parent_solid[solid] = min(containers, key=lambda other: other.Volume)
+
+    def ancestor_solids(self, solid):
+        """
+        Returns the list of solids that contain a solid, from the smallest to the largest
+        """
+        ancestors = []
+        while solid in self.parent_solid:
+            solid = self.parent_solid[solid]
+            ancestors.append(solid)
+        return ancestors
+
+    def innermost_solid(self, solids):
+        """
+        Returns the solid of a list that is contained in all the others, or None if there is none
+        """
+        for solid in solids:
+            ancestors = self.ancestor_solids(solid)
+            if all(other is solid or other in ancestors for other in solids):
+                return solid
+        return None
+
+    def build_adjacency(self):
+        """
+        Finds the solids at both sides of each face
+
+        A point inside each face is moved slightly to both sides of the face and classified
+        with respect to all the solids. The solid found on the side where the normal of
+        the face points (the front) and on the opposite side (the back) are stored in
+        `adjacent_solids`, with None meaning that there is no solid. If a side is inside
+        nested solids, the innermost one is taken. Faces for which no point inside can be
+        found, or where some side is inside solids that are not nested, are ambiguous and
+        are left out, so that for them the solids are found with `solid_at_point` during
+        the tracing.
+        """
+        self.adjacent_solids = {}
+        self.adjacent_solid_ids = np.full((len(self.faces), 2), -2, dtype=int)
+        for face_id, face in enumerate(self.faces):
+            point = point_inside_face(face)
+            if point is None:
+                logger.debug(f"No point found inside face {face}")
+                continue
+            normal = self.intersectors[face_id].normal_at(point)
+            sides = []
+            for sign in (1, -1):
+                probe = point + normal * (sign * 2 * self.epsilon)
+                solids = [solid for solid in self.solids if solid.isInside(probe, self.epsilon, False)]
+                solid = self.innermost_solid(solids) if solids else None
+                if solids and solid is None:
+                    logger.debug(f"Face {face} is in the boundary of overlapping solids")
+                    break
+                sides.append(solid)
+            else:
+                self.adjacent_solids[face] = tuple(sides)
+                self.adjacent_solid_ids[face_id] = [self.solid_id(solid) for solid in sides]
+
+    def build_solid_accelerators(self):
+        """
+        Finds the faces that can be hit by rays inside each closed solid, and builds accelerators over them
+
+        A ray inside a closed solid can only hit the faces adjacent to the solid or to the solids
+        nested in it. Ambiguous faces (see `build_adjacency`) are kept if their bounding
+        box meets the one of the solid.
+        """
+        self.solid_faces = {}
+        self.solid_accelerators = [None] * len(self.solids)
+        closed_solids = [solid for solid in self.solids if solid.isClosed()]
+        for solid in closed_solids:
+            self.solid_faces[solid] = []
+        for index, face in enumerate(self.faces):
+            if face in self.adjacent_solids:
+                solids = set()
+                for solid in self.adjacent_solids[face]:
+                    if solid is not None:
+                        solids.add(solid)
+                        solids.update(self.ancestor_solids(solid))
+            else:
+                solids = [solid for solid in closed_solids if
+                          solid.BoundBox.intersect(face.BoundBox)]
+            for solid in solids:
+                if solid in self.solid_faces:
+                    self.solid_faces[solid].append(index)
+        bounds = self.accelerator.bounds
+        for solid, indices in self.solid_faces.items():
+            accelerator = make_accelerator(self.accelerator_kind, bounds[indices], indices=indices)
+            self.solid_accelerators[self.solid_id(solid)] = accelerator
+
+    def accelerator_inside(self, solid):
+        """
+        Returns the accelerator to find the faces hit by a ray inside a solid
+
+        Parameters
+        ----------
+        solid : Part.Solid or None
+            Solid where the ray travels, or None if it is not inside a solid
+
+        Returns
+        -------
+        BVH or UniformGrid
+            Accelerator over the faces of the solid, if it is closed, or over all the faces otherwise
+        """
+        if solid is None:
+            return self.accelerator
+        accelerator = self.solid_accelerators[self.solid_id(solid)]
+        return self.accelerator if accelerator is None else accelerator
+
+    def intersect(self, origins, directions, max_distance=None, solids=None, last_faces=None):
+        """
+        Finds the next intersection of many rays with the scene at once
+
+        The candidate faces of all rays are found with the accelerator, and then
+        each face is intersected with all the rays that may hit it in a single call
+        to its intersector. The candidates are visited front to back, as in
+        `BVH.closest` (see `nearest_faces`).
+
+        Parameters
+        ----------
+        origins : np.ndarray
+            Array of shape (n, 3) with the origins of the rays
+        directions : np.ndarray
+            Array of shape (n, 3) with the (unit) directions of the rays
+        max_distance : float or None
+            Maximum distance at which hits are searched. Defaults to 5 times the diameter of the scene
+        solids : list of Part.Solid or None
+            Solid where each ray travels (None for rays outside solids). If given, the rays
+            inside closed solids are only intersected with the faces of their solids (see
+            `accelerator_inside`), and with the rest of faces if they hit none of them
+        last_faces : np.ndarray or None
+            Position in `faces` of the face that each ray is leaving (-1 for none). See `nearest_faces`
+
+        Returns
+        -------
+        distances : np.ndarray
+            Array of shape (n,) with the distance to the hit (np.inf if there is none)
+        points : np.ndarray
+            Array of shape (n, 3) with the points of intersection (np.nan if there is none)
+        face_indices : np.ndarray
+            Array of shape (n,) with the position in `faces` of the face hit (-1 if there is none)
+        normals : np.ndarray
+            Array of shape (n, 3) with the normals of the faces at the hits (np.nan if there is none)
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        if max_distance is None:
+            max_distance = 5 * self.diameter
+        number_of_rays = len(origins)
+        if solids is None:
+            rays, faces = self.accelerator.candidate_pairs(origins, directions, max_distance)
+            distances, face_indices = self.nearest_faces(origins, directions, max_distance, rays, faces, last_faces)
+        else:
+            groups = {}
+            for i, solid in enumerate(solids):
+                groups.setdefault(self.accelerator_inside(solid), []).append(i)
+            found_rays = []
+            found_faces = []
+            for accelerator, selected in groups.items():
+                selected = np.array(selected, dtype=int)
+                rays, faces = accelerator.candidate_pairs(origins[selected], directions[selected], max_distance)
+                found_rays.append(selected[rays])
+                found_faces.append(faces)
+            rays = np.concatenate(found_rays) if found_rays else np.zeros(0, dtype=int)
+            faces = np.concatenate(found_faces) if found_faces else np.zeros(0, dtype=int)
+            distances, face_indices = self.nearest_faces(origins, directions, max_distance, rays, faces, last_faces)
+            missed = np.array([i for i in np.flatnonzero(face_indices < 0)
+                               if self.accelerator_inside(solids[i]) is not self.accelerator], dtype=int)
+            if len(missed):
+                logger.debug(f"{len(missed)} rays did not hit the faces of their solids")
+                rays, faces = self.accelerator.candidate_pairs(origins[missed], directions[missed], max_distance)
+                distances[missed], face_indices[missed] = self.nearest_faces(
+                    origins[missed], directions[missed], max_distance, rays, faces,
+                    None if last_faces is None else last_faces[missed])
+        points = np.full((number_of_rays, 3), np.nan)
+        normals = np.full((number_of_rays, 3), np.nan)
+        hits = np.flatnonzero(face_indices >= 0)
+        for i in hits:
+            distances[i] = self.intersectors[face_indices[i]].refine(origins[i], directions[i],
+                                                                     distances[i], max_distance)
+        points[hits] = origins[hits] + directions[hits] * distances[hits, np.newaxis]
+        for index, selected in group_by_face(hits, face_indices[hits]):
+            normals[selected] = self.intersectors[index].normals_at(points[selected])
+        return distances, points, face_indices, normals
+
+    def nearest_faces(self, origins, directions, max_distance, rays, faces, last_faces=None):
+        """
+        Finds the nearest face hit by each ray among some candidate pairs of rays and faces
+
+        A ray cannot hit again the face it is leaving if it is planar, so these pairs are
+        skipped. For curved faces, the ray is intersected from a point slightly moved
+        off the face (see `leaving_origins`).
+
+        The candidates of each ray are visited front to back, ordered by the distance at
+        which the ray enters the bounding box of the face, in rounds of growing size
+        (the nearest candidate of each ray, the next two, the next four...). After each
+        round, the candidates whose boxes the ray enters beyond the nearest hit found
+        are dropped, as in `BVH.closest`.
+
+        Parameters
+        ----------
+        origins : np.ndarray
+            Array of shape (n, 3) with the origins of the rays
+        directions : np.ndarray
+            Array of shape (n, 3) with the (unit) directions of the rays
+        max_distance : float
+            Maximum distance at which hits are searched
+        rays : np.ndarray
+            Index of the ray of each candidate pair
+        faces : np.ndarray
+            Position in `faces` of the face of each candidate pair
+        last_faces : np.ndarray or None
+            Position in `faces` of the face that each ray is leaving (-1 for none)
+
+        Returns
+        -------
+        distances : np.ndarray
+            Array of shape (n,) with the distance to the hit (np.inf if there is none)
+        face_indices : np.ndarray
+            Array of shape (n,) with the position in `faces` of the face hit (-1 if there is none)
+        """
+        number_of_rays = len(origins)
+        distances = np.full(number_of_rays, np.inf)
+        weighted_distances = np.full(number_of_rays, np.inf)
+        face_indices = np.full(number_of_rays, -1, dtype=int)
+        entries = ray_box_entries(self.accelerator.bounds[faces], origins[rays], directions[rays], max_distance)
+        order = np.lexsort((faces, entries, rays))
+        rays = rays[order]
+        faces = faces[order]
+        entries = entries[order]
+        ranks = np.arange(len(rays)) - np.searchsorted(rays, rays)
+        first_rank = 0
+        size = 1
+        while len(rays):
+            batch = ranks < first_rank + size
+            self.nearest_in_batch(origins, directions, max_distance, rays[batch], faces[batch], last_faces,
+                                  distances, weighted_distances, face_indices)
+            rest = ~batch & (entries <= weighted_distances[rays])
+            rays = rays[rest]
+            faces = faces[rest]
+            entries = entries[rest]
+            ranks = ranks[rest]
+            first_rank += size
+            size *= 2
+        return distances, face_indices
+
+    def nearest_in_batch(self, origins, directions, max_distance, rays, faces, last_faces,
+                         distances, weighted_distances, face_indices):
+        """
+        Intersects a batch of candidate pairs of rays and faces, and keeps the nearest hits
+
+        Each face is intersected with all the rays of the batch that may hit it in a single
+        call to its intersector. The arrays distances, weighted_distances and face_indices
+        (see `nearest_faces`) are updated in place.
+        """
+        for index, selected in group_by_face(rays, faces):
+            intersector = self.intersectors[index]
+            face_origins = origins[selected]
+            leaving = np.zeros(len(selected), dtype=bool)
+            if last_faces is not None:
+                leaving = last_faces[selected] == index
+            if leaving.any() and intersector.planar:
+                selected = selected[~leaving]
+                face_origins = face_origins[~leaving]
+                leaving = leaving[~leaving]
+            shifts = np.zeros(len(selected))
+            if leaving.any():
+                face_origins[leaving], shifts[leaving] = self.leaving_origins(
+                    intersector, face_origins[leaving], directions[selected[leaving]])
+            face_distances = intersector.intersect(
+                face_origins, directions[selected], max_distance) + shifts
+            if self.face_has_material[index]:
+                weighted = face_distances
+            else:
+                weighted = face_distances + self.epsilon
+            better = weighted < weighted_distances[selected]
+            selected = selected[better]
+            distances[selected] = face_distances[better]
+            weighted_distances[selected] = weighted[better]
+            face_indices[selected] = index
+
+    def leaving_origins(self, intersector, origins, directions):
+        """
+        Moves the origins of rays that leave a curved face slightly off it
+
+        Each origin is moved along the normal of the face, to the side where the ray goes,
+        so that the face is not hit again at the point where the ray leaves it.
+
+        Parameters
+        ----------
+        intersector : FaceIntersector
+            Intersector of the face
+        origins : np.ndarray
+            Array of shape (n, 3) with the points of the face where the rays start
+        directions : np.ndarray
+            Array of shape (n, 3) with the (unit) directions of the rays
+
+        Returns
+        -------
+        origins : np.ndarray
+            Array of shape (n, 3) with the moved origins
+        shifts : np.ndarray
+            Array of shape (n,) with the distance that the origins advance along the rays,
+            to be added to the distances measured from the moved origins
+        """
+        normals = intersector.normals_at(origins)
+        sides = np.where(np.sum(normals * directions, axis=1) < 0, -1.0, 1.0)
+        offsets = normals * (sides * 2 * self.epsilon)[:, None]
+        return origins + offsets, np.sum(offsets * directions, axis=1)
+
     def remove_duplicate_faces(self):
         """
         Removes redundant faces, so that the computation of next_intersection does not find duplicated points.
+
+        All the faces without material are fused in a single boolean operation, and then all
+        the faces with material are cut from the result in another one. The time spent in
+        each phase is logged and stored in `load_times`.
         """
         logger.debug("Removing duplicate faces")
         faces_with_material = [face for face in self.faces if
@@ -115,16 +682,21 @@ class Scene:
         if not faces_no_material:
             logger.debug("Done Removing duplicate faces (nothing to do)")
             return
+        start = time.perf_counter()
         complex_no_material = faces_no_material[0]
-        for (i,face) in enumerate(faces_no_material[1:]):
-            logger.debug(f"Fusing face {i} of {len(faces_no_material)-1}")
-            complex_no_material = complex_no_material.fuse(face)
-        for (i,face) in enumerate(faces_with_material):
-            logger.debug(f"Cutting face {i} of {len(faces_with_material) - 1}")
-            complex_no_material = complex_no_material.cut(face)
+        if len(faces_no_material) > 1:
+            logger.debug(f"Fusing {len(faces_no_material)} faces")
+            complex_no_material = complex_no_material.fuse(faces_no_material[1:])
+        self.load_times['fuse'] = time.perf_counter() - start
+        start = time.perf_counter()
+        if faces_with_material:
+            logger.debug(f"Cutting {len(faces_with_material)} faces")
+            complex_no_material = complex_no_material.cut(faces_with_material)
+        self.load_times['cut'] = time.perf_counter() - start
         self.faces = faces_with_material
         self.faces.extend(complex_no_material.Faces)
-        logger.debug("Done Removing duplicate faces")
+        logger.info(f"Removed duplicate faces of {len(faces_no_material)} faces without material: "
+                    f"fuse {self.load_times['fuse']:.3f} s, cut {self.load_times['cut']:.3f} s")
 
     def solid_at_point(self, point):
         """
@@ -144,10 +716,105 @@ class Scene:
                 return face
         return None
 
-    def next_solid_at_point_in_direction(self, point, normal, direction):
+    def next_solid_at_point_in_direction(self, point, normal, direction, face_index=-1):
         """
         Returns the next solid found in the given direction from a given point
+
+        Parameters
+        ----------
+        point : Base.Vector
+            Point of a face of the scene
+        normal : Base.Vector
+            Normal vector to the face at the point
+        direction : Base.Vector
+            Direction in which the solid is searched
+        face_index : int
+            Position in `faces` of the face that contains the point (-1 if it is not known).
+            If it is known and not ambiguous, the solid is read from `adjacent_solid_ids`,
+            instead of classifying a point near the face
         """
+        if face_index >= 0:
+            front, back = self.adjacent_solid_ids[face_index]
+            if front > -2:
+                side = front if normal.dot(direction) > 0 else back
+                return self.solids[side] if side >= 0 else None
         external_normal = correct_normal(normal, direction)
         point_plus_epsilon = point + external_normal * (-2) * self.epsilon
         return self.solid_at_point(point_plus_epsilon)
+
+
+def group_by_face(rays, faces):
+    """
+    Groups pairs of rays and faces by their face
+
+    Parameters
+    ----------
+    rays : np.ndarray
+        Index of the ray of each pair
+    faces : np.ndarray
+        Position in `Scene.faces` of the face of each pair
+
+    Yields
+    ------
+    index : int
+        Position of a face
+    selected : np.ndarray
+        Indices of the rays paired with it, in the order they are given
+    """
+    order = np.argsort(faces, kind='stable')
+    rays = rays[order]
+    faces = faces[order]
+    starts = np.flatnonzero(np.diff(faces, prepend=-1))
+    ends = np.append(starts[1:], len(faces))
+    for start, end in zip(starts, ends):
+        yield int(faces[start]), rays[start:end]
+
+
+def instance_key(face):
+    """
+    Computes a cheap invariant of a face under rigid movements
+
+    Faces that are instances of the same prototype (see `Scene.build_intersectors`)
+    have the same key, so that only faces with equal keys need to be compared with `isPartner`.
+
+    Parameters
+    ----------
+    face : Part.Face
+
+    Returns
+    -------
+    tuple
+        Type of surface, orientation, area (rounded to 9 significant digits) and number of edges
+    """
+    return (type(face.Surface).__name__, face.Orientation, float(f"{face.Area:.9g}"), len(face.Edges))
+
+
+def point_inside_face(face):
+    """
+    Finds a point inside a face
+
+    The point at the center of the parameter range of the face is used if it is in the face;
+    otherwise the centers of the triangles of a tessellation of the face are projected to it
+    until one of them falls inside.
+
+    Parameters
+    ----------
+    face : Part.Face
+
+    Returns
+    -------
+    Base.Vector or None
+        Point inside the face, or None if no point is found
+    """
+    u_min, u_max, v_min, v_max = face.ParameterRange
+    u = (u_min + u_max) / 2.0
+    v = (v_min + v_max) / 2.0
+    if face.isPartOfDomain(u, v):
+        return face.valueAt(u, v)
+    vertices, triangles = face.tessellate(0.1)
+    for triangle in triangles:
+        center = (vertices[triangle[0]] + vertices[triangle[1]] + vertices[triangle[2]]) * (1.0 / 3.0)
+        u, v = face.Surface.parameter(center)
+        if face.isPartOfDomain(u, v):
+            return face.valueAt(u, v)
+    return None
@@ -0,0 +1,195 @@
+"""Module otsun.scene_cache for storing compiled scenes
+
+The module defines functions to save the data computed when a `Scene` is built
+(faces without duplicates, tessellations, bounding boxes, solids adjacent to
+each face...) to a `.npz` file, and to load it back, so that scenes built from
+the same document do not need to repeat the computations.
+"""
+
+import hashlib
+import os
+import zipfile
+import numpy as np
+import Part
+from .materials import Material
+from .accelerators import boundboxes_to_array
+from .logging_unit import logger
+
+CACHE_VERSION = 2
+# Version of the format of the files, part of the key of the stored scenes
+
+_shape_digests = {}
+# Hash of the BRep of the shape of each object, by the names of its document and of the object,
+# together with the hashCode of the shape it was computed for
+
+
+def scene_key(objects, engine, mesh_tolerance):
+    """
+    Computes a key that identifies the geometry of a scene
+
+    If all the objects belong to a document saved to a file, the geometry is identified
+    by the path, modification time and size of the file, and the placement and bounding
+    box of each object, so that the shapes need not be read. Changes in the shapes of the
+    document that are not saved and keep these are not detected. Otherwise, the BRep of
+    the shape of each object is hashed, and the hash is kept while its shape is the same
+    (see `shape_digest`).
+
+    Parameters
+    ----------
+    objects : list of App.DocumentObject
+        Objects that form the scene
+    engine : str
+        Intersection engine of the scene
+    mesh_tolerance : float
+        Tolerance of the tessellations of the scene
+
+    Returns
+    -------
+    str
+        Hash of the geometry and the names of the materials of the objects
+    """
+    digest = hashlib.sha1()
+    digest.update(f"{CACHE_VERSION} {engine} {mesh_tolerance}".encode())
+    file_names = set(getattr(getattr(obj, 'Document', None), 'FileName', '') for obj in objects)
+    file_name = file_names.pop() if len(file_names) == 1 else ''
+    saved = bool(file_name) and os.path.isfile(file_name)
+    if saved:
+        status = os.stat(file_name)
+        digest.update(f"{os.path.abspath(file_name)} {status.st_mtime_ns} {status.st_size}".encode())
+    for obj in objects:
+        material = Material.get_from_label(obj.Label)
+        digest.update(obj.Label.encode())
+        digest.update((material.name if material else "").encode())
+        if saved:
+            digest.update(repr(tuple(obj.Placement.toMatrix().A)).encode())
+            digest.update(boundboxes_to_array([obj.Shape.BoundBox]).tobytes())
+        else:
+            digest.update(shape_digest(obj).encode())
+    return digest.hexdigest()
+
+
+def shape_digest(obj):
+    """
+    Computes the hash of the BRep of the shape of an object
+
+    The hash is computed once for each shape, and kept until the shape of the object changes.
+
+    Parameters
+    ----------
+    obj : App.DocumentObject
+
+    Returns
+    -------
+    str
+    """
+    shape = obj.Shape
+    name = (getattr(getattr(obj, 'Document', None), 'Name', ''), getattr(obj, 'Name', obj.Label))
+    code = shape.hashCode()
+    known = _shape_digests.get(name)
+    if known is not None and known[0] == code:
+        return known[1]
+    digest = hashlib.sha1(shape.exportBrepToString().encode()).hexdigest()
+    _shape_digests[name] = (code, digest)
+    return digest
+
+
+def save_compiled_scene(scene, filename, key):
+    """
+    Saves the data computed when building a scene
+
+    The faces with material are not saved, since they are taken from the objects
+    of the scene. The rest of faces are saved as a BRep string.
+
+    The data is written to a temporary file that then replaces the given one, so that
+    an interrupted save, or another process saving the same scene, does not leave a
+    truncated file.
+
+    Parameters
+    ----------
+    scene : Scene
+    filename : str
+        Name of the `.npz` file
+    key : str
+        Key of the scene, as given by `scene_key`
+    """
+    number_with_material = len([face for face in scene.faces if face in scene.materials])
+    faces_no_material = scene.faces[number_with_material:]
+    if faces_no_material:
+        brep = Part.makeCompound(faces_no_material).exportBrepToString()
+    else:
+        brep = ""
+    solid_index = {solid: i for (i, solid) in enumerate(scene.solids)}
+    adjacent_solids = np.full((len(scene.faces), 2), -2, dtype=int)
+    for i, face in enumerate(scene.faces):
+        if face in scene.adjacent_solids:
+            adjacent_solids[i] = [solid_index.get(solid, -1) for solid in scene.adjacent_solids[face]]
+    parent_solid = np.array([solid_index[scene.parent_solid[solid]] if solid in scene.parent_solid else -1
+                             for solid in scene.solids], dtype=int)
+    mesh_faces = []
+    triangles = []
+    for i, intersector in enumerate(scene.intersectors):
+        if hasattr(intersector, 'v0'):
+            mesh_faces.append(i)
+            triangles.append(np.stack([intersector.v0, intersector.e1, intersector.e2], axis=1))
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        np.savez_compressed(
+            f,
+            key=np.array(key),
+            number_of_faces=np.array(len(scene.faces)),
+            number_with_material=np.array(number_with_material),
+            faces_no_material=np.array(brep),
+            bounds=boundboxes_to_array([face.BoundBox for face in scene.faces]),
+            diameter=np.array(scene.diameter),
+            adjacent_solids=adjacent_solids,
+            parent_solid=parent_solid,
+            mesh_faces=np.array(mesh_faces, dtype=int),
+            mesh_counts=np.array([len(t) for t in triangles], dtype=int),
+            mesh_triangles=np.concatenate(triangles) if triangles else np.zeros((0, 3, 3)))
+    os.replace(temporary, filename)
+    logger.debug(f"Compiled scene saved to {filename}")
+
+
+def load_compiled_scene(filename, key):
+    """
+    Loads the data of a compiled scene
+
+    Parameters
+    ----------
+    filename : str
+        Name of the `.npz` file
+    key : str
+        Key of the scene, as given by `scene_key`
+
+    Returns
+    -------
+    dict or None
+        Data saved by `save_compiled_scene`, with the faces without material already
+        rebuilt (as a list of Part.Face) and the tessellations split by face,
+        or None if the file does not exist, cannot be read or was saved for another scene
+    """
+    if not os.path.exists(filename):
+        return None
+    try:
+        with np.load(filename, allow_pickle=False) as stored:
+            data = {name: stored[name] for name in stored.files}
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile) as error:
+        logger.warning(f"Compiled scene in {filename} cannot be read ({error}); the scene is built again")
+        return None
+    if 'key' not in data or str(data['key']) != key:
+        logger.info(f"Compiled scene in {filename} is outdated")
+        return None
+    brep = str(data['faces_no_material'])
+    if brep:
+        shape = Part.Shape()
+        shape.importBrepFromString(brep)
+        data['faces_no_material'] = shape.Faces
+    else:
+        data['faces_no_material'] = []
+    starts = np.concatenate([[0], np.cumsum(data['mesh_counts'])])
+    data['triangles'] = {}
+    for i, face_index in enumerate(data['mesh_faces']):
+        triangles = data['mesh_triangles'][starts[i]:starts[i + 1]]
+        data['triangles'][int(face_index)] = (triangles[:, 0], triangles[:, 1], triangles[:, 2])
+    logger.debug(f"Compiled scene loaded from {filename}")
+    return data
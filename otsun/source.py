@@ -8,10 +8,10 @@ import Part
 import numpy as np
 from FreeCAD import Base
 
-from .math import pick_random_from_cdf, myrandom, tabulated_function, two_orthogonal_vectors, area_of_triangle, random_point_of_triangle
+from .math import pick_random_from_cdf, myrandom, random_choice, using_random_stream, tabulated_function, \
+    two_orthogonal_vectors, area_of_triangle, random_point_of_triangle
 from .optics import dispersion_from_main_direction, random_polarization, dispersion_polarization
-from .ray import Ray
-from random import choices
+from .ray import Ray, TRACE_FULL
 
 from scipy.spatial import ConvexHull
 
@@ -53,7 +53,7 @@ class GeneralizedSunWindow(object):
         doc.addObject("Part::Feature", "SunWindow").Shape = sw
 
     def random_point(self):
-        random_triangle = choices(self.triangles, self.triangle_areas)[0]
+        random_triangle = random_choice(self.triangles, self.triangle_areas)
         return random_point_of_triangle(random_triangle)
 
     def random_direction(self):
@@ -233,9 +233,28 @@ class LightSource(object):
         self.polarization_vector = polarization_vector
         self.wavelengths = []
 
-    def emit_ray(self):
+    def emit_ray(self, random_stream=None, trace=TRACE_FULL, wavelength=None):
         """
         Simulates the emission of a ray
+
+        Parameters
+        ----------
+        random_stream : np.random.Generator or None
+            Random stream used in the emission and in the tracing of the ray, or None to use
+            the global random generators
+        trace : str
+            Level of the history kept by the ray (see `Ray`)
+        wavelength : float or None
+            Wavelength of the ray, or None to take it from the light spectrum
+        """
+        with using_random_stream(random_stream):
+            ray = self._emit_ray(trace, wavelength)
+        ray.random_stream = random_stream
+        return ray
+
+    def _emit_ray(self, trace=TRACE_FULL, wavelength=None):
+        """
+        Simulates the emission of a ray, with the active random stream
         """
         point = self.emitting_region.random_point()
         main_direction = self.emitting_region.main_direction  # emitting main direction
@@ -251,11 +270,12 @@ class LightSource(object):
         else:
             polarization_vector = self.polarization_vector
             polarization_vector.normalize()
-        if np.isscalar(self.light_spectrum):
-            wavelength = self.light_spectrum  # experiment with a single wavelength (nanometers)
-        else:
-            wavelength = pick_random_from_cdf(self.light_spectrum)  # light spectrum is active (nanometers)
-        ray = Ray(self.scene, point, direction, wavelength, self.initial_energy, polarization_vector)
+        if wavelength is None:  # otherwise the wavelength is chosen by the caller (nanometers)
+            if np.isscalar(self.light_spectrum):
+                wavelength = self.light_spectrum  # experiment with a single wavelength (nanometers)
+            else:
+                wavelength = pick_random_from_cdf(self.light_spectrum)  # light spectrum is active (nanometers)
+        ray = Ray(self.scene, point, direction, wavelength, self.initial_energy, polarization_vector, trace)
         return ray
 
 
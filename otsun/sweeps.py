@@ -0,0 +1,260 @@
+"""Module otsun.sweeps for running experiments over grids of angles
+
+The module defines a class `AngularSweep` that runs an experiment for each
+direction of the sun in a grid of angles (as needed for total analysis or
+incidence angle modifiers), possibly in several processes, and saves the
+results of each angle as soon as it is computed.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import numpy as np
+from .experiments import Experiment, usable_workers
+from .logging_unit import logger
+from .math import polar_to_cartesian
+from .ray import TRACE_NONE
+from .source import LightSource, SunWindow
+
+
+def angle_grid(phi_ini, phi_end, phi_step, theta_ini, theta_end, theta_step):
+    """
+    Builds a grid of angles
+
+    Parameters
+    ----------
+    phi_ini, phi_end, phi_step : float
+        Range of values of phi (the end is not included)
+    theta_ini, theta_end, theta_step : float
+        Range of values of theta (the end is not included)
+
+    Returns
+    -------
+    list of tuple of float
+        Pairs (phi, theta) of the grid
+    """
+    return [(phi, theta) for phi in np.arange(phi_ini, phi_end, phi_step)
+            for theta in np.arange(theta_ini, theta_end, theta_step)]
+
+
+class AngularSweep:
+    """
+    Runs an experiment for each direction of the sun in a grid of angles
+
+    For each pair of angles (phi, theta), the sun comes from the direction
+    `polar_to_cartesian(phi, theta)`, and the efficiencies of the scene are computed
+    from an experiment with a `SunWindow` and a `LightSource` with the given settings.
+
+    Parameters
+    ----------
+    scene : otsun.Scene
+        Scene of the experiments
+    angles : list of tuple of float
+        Pairs (phi, theta) of angles, as given by `angle_grid`
+    light_spectrum : float or tuple of list of float
+        Wavelength or CDF of the spectrum of the light source
+    number_of_rays : int
+        Number of rays to emit for each pair of angles
+    aperture_collector_Th : float
+        Aperture of the thermal collector (0 if there is none)
+    aperture_collector_PV : float
+        Aperture of the PV collector (0 if there is none)
+    direction_distribution : BuieDistribution or None
+        Distribution of the directions of the light source
+    polarization_vector : Base.Vector or None
+        Polarization of the light source (None for random polarization)
+    initial_energy : float
+        Energy of each emitted ray
+    seed : int or None
+        If given, the experiment of the k-th pair of angles uses seed + k as seed
+        (see `Experiment`), so that the results are reproducible
+    checkpoint_file : str or None
+        Name of a file where the results are written as soon as each pair of angles
+        is done, after a header with the settings of the sweep (see `configuration`).
+        If it already exists, the angles it contains are not run again
+
+    Attributes
+    ----------
+    results : dict
+        Pair (efficiency_Th, efficiency_PV) for each pair of angles that is done
+    """
+
+    def __init__(self, scene, angles, light_spectrum, number_of_rays, aperture_collector_Th,
+                 aperture_collector_PV, direction_distribution=None, polarization_vector=None,
+                 initial_energy=1.0, seed=None, checkpoint_file=None):
+        self.scene = scene
+        self.angles = [(float(phi), float(theta)) for (phi, theta) in angles]
+        self.light_spectrum = light_spectrum
+        self.number_of_rays = number_of_rays
+        self.aperture_collector_Th = aperture_collector_Th
+        self.aperture_collector_PV = aperture_collector_PV
+        self.direction_distribution = direction_distribution
+        self.polarization_vector = polarization_vector
+        self.initial_energy = initial_energy
+        self.seed = seed
+        self.checkpoint_file = checkpoint_file
+        self.results = {}
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            self.load_checkpoint()
+
+    def configuration(self):
+        """
+        Describes the settings of the sweep that determine its results
+
+        The direction distribution is not included, since it cannot be compared.
+
+        Returns
+        -------
+        dict
+            Number of rays, digest of the spectrum, apertures, polarization, energy and seed
+        """
+        if isinstance(self.light_spectrum, tuple):
+            spectrum = np.hstack([np.ravel(part) for part in self.light_spectrum])
+        else:
+            spectrum = np.array([self.light_spectrum])
+        if self.polarization_vector is None:
+            polarization = None
+        else:
+            polarization = [float(self.polarization_vector.x), float(self.polarization_vector.y),
+                            float(self.polarization_vector.z)]
+        return {
+            'number_of_rays': int(self.number_of_rays),
+            'light_spectrum': hashlib.sha1(spectrum.astype(float).tobytes()).hexdigest(),
+            'aperture_collector_Th': float(self.aperture_collector_Th),
+            'aperture_collector_PV': float(self.aperture_collector_PV),
+            'polarization_vector': polarization,
+            'initial_energy': float(self.initial_energy),
+            'seed': None if self.seed is None else int(self.seed)
+        }
+
+    def load_checkpoint(self):
+        """
+        Reads the results stored in the checkpoint file
+
+        Raises
+        ------
+        ValueError
+            If the header of the file does not match the configuration of the sweep
+        """
+        with open(self.checkpoint_file) as f:
+            header = f.readline()
+        if not header:
+            return
+        if not header.startswith('# ') or json.loads(header[2:]) != self.configuration():
+            raise ValueError(f"Checkpoint in {self.checkpoint_file} was saved by a different sweep")
+        data = np.loadtxt(self.checkpoint_file, ndmin=2)
+        for phi, theta, efficiency_Th, efficiency_PV in data:
+            self.results[(phi, theta)] = (efficiency_Th, efficiency_PV)
+        logger.info(f"{len(self.results)} angles read from {self.checkpoint_file}")
+
+    def save_result(self, phi, theta, efficiency_Th, efficiency_PV):
+        """
+        Stores the results of a pair of angles, and appends them to the checkpoint file
+        """
+        self.results[(phi, theta)] = (efficiency_Th, efficiency_PV)
+        if self.checkpoint_file:
+            with open(self.checkpoint_file, 'a') as f:
+                if f.tell() == 0:
+                    f.write(f"# {json.dumps(self.configuration(), sort_keys=True)}\n")
+                f.write(f"{phi!r} {theta!r} {efficiency_Th!r} {efficiency_PV!r}\n")
+
+    def run_angle(self, k):
+        """
+        Runs the experiment of the k-th pair of angles
+
+        Returns
+        -------
+        tuple of float
+            Tuple (phi, theta, efficiency_Th, efficiency_PV)
+        """
+        phi, theta = self.angles[k]
+        main_direction = polar_to_cartesian(phi, theta) * -1.0
+        emitting_region = SunWindow(self.scene, main_direction)
+        light_source = LightSource(self.scene, emitting_region, self.light_spectrum, self.initial_energy,
+                                   self.direction_distribution, self.polarization_vector)
+        seed = None if self.seed is None else self.seed + k
+        experiment = Experiment(self.scene, light_source, self.number_of_rays, seed=seed, trace=TRACE_NONE)
+        experiment.run()
+        rays_by_area = experiment.number_of_rays / emitting_region.aperture
+        if self.aperture_collector_Th != 0.0:
+            efficiency_Th = (experiment.captured_energy_Th / self.aperture_collector_Th) / rays_by_area
+        else:
+            efficiency_Th = 0.0
+        if self.aperture_collector_PV != 0.0:
+            efficiency_PV = (experiment.captured_energy_PV / self.aperture_collector_PV) / rays_by_area
+        else:
+            efficiency_PV = 0.0
+        return phi, theta, float(efficiency_Th), float(efficiency_PV)
+
+    def run(self, workers=None):
+        """
+        Runs the experiments of the angles that are not done yet
+
+        Parameters
+        ----------
+        workers : int or None
+            If greater than 1, the angles are run in this number of processes, forked from
+            the current one. Where processes cannot be forked (as on Windows), the angles
+            are run in the current process (see `usable_workers`)
+
+        Returns
+        -------
+        np.ndarray
+            Table with a row (phi, theta, efficiency_Th, efficiency_PV) for each pair of angles
+        """
+        global _running_sweep
+        pending = [k for (k, angle) in enumerate(self.angles) if angle not in self.results]
+        logger.info(f"Running {len(pending)} of {len(self.angles)} angles")
+        workers = usable_workers(workers)
+        if workers is not None and len(pending) > 1:
+            if self.seed is None:
+                # forked processes inherit the global random generators, so each one is reseeded
+                seeds = np.random.randint(0, 2 ** 31 - 1, size=len(pending)).tolist()
+            else:
+                seeds = [None] * len(pending)
+            tasks = list(zip(pending, seeds))
+            _running_sweep = self
+            try:
+                with multiprocessing.get_context('fork').Pool(min(workers, len(tasks))) as pool:
+                    for result in pool.imap_unordered(_run_angle_in_worker, tasks):
+                        self.save_result(*result)
+            finally:
+                _running_sweep = None
+        else:
+            for k in pending:
+                self.save_result(*self.run_angle(k))
+        return self.table()
+
+    def table(self):
+        """
+        Builds the table of efficiencies of the angles that are done
+
+        Returns
+        -------
+        np.ndarray
+            Table with a row (phi, theta, efficiency_Th, efficiency_PV) for each pair of angles,
+            in the order of the grid
+        """
+        return np.array([(phi, theta) + tuple(self.results[(phi, theta)])
+                         for (phi, theta) in self.angles if (phi, theta) in self.results],
+                        dtype=float).reshape(-1, 4)
+
+
+_running_sweep = None
+# Sweep being run in several processes, inherited by the forked ones
+
+
+def _run_angle_in_worker(task):
+    """
+    Runs the experiment of a pair of angles of the running sweep in a worker process
+
+    The global random generators of the worker are seeded first, unless the seed is None
+    (when the sweep has a seed, and its experiments use their own random streams).
+    """
+    k, seed = task
+    if seed is not None:
+        np.random.seed(seed)
+        random.seed(seed)
+    return _running_sweep.run_angle(k)
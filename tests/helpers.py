@@ -0,0 +1,145 @@
+"""
+Setup shared by the tests: random generators, logging, and the parabolic trough
+collector of test_PTC.FCStd lit by the sun (with Buie Model as solar direction)
+"""
+
+import logging
+import random
+import numpy as np
+import otsun
+import FreeCAD
+
+PTC_PROJECT = 'test_PTC.FCStd'
+# FreeCAD project with the parabolic trough collector
+PTC_APERTURE_TH = 1845.0 * 10347.0
+# Aperture of the thermal collector of the parabolic trough
+PTC_ANGLES = otsun.angle_grid(90.0 + 1.E-9, 90.0 + 1.E-4, 5.0, 0.0 + 1.E-9, 45.0 + 1.E-4, 45.0)
+# Pairs (phi, theta) of the total analysis of the parabolic trough
+PTC_CSR = 0.05
+# Circumsolar ratio of the Buie model of the sun
+SPECTRUM_FILE = 'ASTMG173-direct.txt'
+# Solar spectrum of the light sources
+
+_handler = None
+# Handler added to the logger of otsun by `setup_logging`
+
+
+def seed_random_generators(seed=1):
+    """
+    Seeds the global random generators of numpy and python
+    """
+    np.random.seed(seed)
+    random.seed(seed)
+
+
+def setup_logging(level=logging.DEBUG):
+    """
+    Sends the messages of the logger of otsun to the console
+
+    The handler is only added once, however many tests call this function.
+    """
+    global _handler
+    otsun.logger.setLevel(level)
+    if _handler is None:
+        _handler = logging.StreamHandler()
+        _handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        otsun.logger.addHandler(_handler)
+    _handler.setLevel(level)
+
+
+def open_ptc():
+    """
+    Opens the project of the parabolic trough collector and creates the materials of its objects
+
+    Returns
+    -------
+    FreeCAD.Document
+    """
+    FreeCAD.openDocument(PTC_PROJECT)
+    otsun.SimpleVolumeMaterial("Glass1", 1.473, 0.015)
+    otsun.OpaqueSimpleLayer("Opa1")
+    otsun.TransparentSimpleLayer("AR1", 0.95)
+    otsun.ReflectorSpecularLayer("Mir", 0.885, 4.4, 20, 0.9)
+    otsun.TwoLayerMaterial("Mir1", "Mir", "Mir")
+    otsun.AbsorberLambertianLayer("Abs1", 0.92)
+    return FreeCAD.ActiveDocument
+
+
+def sun_light_source(scene, phi, theta, light_spectrum, direction_distribution=None, polarization_vector=None):
+    """
+    Builds a light source that emits rays from the sun window of a scene in the direction given by two angles
+
+    Returns
+    -------
+    otsun.LightSource
+    """
+    main_direction = otsun.polar_to_cartesian(phi, theta) * -1.0
+    emitting_region = otsun.SunWindow(scene, main_direction)
+    return otsun.LightSource(scene, emitting_region, light_spectrum, 1.0, direction_distribution,
+                             polarization_vector)
+
+
+def ptc_light_source(scene, phi=PTC_ANGLES[0][0], theta=PTC_ANGLES[0][1]):
+    """
+    Builds the light source of the sun, with the solar spectrum and the Buie model, for the parabolic trough
+
+    Returns
+    -------
+    otsun.LightSource
+    """
+    return sun_light_source(scene, phi, theta, otsun.cdf_from_pdf_file(SPECTRUM_FILE),
+                            otsun.buie_distribution(PTC_CSR))
+
+
+def efficiencies(experiment, aperture_collector_Th, aperture_collector_PV=0.0):
+    """
+    Computes the efficiencies of the collectors from the energy captured in an experiment
+
+    Returns
+    -------
+    tuple of float
+        Pair (efficiency_Th, efficiency_PV), which are 0 for collectors without aperture
+    """
+    rays_by_area = experiment.number_of_rays / experiment.light_source.emitting_region.aperture
+    efficiency_Th = 0.0
+    efficiency_PV = 0.0
+    if aperture_collector_Th != 0.0:
+        efficiency_Th = (experiment.captured_energy_Th / aperture_collector_Th) / rays_by_area
+    if aperture_collector_PV != 0.0:
+        efficiency_PV = (experiment.captured_energy_PV / aperture_collector_PV) / rays_by_area
+    return efficiency_Th, efficiency_PV
+
+
+def ptc_total_analysis(scene, number_of_rays=100, run_options=None, **experiment_options):
+    """
+    Runs an experiment for each pair of angles of `PTC_ANGLES` on the parabolic trough
+
+    Parameters
+    ----------
+    scene : otsun.Scene
+    number_of_rays : int
+    run_options : dict or None
+        Keyword arguments of `Experiment.run`
+    experiment_options
+        Keyword arguments of `Experiment`
+
+    Returns
+    -------
+    list of tuple of float
+        Tuples (phi, theta, efficiency_Th, efficiency_PV)
+    """
+    results = []
+    for phi, theta in PTC_ANGLES:
+        experiment = otsun.Experiment(scene, ptc_light_source(scene, phi, theta), number_of_rays,
+                                      **experiment_options)
+        experiment.run(**(run_options or {}))
+        results.append((phi, theta) + efficiencies(experiment, PTC_APERTURE_TH))
+    return results
+
+
+def ptc_efficiencies_ok(results):
+    """
+    Checks the efficiencies of the total analysis of the parabolic trough
+    """
+    return 0.9 > results[0][2] > 0.6 and 0.7 > results[1][2] > 0.4 and results[0][3] == 0.0 and \
+        results[1][3] == 0.0
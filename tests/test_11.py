@@ -0,0 +1,26 @@
+"""
+Testing that experiments with a seed give the same results however they are run
+(with Buie Model as solar direction)
+"""
+
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = helpers.open_ptc()
+current_scene = otsun.Scene(doc.Objects)
+l_s = helpers.ptc_light_source(current_scene)
+results = []
+for workers in [1, 2]:
+    exp = otsun.Experiment(current_scene, l_s, 100, seed=12345)
+    exp.run(workers=workers)
+    results.append((exp.captured_energy_Th, exp.captured_energy_PV, exp.Th_energy))
+
+FreeCAD.closeDocument(doc.Name)
+
+print (results[0] == results[1])
+
+def test_11():
+    assert results[0] == results[1]
@@ -0,0 +1,64 @@
+"""
+Testing the angular sweep runner, with checkpoints (with ASTMG173-direct as solar spectrum)
+for the following materials:
+WavelengthVolumeMaterial
+OpaqueSimpleLayer
+PolarizedCoatingTransparentLayer
+PolarizedCoatingReflectorLayer
+AbsorberTWModelLayer
+TwoLayerMaterial
+"""
+
+import os
+import tempfile
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+FreeCAD.openDocument(helpers.PTC_PROJECT)
+doc = FreeCAD.ActiveDocument
+
+# ---
+# Materials
+# ---
+otsun.WavelengthVolumeMaterial("Glass1", 'BK7_Schott.txt')
+otsun.OpaqueSimpleLayer("Opa1")
+otsun.PolarizedCoatingTransparentLayer("file_AR1", 'AR-J.txt')
+otsun.TwoLayerMaterial("AR1", "file_AR1", "file_AR1")
+otsun.PolarizedCoatingReflectorLayer("Mir", 'Air_Ag_Air.txt', 4.4, 20, 0.9)
+otsun.TwoLayerMaterial("Mir1", "Mir", "Mir")
+otsun.AbsorberTWModelLayer("Abs1", 0.9427, 0.017, 1.8)
+
+current_scene = otsun.Scene(doc.Objects)
+angles = otsun.angle_grid(0.0 + 1.E-9, 0.0 + 1.E-4, 5.0, 0.0 + 1.E-9, 1.0 + 1.E-4, 1.0)
+light_spectrum = otsun.cdf_from_pdf_file(helpers.SPECTRUM_FILE)
+number_of_rays = 50
+checkpoint_file = os.path.join(tempfile.mkdtemp(), 'sweep.txt')
+
+
+def make_sweep(number_of_rays):
+    return otsun.AngularSweep(current_scene, angles, light_spectrum, number_of_rays, helpers.PTC_APERTURE_TH, 0.0,
+                              checkpoint_file=checkpoint_file)
+
+
+results = make_sweep(number_of_rays).run(workers=2)
+# a new sweep with the same checkpoint does not need to run anything
+results_resumed = make_sweep(number_of_rays).table()
+# a sweep with other settings does not accept the checkpoint
+try:
+    make_sweep(2 * number_of_rays)
+    checkpoint_rejected = False
+except ValueError:
+    checkpoint_rejected = True
+
+FreeCAD.closeDocument(doc.Name)
+
+print (results)
+print (0.9 > results[0][2] > 0.7 and 0.85 > results[1][2] > 0.5 and results[0][3] == 0.0 and results[1][3] == 0.0 and
+       (results == results_resumed).all() and checkpoint_rejected)
+
+def test_12():
+    assert 0.9 > results[0][2] > 0.7 and 0.85 > results[1][2] > 0.5 and results[0][3] == 0.0 and results[1][3] == 0.0 and \
+        (results == results_resumed).all() and checkpoint_rejected
@@ -0,0 +1,26 @@
+"""
+Testing that experiments with a seed give the same results whatever history the rays keep
+(with Buie Model as solar direction)
+"""
+
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = helpers.open_ptc()
+current_scene = otsun.Scene(doc.Objects)
+l_s = helpers.ptc_light_source(current_scene)
+results = []
+for trace in [otsun.TRACE_FULL, otsun.TRACE_LAST_HOP, otsun.TRACE_NONE]:
+    exp = otsun.Experiment(current_scene, l_s, 100, seed=12345, trace=trace)
+    exp.run()
+    results.append((exp.captured_energy_Th, exp.captured_energy_PV, exp.Th_energy))
+
+FreeCAD.closeDocument(doc.Name)
+
+print (results[0] == results[1] == results[2])
+
+def test_13():
+    assert results[0] == results[1] == results[2]
@@ -0,0 +1,32 @@
+"""
+Testing experiments that emit rays until the captured energy is estimated with a given error
+(with Buie Model as solar direction)
+"""
+
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = helpers.open_ptc()
+current_scene = otsun.Scene(doc.Objects)
+l_s = helpers.ptc_light_source(current_scene)
+number_of_rays = 2000
+target_error = 0.05
+exp = otsun.Experiment(current_scene, l_s, number_of_rays, seed=12345, target_error=target_error, block_size=100)
+exp.run()
+low, high = exp.confidence_interval('Th')
+error = exp.relative_standard_error('Th')
+results = (exp.number_of_rays, exp.captured_energy_Th, error, low, high)
+
+FreeCAD.closeDocument(doc.Name)
+
+print (results)
+
+def test_14():
+    assert exp.target_kinds == ('Th',)
+    assert exp.number_of_rays <= number_of_rays
+    assert exp.number_of_rays == len(exp.Th_energy)
+    assert error <= target_error or exp.number_of_rays == number_of_rays
+    assert low <= exp.captured_energy_Th <= high
@@ -0,0 +1,35 @@
+"""
+Testing that an interrupted experiment resumed from its checkpoint gives the same results
+(with Buie Model as solar direction)
+"""
+
+import os
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = helpers.open_ptc()
+current_scene = otsun.Scene(doc.Objects)
+l_s = helpers.ptc_light_source(current_scene)
+checkpoint_file = 'test_16_checkpoint.npz'
+results = []
+exp = otsun.Experiment(current_scene, l_s, 100, seed=12345)
+exp.run()
+results.append((exp.captured_energy_Th, exp.captured_energy_PV, exp.Th_energy))
+# run that stops after 40 rays
+exp = otsun.Experiment(current_scene, l_s, 100, seed=12345, block_size=20, checkpoint_file=checkpoint_file)
+exp.run_block(40)
+exp.save_checkpoint()
+exp = otsun.Experiment(current_scene, l_s, 100, seed=12345, block_size=20, checkpoint_file=checkpoint_file)
+exp.resume(checkpoint_file)
+results.append((exp.captured_energy_Th, exp.captured_energy_PV, exp.Th_energy))
+os.remove(checkpoint_file)
+
+FreeCAD.closeDocument(doc.Name)
+
+print (results[0] == results[1])
+
+def test_16():
+    assert results[0] == results[1]
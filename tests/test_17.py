@@ -0,0 +1,35 @@
+"""
+Testing the throughput counters of experiments, tracing rays one by one and in wavefronts
+(with Buie Model as solar direction)
+"""
+
+import numpy as np
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = helpers.open_ptc()
+current_scene = otsun.Scene(doc.Objects)
+l_s = helpers.ptc_light_source(current_scene)
+number_of_rays = 100
+results = []
+for wavefront_size in [None, 50]:
+    exp = otsun.Experiment(current_scene, l_s, number_of_rays, seed=12345)
+    exp.run(wavefront_size=wavefront_size)
+    stats = exp.stats
+    print (stats)
+    results.append(stats.rays == number_of_rays and
+                   stats.hop_histogram.sum() == stats.rays and
+                   (stats.hop_histogram * np.arange(len(stats.hop_histogram))).sum() == stats.hops and
+                   stats.max_hops_reached <= stats.rays and
+                   stats.rays_per_second > 0 and stats.hops_per_second > 0 and
+                   stats.time_intersection > 0)
+
+FreeCAD.closeDocument(doc.Name)
+
+print (all(results))
+
+def test_17():
+    assert all(results)
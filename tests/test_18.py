@@ -0,0 +1,89 @@
+"""
+Testing the movement of tracked mirrors that share their face (instanced intersectors)
+for the following materials:
+ReflectorSpecularLayer
+AbsorberSimpleLayer
+TwoLayerMaterial
+"""
+
+import otsun
+import FreeCAD
+from FreeCAD import Base
+import Part
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = FreeCAD.newDocument("Tracking")
+
+# ---
+# Materials
+# ---
+otsun.ReflectorSpecularLayer("Mir", 0.95)
+otsun.TwoLayerMaterial("Mir2", "Mir", "Mir")
+otsun.AbsorberSimpleLayer("Abs", 1.0)
+otsun.TwoLayerMaterial("Abs2", "Abs", "Abs")
+
+# ---
+# Scene: two horizontal mirrors (that share the same face) tracking an absorber placed above them
+# ---
+absorber = doc.addObject("Part::Feature", "Absorber")
+absorber.Shape = Part.makePlane(100, 100, Base.Vector(-50, -50, 1000))
+absorber.Label = "Absorber(Abs2)"
+target = doc.addObject("Part::Feature", "Target")
+target.Shape = Part.Vertex(Base.Vector(0, 0, 1000))
+target.Label = "Target"
+mirror_face = Part.makePlane(100, 100, Base.Vector(-50, -50, 0))
+for i, x in enumerate([-250.0, 250.0]):
+    mirror = doc.addObject("Part::Feature", "Mirror")
+    mirror.Shape = mirror_face
+    mirror.Placement = Base.Placement(Base.Vector(x, 0, 0), Base.Rotation())
+    mirror.Label = f"Mirror{i}(Mir2,Axis{i},Normal{i},Target)"
+    axis = doc.addObject("Part::Feature", "Axis")
+    axis.Shape = Part.makeLine(Base.Vector(x, -50, 0), Base.Vector(x, 50, 0))
+    axis.Label = f"Axis{i}"
+    normal = doc.addObject("Part::Feature", "Normal")
+    normal.Shape = Part.makeLine(Base.Vector(x, 0, 0), Base.Vector(x, 0, 1))
+    normal.Label = f"Normal{i}"
+doc.recompute()
+
+# ---
+# Inputs for Total Analysis
+# ---
+phi = 0.0 + 1.E-9
+theta = 30.0 + 1.E-9
+number_of_rays = 200
+aperture_collector_Th = 2 * 100.0 * 100.0
+light_spectrum = 550.0
+# --------- end
+
+sel = doc.Objects
+current_scene = otsun.Scene(sel)
+instanced = [intersector for intersector in current_scene.intersectors
+             if isinstance(intersector, otsun.InstancedIntersector)]
+main_direction = otsun.polar_to_cartesian(phi, theta) * -1.0
+
+
+def efficiency():
+    l_s = helpers.sun_light_source(current_scene, phi, theta, light_spectrum)
+    exp = otsun.Experiment(current_scene, l_s, number_of_rays, seed=12345)
+    exp.run()
+    return helpers.efficiencies(exp, aperture_collector_Th)[0]
+
+
+results = [efficiency()]
+tracking = otsun.MultiTracking(main_direction, current_scene)
+tracking.make_movements()
+results.append(efficiency())
+tracking.undo_movements()
+results.append(efficiency())
+
+FreeCAD.closeDocument(doc.Name)
+
+print (len(instanced), results)
+print (len(instanced) == 2 and results[1] > results[0] + 0.5 and abs(results[2] - results[0]) < 0.15)
+
+def test_18():
+    assert len(instanced) == 2
+    assert results[1] > results[0] + 0.5
+    assert abs(results[2] - results[0]) < 0.15
@@ -0,0 +1,62 @@
+"""
+Testing the detection of instances in a field of repeated facets
+for the following materials:
+ReflectorSpecularLayer
+AbsorberSimpleLayer
+TwoLayerMaterial
+"""
+
+import otsun
+import FreeCAD
+from FreeCAD import Base
+import Part
+import helpers
+helpers.setup_logging()
+
+doc = FreeCAD.newDocument("Facets")
+
+# ---
+# Materials
+# ---
+otsun.ReflectorSpecularLayer("Mir", 0.95)
+otsun.TwoLayerMaterial("Mir2", "Mir", "Mir")
+otsun.AbsorberSimpleLayer("Abs", 1.0)
+otsun.TwoLayerMaterial("Abs2", "Abs", "Abs")
+
+# ---
+# Scene: a field of 6 x 4 copies of the same facet, plus an absorber and a reversed facet
+# ---
+facet = Part.makePlane(10, 20, Base.Vector(-5, -10, 0))
+for i in range(6):
+    for j in range(4):
+        mirror = doc.addObject("Part::Feature", "Facet")
+        mirror.Shape = facet
+        mirror.Placement = Base.Placement(Base.Vector(30 * i, 40 * j, 0), Base.Rotation(Base.Vector(0, 1, 0), 5 * i))
+        mirror.Label = "Facet(Mir2)"
+reversed_facet = doc.addObject("Part::Feature", "Reversed")
+reversed_facet.Shape = facet.reversed()
+reversed_facet.Placement = Base.Placement(Base.Vector(-30, 0, 0), Base.Rotation())
+reversed_facet.Label = "Reversed(Mir2)"
+absorber = doc.addObject("Part::Feature", "Absorber")
+absorber.Shape = Part.makePlane(200, 200, Base.Vector(-20, -20, 100))
+absorber.Label = "Absorber(Abs2)"
+doc.recompute()
+
+sel = doc.Objects
+current_scene = otsun.Scene(sel)
+instanced = [intersector for intersector in current_scene.intersectors
+             if isinstance(intersector, otsun.InstancedIntersector)]
+prototypes = set(id(intersector.prototype) for intersector in instanced)
+plain = [intersector for intersector in current_scene.intersectors
+         if not isinstance(intersector, otsun.InstancedIntersector)]
+
+FreeCAD.closeDocument(doc.Name)
+
+print (len(current_scene.intersectors), len(instanced), len(prototypes), len(plain))
+print (len(current_scene.intersectors) == 26 and len(instanced) == 24 and len(prototypes) == 1 and len(plain) == 2)
+
+def test_19():
+    assert len(current_scene.intersectors) == 26
+    assert len(instanced) == 24
+    assert len(prototypes) == 1
+    assert len(plain) == 2
@@ -0,0 +1,76 @@
+"""
+Comparing the time of the serial and wavefront tracing modes in a field of facets
+for the following materials:
+ReflectorSpecularLayer
+AbsorberSimpleLayer
+TwoLayerMaterial
+"""
+
+import logging
+import time
+import otsun
+import FreeCAD
+from FreeCAD import Base
+import Part
+import helpers
+helpers.seed_random_generators()
+# debug messages would dominate the times
+helpers.setup_logging(logging.INFO)
+
+doc = FreeCAD.newDocument("Timing")
+
+# ---
+# Materials
+# ---
+otsun.ReflectorSpecularLayer("Mir", 0.95)
+otsun.TwoLayerMaterial("Mir2", "Mir", "Mir")
+otsun.AbsorberSimpleLayer("Abs", 0.9)
+otsun.TwoLayerMaterial("Abs2", "Abs", "Abs")
+
+# ---
+# Scene: a field of 8 x 8 facets under an absorber
+# ---
+facet = Part.makePlane(40, 40, Base.Vector(-20, -20, 0))
+for i in range(8):
+    for j in range(8):
+        mirror = doc.addObject("Part::Feature", "Facet")
+        mirror.Shape = facet
+        mirror.Placement = Base.Placement(Base.Vector(50 * i, 50 * j, 0), Base.Rotation(Base.Vector(0, 1, 0), 2 * i - 7))
+        mirror.Label = "Facet(Mir2)"
+absorber = doc.addObject("Part::Feature", "Absorber")
+absorber.Shape = Part.makePlane(200, 400, Base.Vector(75, -25, 300))
+absorber.Label = "Absorber(Abs2)"
+doc.recompute()
+
+# ---
+# Inputs for Total Analysis
+# ---
+phi = 0.0 + 1.E-9
+theta = 0.0 + 1.E-9
+number_of_rays = 2000
+aperture_collector_Th = 8 * 8 * 40.0 * 40.0
+light_spectrum = 550.0
+# --------- end
+
+sel = doc.Objects
+current_scene = otsun.Scene(sel)
+l_s = helpers.sun_light_source(current_scene, phi, theta, light_spectrum)
+
+efficiencies = []
+times = []
+for wavefront_size in [None, 500]:
+    exp = otsun.Experiment(current_scene, l_s, number_of_rays, seed=12345)
+    start = time.perf_counter()
+    exp.run(wavefront_size=wavefront_size)
+    times.append(time.perf_counter() - start)
+    efficiencies.append(helpers.efficiencies(exp, aperture_collector_Th)[0])
+
+FreeCAD.closeDocument(doc.Name)
+
+print ("serial: %.3f s, wavefront: %.3f s, speedup: %.2f" % (times[0], times[1], times[0] / times[1]))
+print (efficiencies)
+print (abs(efficiencies[0] - efficiencies[1]) < 0.02 and times[1] < times[0])
+
+def test_20():
+    assert abs(efficiencies[0] - efficiencies[1]) < 0.02
+    assert times[1] < times[0]
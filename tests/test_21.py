@@ -0,0 +1,78 @@
+"""
+Testing the accelerators (BVH and UniformGrid) against a linear scan of all the boxes
+"""
+
+import numpy as np
+np.random.seed(1)
+from otsun.accelerators import BVH, UniformGrid, ray_box_entry
+
+# random boxes, each containing a ball that is the "face" that rays may hit
+centers = np.random.uniform(0.0, 10.0, size=(200, 3))
+half_sides = np.random.uniform(0.05, 0.5, size=(200, 3))
+bounds = np.hstack([centers - half_sides, centers + half_sides])
+radii = half_sides.min(axis=1)
+indices = list(range(1000, 1200))
+
+origins = np.random.uniform(-2.0, 12.0, size=(300, 3))
+directions = np.random.normal(size=(300, 3))
+directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+# some rays parallel to the axes
+directions[:30] = np.eye(3)[np.arange(30) % 3]
+max_distance = 8.0
+
+
+def ball_distance(position, origin, direction, limit):
+    """Distance from the origin of a ray to the ball of a box (np.inf if missed or beyond limit)"""
+    relative = origin - centers[position]
+    b = relative.dot(direction)
+    c = relative.dot(relative) - radii[position] ** 2
+    discriminant = b * b - c
+    if discriminant < 0:
+        return np.inf
+    for t in (-b - np.sqrt(discriminant), -b + np.sqrt(discriminant)):
+        if 0 < t <= limit:
+            return t
+    return np.inf
+
+
+def linear_scan(origin, direction):
+    """Identifiers of the boxes entered by a ray, and distance and identifier of the nearest ball"""
+    entered = set()
+    best = (np.inf, None)
+    for position in range(len(bounds)):
+        if ray_box_entry(tuple(bounds[position]), tuple(origin), tuple(direction), max_distance) is None:
+            continue
+        entered.add(indices[position])
+        distance = ball_distance(position, origin, direction, max_distance)
+        if distance < best[0]:
+            best = (distance, indices[position])
+    return entered, best
+
+
+expected = [linear_scan(origin, direction) for (origin, direction) in zip(origins, directions)]
+
+results = {}
+for accelerator in (BVH(bounds, indices=indices), UniformGrid(bounds, indices=indices)):
+    def hit(identifier, limit):
+        return ball_distance(identifier - 1000, origin, direction, limit)
+    candidates_ok = True
+    closest_ok = True
+    for i, (origin, direction) in enumerate(zip(origins, directions)):
+        found = list(accelerator.candidates(tuple(origin), tuple(direction), max_distance))
+        candidates_ok = candidates_ok and len(found) == len(set(found)) and set(found) == expected[i][0]
+        distance, identifier = accelerator.closest(tuple(origin), tuple(direction), max_distance, hit)
+        closest_ok = closest_ok and identifier == expected[i][1][1] and \
+            (identifier is None or abs(distance - expected[i][1][0]) < 1E-12)
+    rays, items = accelerator.candidate_pairs(origins, directions, max_distance)
+    pairs = set(zip(rays.tolist(), items.tolist()))
+    pairs_ok = len(pairs) == len(rays) and \
+        pairs == {(i, item) for i in range(len(origins)) for item in expected[i][0]}
+    results[type(accelerator).__name__] = (candidates_ok, closest_ok, pairs_ok)
+
+# the rays do hit some balls, so that the comparison is meaningful
+some_hits = sum(best[1] is not None for (_, best) in expected) > 10
+print(results, some_hits)
+
+
+def test_21():
+    assert some_hits and all(all(checks) for checks in results.values())
@@ -0,0 +1,80 @@
+"""
+Testing the numerical building blocks of the intersectors:
+moller_trumbore, points_in_polygon and quadratic_roots
+"""
+
+import numpy as np
+np.random.seed(1)
+from otsun.intersectors import moller_trumbore, points_in_polygon, quadratic_roots
+
+# ---
+# Moller-Trumbore, against solving the linear system of each ray and triangle
+# ---
+v0 = np.random.uniform(-1.0, 1.0, size=(20, 3))
+e1 = np.random.uniform(-1.0, 1.0, size=(20, 3))
+e2 = np.random.uniform(-1.0, 1.0, size=(20, 3))
+origins = np.random.uniform(-2.0, 2.0, size=(200, 3))
+targets = v0[np.random.randint(20, size=200)] + np.random.uniform(0.0, 0.5, size=(200, 1)) * e1[:1]
+directions = targets - origins
+directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+min_distance = 0.1
+max_distance = 2.5
+
+
+def solved_distance(origin, direction):
+    best = np.inf
+    for a, b, c in zip(v0, e1, e2):
+        # origin + t direction = a + u b + v c
+        t, u, v = np.linalg.solve(np.column_stack([direction, -b, -c]), a - origin)
+        if u >= 0 and v >= 0 and u + v <= 1 and min_distance < t <= max_distance:
+            best = min(best, t)
+    return best
+
+
+distances = moller_trumbore(origins, directions, v0, e1, e2, min_distance, max_distance)
+expected = np.array([solved_distance(o, d) for (o, d) in zip(origins, directions)])
+moller_trumbore_ok = np.allclose(distances, expected, rtol=0, atol=1E-9) and np.isfinite(expected).sum() > 20
+
+# a ray parallel to a triangle and a ray that starts on it do not hit it
+triangle = (np.zeros((1, 3)), np.array([[1.0, 0, 0]]), np.array([[0, 1.0, 0]]))
+edge_cases = moller_trumbore(np.array([[0.1, 0.1, 1.0], [0.1, 0.1, 0.0]]),
+                             np.array([[1.0, 0, 0], [0, 0, 1.0]]), *triangle, 0.0, 10.0)
+moller_trumbore_ok = moller_trumbore_ok and np.isinf(edge_cases).all()
+
+
+# ---
+# Polygon with a hole: the square [0, 4]^2 minus the square [1, 3]^2
+# ---
+def loop(corners):
+    corners = np.array(corners, dtype=float)
+    return np.hstack([corners, np.roll(corners, -1, axis=0)])
+
+
+edges = np.vstack([loop([(0, 0), (4, 0), (4, 4), (0, 4)]), loop([(1, 1), (1, 3), (3, 3), (3, 1)])])
+points = np.random.uniform(-1.0, 5.0, size=(500, 2))
+in_square = np.all((points > 0) & (points < 4), axis=1)
+in_hole = np.all((points > 1) & (points < 3), axis=1)
+points_in_polygon_ok = (points_in_polygon(points, edges) == (in_square & ~in_hole)).all()
+# points aligned with horizontal edges and vertices
+special = np.array([(2.0, 1.0 - 1E-9), (2.0, 2.0), (0.5, 3.0 + 1E-9), (4.5, 1.0), (3.5, 1.0)])
+points_in_polygon_ok = points_in_polygon_ok and \
+    points_in_polygon(special, edges).tolist() == [True, False, True, False, True]
+
+# ---
+# Quadratic roots: two roots, tangent, none, linear and degenerate equations
+# ---
+a = np.array([1.0, -1.0, 1.0, 1.0, 0.0, 0.0, 0.0, 1E-300])
+b = np.array([-3.0, 0.0, -2.0, 0.0, 2.0, 0.0, 0.0, 1.0])
+c = np.array([2.0, 4.0, 1.0, 1.0, -4.0, 1.0, 0.0, -1.0])
+smallest, largest = quadratic_roots(a, b, c)
+# (the last equation is almost linear, and its small root must not be lost to cancellation)
+expected_smallest = np.array([1.0, -2.0, 1.0, np.nan, 2.0, np.nan, np.nan, -1E300])
+expected_largest = np.array([2.0, 2.0, 1.0, np.nan, np.nan, np.nan, np.nan, 1.0])
+quadratic_roots_ok = np.allclose(smallest, expected_smallest, equal_nan=True) and \
+    np.allclose(largest, expected_largest, equal_nan=True)
+
+print(moller_trumbore_ok, points_in_polygon_ok, quadratic_roots_ok)
+
+
+def test_22():
+    assert moller_trumbore_ok and points_in_polygon_ok and quadratic_roots_ok
@@ -0,0 +1,102 @@
+"""
+Testing Scene.intersect against intersecting each ray with every face,
+for a scene of balls given by numpy intersectors
+"""
+
+import numpy as np
+np.random.seed(1)
+import otsun
+from otsun.intersectors import FaceIntersector
+
+
+class BallIntersector(FaceIntersector):
+    """Intersector of a ball, that needs no FreeCAD face"""
+
+    def __init__(self, center, radius):
+        super(BallIntersector, self).__init__(None)
+        self.center = center
+        self.radius = radius
+
+    def roots(self, origins, directions):
+        relative = origins - self.center
+        b = np.sum(relative * directions, axis=1)
+        c = np.sum(relative * relative, axis=1) - self.radius ** 2
+        with np.errstate(invalid='ignore'):
+            root = np.sqrt(b * b - c)
+        return np.column_stack([-b - root, -b + root])
+
+    def intersect(self, origins, directions, max_distance, min_distance=0.0):
+        roots = self.roots(origins, directions)
+        with np.errstate(invalid='ignore'):
+            roots = np.where((roots > min_distance) & (roots <= max_distance), roots, np.inf)
+        return roots.min(axis=1)
+
+    def normals_at(self, points):
+        return (points - self.center) / self.radius
+
+
+centers = np.random.uniform(0.0, 10.0, size=(60, 3))
+radii = np.random.uniform(0.2, 0.8, size=60)
+bounds = np.hstack([centers - radii[:, np.newaxis], centers + radii[:, np.newaxis]])
+has_material = np.random.uniform(size=60) < 0.7
+
+number_of_rays = 400
+origins = np.random.uniform(-1.0, 11.0, size=(number_of_rays, 3))
+directions = np.random.normal(size=(number_of_rays, 3))
+directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+# half of the rays leave the surface of a ball, inwards or outwards
+last_faces = np.full(number_of_rays, -1)
+leaving = np.arange(0, number_of_rays, 2)
+last_faces[leaving] = np.random.randint(60, size=len(leaving))
+outwards = np.random.normal(size=(len(leaving), 3))
+outwards /= np.linalg.norm(outwards, axis=1)[:, np.newaxis]
+origins[leaving] = centers[last_faces[leaving]] + outwards * radii[last_faces[leaving], np.newaxis]
+max_distance = 12.0
+
+
+def brute_force(scene):
+    """Nearest hit of each ray, intersecting it with every face"""
+    weighted = np.full((number_of_rays, 60), np.inf)
+    distances = np.full((number_of_rays, 60), np.inf)
+    for index, intersector in enumerate(scene.intersectors):
+        roots = intersector.roots(origins, directions)
+        # the point where a ray leaves a ball is not a hit
+        roots[last_faces == index] = np.where(roots[last_faces == index] > 1E-9,
+                                              roots[last_faces == index], np.nan)
+        with np.errstate(invalid='ignore'):
+            roots = np.where((roots > 0.0) & (roots <= max_distance), roots, np.inf)
+        distances[:, index] = roots.min(axis=1)
+        weighted[:, index] = distances[:, index] + (0.0 if has_material[index] else scene.epsilon)
+    faces = np.argmin(weighted, axis=1)
+    nearest = distances[np.arange(number_of_rays), faces]
+    return nearest, np.where(np.isfinite(nearest), faces, -1)
+
+
+results = {}
+for kind in ('bvh', 'grid'):
+    scene = object.__new__(otsun.Scene)
+    scene.epsilon = otsun.scene.EPSILON
+    scene.accelerator_kind = kind
+    scene.intersectors = [BallIntersector(center, radius) for (center, radius) in zip(centers, radii)]
+    scene.face_has_material = has_material.tolist()
+    scene.build_accelerator(bounds)
+    distances, points, face_indices, normals = scene.intersect(origins, directions, max_distance,
+                                                               last_faces=last_faces)
+    expected_distances, expected_faces = brute_force(scene)
+    hits = face_indices >= 0
+    # rays hitting again the ball they leave are traced from an origin moved slightly off it
+    tolerances = np.where(face_indices == last_faces, 1E-3, 1E-9)[hits]
+    expected_points = origins[hits] + directions[hits] * expected_distances[hits, np.newaxis]
+    results[kind] = ((face_indices == expected_faces).all() and
+                     np.isinf(distances[~hits]).all() and np.isnan(points[~hits]).all() and
+                     (np.abs(distances[hits] - expected_distances[hits]) <= tolerances).all() and
+                     (np.abs(points[hits] - expected_points).max(axis=1) <= tolerances).all() and
+                     np.allclose(normals[hits], (points[hits] - centers[face_indices[hits]]) /
+                                 radii[face_indices[hits], np.newaxis]))
+
+some_hits = (brute_force(scene)[1] >= 0).sum() > 50
+print(results, some_hits)
+
+
+def test_23():
+    assert some_hits and all(results.values())
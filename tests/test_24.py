@@ -0,0 +1,77 @@
+"""
+Testing the analytic intersectors of planar and quadric faces
+against sectioning the BRep of the faces with the rays
+"""
+
+import otsun
+import FreeCAD
+from FreeCAD import Base
+import Part
+import numpy as np
+np.random.seed(1)
+from otsun.intersectors import (make_face_intersector, SectionIntersector, PlanarIntersector,
+                                CylindricalIntersector, SphericalIntersector, ParabolicIntersector)
+
+parabola = Part.Parabola()
+parabola.Focal = 1.0
+faces = {
+    'square': (Part.makePlane(4, 4), PlanarIntersector),
+    # a planar face with a hole with a curved boundary
+    'holed square': (Part.makePlane(4, 4).cut(Part.makeCylinder(1, 2, Base.Vector(2, 2, -1))).Faces[0],
+                     PlanarIntersector),
+    'cylinder': ([face for face in Part.makeCylinder(1, 2).Faces if isinstance(face.Surface, Part.Cylinder)][0],
+                 CylindricalIntersector),
+    'sphere': (Part.makeSphere(1).Faces[0], SphericalIntersector),
+    'hemisphere': (Part.makeSphere(1, Base.Vector(), Base.Vector(0, 0, 1), 0, 90).Faces[0],
+                   SphericalIntersector),
+    'parabolic trough': (parabola.toShape(-2, 2).extrude(Base.Vector(0, 0, 3)), ParabolicIntersector),
+}
+
+max_distance = 20.0
+results = {}
+for name, (face, intersector_class) in faces.items():
+    intersector = make_face_intersector(face)
+    box = face.BoundBox
+    low = np.array([box.XMin, box.YMin, box.ZMin])
+    high = np.array([box.XMax, box.YMax, box.ZMax])
+    origins = np.random.uniform(low - 2.0, high + 2.0, size=(100, 3))
+    targets = np.random.uniform(low, high, size=(100, 3))
+    directions = targets - origins
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    distances = intersector.intersect(origins, directions, max_distance)
+    expected = SectionIntersector(face).intersect(origins, directions, max_distance)
+    hits = np.isfinite(expected)
+    points = origins[hits] + directions[hits] * distances[hits, np.newaxis]
+    expected_normals = []
+    for point in points:
+        u, v = face.Surface.parameter(Base.Vector(*point))
+        normal = face.normalAt(u, v)
+        expected_normals.append((normal.x, normal.y, normal.z))
+    results[name] = (isinstance(intersector, intersector_class) and hits.sum() > 10 and
+                     (np.isfinite(distances) == hits).all() and
+                     np.allclose(distances[hits], expected[hits], rtol=0, atol=1E-6) and
+                     np.allclose(intersector.normals_at(points), expected_normals, atol=1E-6))
+
+# rays leaving the sphere inwards hit it at the other end of a chord, and outwards do not hit it
+sphere_intersector = make_face_intersector(faces['sphere'][0])
+starts = np.random.normal(size=(50, 3))
+starts /= np.linalg.norm(starts, axis=1)[:, np.newaxis]
+directions = np.random.normal(size=(50, 3))
+directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+cosines = np.sum(starts * directions, axis=1)
+distances = sphere_intersector.intersect(starts, directions, max_distance)
+inwards = cosines < 0
+results['sphere chords'] = (np.allclose(distances[inwards], -2.0 * cosines[inwards]) and
+                            np.isinf(distances[~inwards]).all())
+# hits nearer than min_distance are discarded
+square_intersector = make_face_intersector(faces['square'][0])
+above = np.array([[1.0, 1.0, 0.5], [1.0, 1.0, 2.0]])
+down = np.array([[0.0, 0.0, -1.0], [0.0, 0.0, -1.0]])
+results['min distance'] = square_intersector.intersect(above, down, max_distance, min_distance=1.0).tolist() == \
+    [np.inf, 2.0]
+
+print(results)
+
+
+def test_24():
+    assert all(results.values())
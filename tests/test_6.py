@@ -0,0 +1,21 @@
+"""
+Testing the 'mesh' intersection engine (with Buie Model as solar direction)
+"""
+
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = helpers.open_ptc()
+current_scene = otsun.Scene(doc.Objects, engine='mesh', mesh_tolerance=0.01, exact_hits=True)
+results = helpers.ptc_total_analysis(current_scene)
+
+FreeCAD.closeDocument(doc.Name)
+
+print (results)
+print (helpers.ptc_efficiencies_ok(results))
+
+def test_6():
+    assert helpers.ptc_efficiencies_ok(results)
@@ -0,0 +1,21 @@
+"""
+Testing the wavefront mode of Experiment (with Buie Model as solar direction)
+"""
+
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = helpers.open_ptc()
+current_scene = otsun.Scene(doc.Objects)
+results = helpers.ptc_total_analysis(current_scene, run_options={'wavefront_size': 50})
+
+FreeCAD.closeDocument(doc.Name)
+
+print (results)
+print (helpers.ptc_efficiencies_ok(results))
+
+def test_7():
+    assert helpers.ptc_efficiencies_ok(results)
@@ -0,0 +1,32 @@
+"""
+Testing the compiled scene cache (with Buie Model as solar direction)
+"""
+
+import os
+import tempfile
+import otsun
+import FreeCAD
+import helpers
+helpers.seed_random_generators()
+helpers.setup_logging()
+
+doc = helpers.open_ptc()
+cache_file = os.path.join(tempfile.mkdtemp(), 'test_PTC.npz')
+otsun.Scene(doc.Objects, engine='mesh', cache_file=cache_file)
+current_scene = otsun.Scene(doc.Objects, engine='mesh', cache_file=cache_file)
+assert 'cache' in current_scene.load_times
+# a truncated cache file is rebuilt instead of failing
+with open(cache_file, 'r+b') as f:
+    f.truncate(100)
+rebuilt_scene = otsun.Scene(doc.Objects, engine='mesh', cache_file=cache_file)
+assert 'cache' not in rebuilt_scene.load_times
+assert 'cache' in otsun.Scene(doc.Objects, engine='mesh', cache_file=cache_file).load_times
+results = helpers.ptc_total_analysis(current_scene)
+
+FreeCAD.closeDocument(doc.Name)
+
+print (results)
+print (helpers.ptc_efficiencies_ok(results))
+
+def test_9():
+    assert helpers.ptc_efficiencies_ok(results)